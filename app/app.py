@@ -1,8 +1,5 @@
 import streamlit as st
 import requests
-from PIL import Image
-import io
-import base64
 
 API_URL = "http://localhost:8000"
 
@@ -191,13 +188,15 @@ elif page == "Event Management" and st.session_state.token:
                 files = response.json().get("files", [])
                 if files:
                     st.success(f"Found {len(files)} files for Event ID: {view_event_id}")
+                    if response.json().get("next_cursor"):
+                        st.caption("Showing the first page of files.")
                     col_count = 3  # Number of columns for the gallery layout
                     cols = st.columns(col_count)
                     for i, file in enumerate(files):
-                        file_url = f"{API_URL}/files/{file['filename']}"
+                        file_url = f"{API_URL}{file['download_url']}"
                         col_idx = i % col_count
                         with cols[col_idx]:
-                            st.image(file_url, caption=f"Image #{i+1}: {file['filename']}", use_column_width=True)
+                            st.image(f"{API_URL}{file['thumb_url']}", caption=f"Image #{i+1}: {file['filename']}", use_column_width=True)
 
                             st.markdown(
                                 f"[📥 Download {file['filename']}]({file_url})",
@@ -247,28 +246,21 @@ elif page == "Face Recognition" and st.session_state.token:
 
                 if match_response.status_code == 200:
                     matched_data = match_response.json()
-                    matched_images = matched_data.get("matched_images", [])
+                    matches = matched_data.get("matches", [])
 
                     st.image(face_file, caption="Uploaded Face", width=300)
 
-                    if matched_images:
+                    if matches:
                         st.subheader("🎯 Matched Images:")
-                        for i, item in enumerate(matched_images):
-                            img_bytes = base64.b64decode(item["image_base64"])
-                            matched_img = Image.open(io.BytesIO(img_bytes))
+                        for i, item in enumerate(matches):
+                            st.image(f"{API_URL}{item['preview_url']}", caption=f"Match #{i+1} (Similarity: {item['similarity']:.2f})", use_column_width=True)
 
-                            st.image(matched_img, caption=f"Match #{i+1} (Similarity: {item['similarity']:.2f})", use_column_width=True)
-
-                            img_buffer = io.BytesIO()
-                            matched_img.save(img_buffer, format="JPEG")
-                            img_buffer.seek(0)
-
-                            st.download_button(
-                                label=f"📥 Download Match #{i+1}",
-                                data=img_buffer,
-                                file_name=f"match_{i+1}.jpg",
-                                mime="image/jpeg"
+                            st.markdown(
+                                f"[📥 Download Match #{i+1}]({API_URL}{item['download_url']})",
+                                unsafe_allow_html=True
                             )
+                        if matched_data.get("next_cursor"):
+                            st.info("Showing the best matches only.")
                     else:
                         st.info("No matching faces found.")
                 else:
@@ -288,9 +280,11 @@ elif page == "Public Viewer":
             files = response.json().get("files", [])
             if files:
                 st.success(f"📸 Found {len(files)} files for Event ID: {public_event_id}")
+                if response.json().get("next_cursor"):
+                    st.caption("Showing the first page of files.")
                 for i, file in enumerate(files):
-                    file_url = f"{API_URL}/files/{file['filename']}"
-                    st.image(file_url, caption=f"Image #{i+1}: {file['filename']}", use_column_width=True)
+                    file_url = f"{API_URL}{file['download_url']}"
+                    st.image(f"{API_URL}{file['preview_url']}", caption=f"Image #{i+1}: {file['filename']}", use_column_width=True)
 
                     st.markdown(
                         f"[📥 Download {file['filename']}]({file_url})",
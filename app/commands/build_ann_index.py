@@ -0,0 +1,34 @@
+# app/commands/build_ann_index.py
+#
+# Retrains the cross-event IVF index from every stored file embedding and writes a
+# fresh snapshot to ANN_INDEX_PATH (atomically). Running API processes notice the
+# newer snapshot on their next cross-event search and reload it.
+#
+#   python -m app.commands.build_ann_index --nlist 1024 --sample 50000
+
+import argparse
+import time
+
+from app.config import Config
+from app.services import ann_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and save the cross-event face ANN index")
+    parser.add_argument("--nlist", type=int, default=None, help="inverted lists (default: ANN_NLIST or 4*sqrt(n))")
+    parser.add_argument("--sample", type=int, default=None, help="training sample size (default: ANN_TRAIN_SAMPLE)")
+    parser.add_argument("--path", default=Config.ANN_INDEX_PATH)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = ann_service.build_index(args.nlist, args.sample)
+    if index is None:
+        print("[Build ANN Index] no embeddings found, nothing written")
+        return
+    index.save(args.path)
+    print(f"[Build ANN Index] {len(index)} vectors in {index.nlist} lists -> {args.path} "
+          f"({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
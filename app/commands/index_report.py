@@ -0,0 +1,35 @@
+# app/commands/index_report.py
+#
+# Compares the indexes in MongoDB with the declared registry (app.db.INDEXES):
+# declared but missing, present but undeclared, and present but never used since
+# the server started ($indexStats). --ensure creates missing ones first.
+#
+#   python -m app.commands.index_report
+#   python -m app.commands.index_report --ensure
+
+import argparse
+
+from app.db import ensure_indexes, index_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report missing, undeclared and unused MongoDB indexes")
+    parser.add_argument("--ensure", action="store_true", help="create declared indexes before reporting")
+    args = parser.parse_args()
+
+    if args.ensure:
+        result = ensure_indexes()
+        print(f"[Index Report] ensured {len(result['ensured'])}, failed {len(result['failed'])} {result['failed'] or ''}")
+
+    problems = 0
+    for collection, entry in index_report().items():
+        for kind in ("missing", "undeclared", "unused"):
+            if entry[kind]:
+                problems += len(entry[kind])
+                print(f"[Index Report] {collection}: {kind} {', '.join(entry[kind])}")
+    if not problems:
+        print("[Index Report] all declared indexes present and in use")
+
+
+if __name__ == "__main__":
+    main()
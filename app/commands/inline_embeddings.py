@@ -0,0 +1,91 @@
+# app/commands/inline_embeddings.py
+#
+# Backfill for EMBEDDING_STORAGE_MODE=inline: copies the embeddings document linked
+# from each file and face into the document's `face_vectors` field, so readers get
+# the vectors with the document itself. The embeddings documents and embeddings_id
+# links are left in place, so switching back to collection mode needs no migration.
+# Idempotent: documents that already carry inline vectors are skipped.
+#
+#   python -m app.commands.inline_embeddings --batch-size 500
+#   python -m app.commands.inline_embeddings --collections files --dry-run
+
+import argparse
+from pymongo import UpdateOne
+
+from app.db import db
+from app.services import embedding_store
+
+# Fields copied as stored from packed embeddings documents
+PACKED_FIELDS = ("embeddings_vector", "dim", "count", "dtype", "scales")
+
+
+def backfill(collection_name: str, batch_size: int = 500, dry_run: bool = False) -> dict:
+    collection = db[collection_name]
+    stats = {"scanned": 0, "inlined": 0, "missing": 0}
+    cursor = collection.find(
+        {"embeddings_id": {"$ne": None}, embedding_store.INLINE_FIELD: {"$exists": False}},
+        {"embeddings_id": 1}
+    ).batch_size(batch_size)
+
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _inline(collection, batch, stats, dry_run)
+            batch = []
+    _inline(collection, batch, stats, dry_run)
+    return stats
+
+
+def inline_fields(embedding_doc: dict) -> dict:
+    """The `face_vectors` sub-document for an embeddings document, keeping its _id and packing."""
+    if isinstance(embedding_doc.get("embeddings_vector"), bytes):
+        fields = {key: embedding_doc[key] for key in PACKED_FIELDS if key in embedding_doc}
+        return {"_id": embedding_doc["_id"], **fields}
+    return embedding_store.pack_inline(embedding_store.unpack(embedding_doc), embedding_id=embedding_doc["_id"])
+
+
+def _inline(collection, docs: list, stats: dict, dry_run: bool):
+    if not docs:
+        return
+    stats["scanned"] += len(docs)
+    embedding_ids = list({doc["embeddings_id"] for doc in docs})
+    embedding_docs = {
+        embedding_doc["_id"]: embedding_doc
+        for embedding_doc in db.embeddings.find({"_id": {"$in": embedding_ids}}, {key: 1 for key in PACKED_FIELDS})
+    }
+
+    operations = []
+    for doc in docs:
+        embedding_doc = embedding_docs.get(doc["embeddings_id"])
+        if embedding_doc is None:
+            stats["missing"] += 1
+            continue
+        operations.append(UpdateOne(
+            {"_id": doc["_id"], embedding_store.INLINE_FIELD: {"$exists": False}},
+            {"$set": {embedding_store.INLINE_FIELD: inline_fields(embedding_doc)}}
+        ))
+    if not operations:
+        return
+    if dry_run:
+        stats["inlined"] += len(operations)
+    else:
+        stats["inlined"] += collection.bulk_write(operations, ordered=False).modified_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy linked embeddings into file and face documents")
+    parser.add_argument("--collections", nargs="+", choices=["files", "faces"], default=["files", "faces"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    action = "would inline" if args.dry_run else "inlined"
+    for name in args.collections:
+        stats = backfill(name, args.batch_size, args.dry_run)
+        print(f"[Inline Embeddings] {name}: scanned {stats['scanned']}, {action} {stats['inlined']}, "
+              f"missing embeddings documents {stats['missing']}")
+
+
+if __name__ == "__main__":
+    main()
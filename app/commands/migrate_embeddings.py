@@ -0,0 +1,62 @@
+# app/commands/migrate_embeddings.py
+#
+# Rewrites embeddings documents that still hold BSON arrays of doubles into the
+# packed Binary format of embedding_store. Idempotent: packed documents are skipped,
+# so it can be re-run or interrupted safely.
+#
+#   python -m app.commands.migrate_embeddings --dtype float32 --batch-size 500
+#   python -m app.commands.migrate_embeddings --dry-run
+
+import argparse
+from pymongo import UpdateOne
+
+from app.db import db
+from app.config import Config
+from app.services import embedding_store
+
+
+def migrate(dtype: str = None, batch_size: int = 500, dry_run: bool = False) -> dict:
+    dtype = dtype or Config.EMBEDDING_STORAGE_DTYPE
+    stats = {"scanned": 0, "migrated": 0, "bytes_before": 0, "bytes_after": 0}
+    cursor = db.embeddings.find({"embeddings_vector": {"$type": "array"}}, {"embeddings_vector": 1})
+    cursor = cursor.batch_size(batch_size)
+
+    operations = []
+    for doc in cursor:
+        stats["scanned"] += 1
+        matrix = embedding_store.unpack(doc)
+        fields = embedding_store.pack(matrix, dtype)
+        # 8 bytes per double plus ~4 bytes of array key/type overhead per element
+        stats["bytes_before"] += matrix.size * 12
+        stats["bytes_after"] += len(fields["embeddings_vector"]) + len(fields.get("scales", b""))
+        operations.append(UpdateOne({"_id": doc["_id"], "embeddings_vector": {"$type": "array"}}, {"$set": fields}))
+        if len(operations) >= batch_size:
+            stats["migrated"] += _flush(operations, dry_run)
+            operations = []
+    stats["migrated"] += _flush(operations, dry_run)
+    return stats
+
+
+def _flush(operations: list, dry_run: bool) -> int:
+    if not operations:
+        return 0
+    if dry_run:
+        return len(operations)
+    return db.embeddings.bulk_write(operations, ordered=False).modified_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack legacy embedding arrays into Binary fields")
+    parser.add_argument("--dtype", choices=sorted(embedding_store.DTYPES), default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    stats = migrate(args.dtype, args.batch_size, args.dry_run)
+    action = "would migrate" if args.dry_run else "migrated"
+    print(f"[Migrate Embeddings] scanned {stats['scanned']}, {action} {stats['migrated']}, "
+          f"~{stats['bytes_before'] / 1024 / 1024:.1f} MB -> {stats['bytes_after'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
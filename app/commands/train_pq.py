@@ -0,0 +1,62 @@
+# app/commands/train_pq.py
+#
+# Trains the product-quantisation codebook for this deployment from a random sample
+# of stored file embeddings and writes it next to the model weights (or to
+# PQ_CODEBOOK_PATH). Set FACE_INDEX_CODEC=pq to have event indexes use it; indexes
+# built before the codebook existed keep float32 rows until they are rebuilt.
+#
+#   python -m app.commands.train_pq --sample 100000 --subvectors 64
+
+import argparse
+import time
+import numpy as np
+
+from app.db import db
+from app.config import Config
+from app.services import embedding_store, pq_codec
+from app.services.index_service import normalize_vectors
+
+
+def sample_vectors(size: int) -> np.ndarray:
+    if Config.EMBEDDING_STORAGE_MODE == "inline":
+        field = embedding_store.INLINE_FIELD
+        pipeline = [{"$match": {field: {"$exists": True}}}, {"$sample": {"size": size}}, {"$project": {field: 1}}]
+        matrices = [embedding_store.unpack(doc[field]) for doc in db.files.aggregate(pipeline)]
+    else:
+        pipeline = [
+            {"$match": {"file_id": {"$exists": True}}},
+            {"$sample": {"size": size}},
+            {"$project": embedding_store.PROJECTION}
+        ]
+        matrices = [embedding_store.unpack(doc) for doc in db.embeddings.aggregate(pipeline)]
+    matrices = [matrix for matrix in matrices if len(matrix)]
+    return normalize_vectors(np.concatenate(matrices)) if matrices else np.empty((0, 0), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the face index product-quantisation codebook")
+    parser.add_argument("--sample", type=int, default=100000, help="embedded files to sample")
+    parser.add_argument("--subvectors", type=int, default=Config.PQ_SUBVECTORS)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--path", default=None)
+    args = parser.parse_args()
+
+    vectors = sample_vectors(args.sample)
+    if len(vectors) < pq_codec.CENTROIDS_PER_SUBSPACE:
+        print(f"[Train PQ] only {len(vectors)} face vectors stored, need {pq_codec.CENTROIDS_PER_SUBSPACE}")
+        return
+
+    started = time.perf_counter()
+    quantizer = pq_codec.ProductQuantizer.train(vectors, args.subvectors, args.iterations)
+    path = args.path or pq_codec.codebook_path()
+    quantizer.save(path)
+
+    decoded = quantizer.decode(quantizer.encode(vectors))
+    fidelity = float((decoded * vectors).sum(axis=1).mean())
+    print(f"[Train PQ] {len(vectors)} vectors, {quantizer.m} bytes/face "
+          f"(float32: {quantizer.dim * 4}), mean cosine to original {fidelity:.4f}, "
+          f"{time.perf_counter() - started:.1f}s -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,9 @@ class Config:
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB = int(os.getenv("REDIS_DB", 0))
+    REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", 1.0))  # seconds, cache client
+    EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # float32 or float16
+    EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 3600))  # seconds
 
     # Local File Storage
     LOCAL_STORAGE_PATH = os.getenv("LOCAL_STORAGE_PATH", "D:/photobooth/app/storage")
@@ -20,12 +23,90 @@ class Config:
     # Face Recognition Model
     MODEL_PATH = os.getenv("MODEL_PATH", "D:/photobooth/app/models/20180402-114759-vggface2.pt")
 
+    # Load detector/embedder at startup instead of on the first request
+    WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "true").lower() == "true"
+
+    # Face detection: MTCNN runs on a copy whose longest side is at most DETECTION_MAX_SIDE px
+    # (0 = full resolution); boxes are mapped back and faces cropped from the full image
+    DETECTION_MAX_SIDE = int(os.getenv("DETECTION_MAX_SIDE", 0))
+    DETECTION_MIN_FACE_SIZE = int(os.getenv("DETECTION_MIN_FACE_SIZE", 20))  # px in the detection image
+    DETECTION_THRESHOLDS = [float(t) for t in os.getenv("DETECTION_THRESHOLDS", "0.6,0.7,0.7").split(",")]  # P/R/O-Net
+
+    # Max face crops per forward pass through the embedding model
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+
+    # Stored embeddings
+    EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")  # float32, float16 or int8 in Mongo
+    # "collection" = embeddings documents linked by embeddings_id; "inline" = vectors and boxes
+    # packed into the file/face document itself, written by the same insert or update
+    EMBEDDING_STORAGE_MODE = os.getenv("EMBEDDING_STORAGE_MODE", "collection")
+
+    # Model inference processes (detector + embedder per process, requests batched across callers)
+    INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", 0))  # 0 = run models in the API process
+    INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", 64))  # queued requests before InferenceBusy
+    INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", 16))  # requests merged into one batch
+    INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", 2))  # wait for more requests to batch
+    INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", 60))  # seconds per request
+    INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 0))  # torch threads per worker; 0 = cpus / pool size
+
+    # Background embedding pipeline ("redis" falls back to in-process when Redis is down)
+    EMBEDDING_QUEUE_BACKEND = os.getenv("EMBEDDING_QUEUE_BACKEND", "redis")
+    EMBEDDING_QUEUE_KEY = os.getenv("EMBEDDING_QUEUE_KEY", "embedding_jobs")
+    EMBEDDING_QUEUE_MAXSIZE = int(os.getenv("EMBEDDING_QUEUE_MAXSIZE", 1000))
+    EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", 2))  # 0 = embed inline on the threadpool
+    EMBEDDING_LEASE_SECONDS = int(os.getenv("EMBEDDING_LEASE_SECONDS", 600))  # older "processing" claims are requeued
+
+    # Face match responses
+    MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", 0.6))
+    MATCH_PAGE_SIZE = int(os.getenv("MATCH_PAGE_SIZE", 50))
+    MATCH_MAX_PAGE_SIZE = int(os.getenv("MATCH_MAX_PAGE_SIZE", 500))
+    MATCH_INLINE_MAX_RESULTS = int(os.getenv("MATCH_INLINE_MAX_RESULTS", 10))  # page size cap when inlining images
+    MATCH_INLINE_MAX_BYTES = int(os.getenv("MATCH_INLINE_MAX_BYTES", 5 * 1024 * 1024))  # raw bytes inlined per response
+    MATCH_CACHE_ENABLED = os.getenv("MATCH_CACHE_ENABLED", "true").lower() == "true"
+    MATCH_CACHE_TTL = int(os.getenv("MATCH_CACHE_TTL", 300))  # seconds
+    MATCH_CACHE_LOCK_TIMEOUT = float(os.getenv("MATCH_CACHE_LOCK_TIMEOUT", 10.0))  # single-flight wait, seconds
+
+    # Cross-event approximate face search (IVF index)
+    ANN_NLIST = int(os.getenv("ANN_NLIST", 0))  # inverted lists; 0 = about 4 * sqrt(vectors)
+    ANN_NPROBE = int(os.getenv("ANN_NPROBE", 8))  # lists scanned per query: higher = better recall, slower
+    ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", 50000))  # vectors sampled for k-means
+    ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", os.path.join(LOCAL_STORAGE_PATH, "ann", "faces_ivf.npz"))
+    ANN_FEED_GRACE_SECONDS = int(os.getenv("ANN_FEED_GRACE_SECONDS", 30))  # older holes in the change feed are skipped
+
+    # In-RAM per-event face index rows: "float32" or "pq" (product-quantised, needs a trained codebook)
+    FACE_INDEX_CODEC = os.getenv("FACE_INDEX_CODEC", "float32")
+    PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", 64))  # bytes per face; must divide the embedding dim
+    PQ_CODEBOOK_PATH = os.getenv("PQ_CODEBOOK_PATH", "")  # default: pq_codebook.npy next to MODEL_PATH
+    # Share event indexes between workers as read-only memory-mapped .npy shards (needs Redis generations)
+    FACE_INDEX_SHARDS = os.getenv("FACE_INDEX_SHARDS", "false").lower() == "true"
+    SHARD_PATH = os.getenv("SHARD_PATH", os.path.join(LOCAL_STORAGE_PATH, "shards"))
+    SHARD_WRITE_DELAY = float(os.getenv("SHARD_WRITE_DELAY", 5))  # seconds of index changes batched per shard rewrite
+
+    # Gallery / my-files listings
+    LISTING_PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", 100))
+    LISTING_MAX_PAGE_SIZE = int(os.getenv("LISTING_MAX_PAGE_SIZE", 1000))
+
+    # File/face ids reserved per counters round trip by each process; 1 = one update per id
+    ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", 100))
+
     # Security & Authentication
     SECRET_KEY = os.getenv("SECRET_KEY", "photobooth")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
     # Chunk size (in bytes)
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1024 * 1024))  # Default: 1MB
+    CHUNK_WRITE_BUDGET = int(os.getenv("CHUNK_WRITE_BUDGET", 8 * 1024 * 1024))  # bytes per bulk insert
+    CHUNK_READ_BATCH = int(os.getenv("CHUNK_READ_BATCH", 8))  # chunk documents per cursor round trip
+
+    # Gallery renditions (thumb 256px, preview 1024px)
+    RENDITION_FORMAT = os.getenv("RENDITION_FORMAT", "webp")  # webp or jpeg
+    RENDITION_QUALITY = int(os.getenv("RENDITION_QUALITY", 80))
+    RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", 2))
+    RENDITION_DISK_BUDGET_MB = int(os.getenv("RENDITION_DISK_BUDGET_MB", 2048))  # LRU-evicted beyond this
 
     # Deduplication threshold (Cosine similarity)
     DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", 0.95))
+    # Exact re-uploads: "reference" shares the original's bytes/chunks/embeddings, "copy" stores them again
+    DEDUP_MODE = os.getenv("DEDUP_MODE", "reference")
+    DUPLICATE_BLOCK_SIZE = int(os.getenv("DUPLICATE_BLOCK_SIZE", 2048))  # rows per similarity tile
+    PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", 6))  # Hamming bits (of 64) for burst near-duplicates
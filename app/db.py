@@ -1,9 +1,13 @@
 # app/db.py
 
-from pymongo import MongoClient
+import logging
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import OperationFailure
 import redis
 from app.config import Config
 
+logger = logging.getLogger(__name__)
+
 # MongoDB Client
 mongo_client = MongoClient(Config.MONGO_URI)
 mongo_db = mongo_client[Config.MONGO_DB_NAME]
@@ -31,6 +35,81 @@ face_metadata_collection = mongo_db["face_metadata"]
 embeddings_collection = mongo_db["embeddings"]
 events_collection = mongo_db["events"]
 
+# Indexes created idempotently at startup: (collection, keys, options).
+# Every service query filters or sorts on a prefix of one of these; the query-plan
+# test (tests/test_query_plans.py) fails when one falls back to a COLLSCAN.
+INDEXES = [
+    # Dedup lookup of a re-upload (owner_id + content_hash)
+    ("files", [("owner_id", ASCENDING), ("content_hash", ASCENDING)], {"name": "owner_content_hash"}),
+    # Event and owner listings with keyset pagination; prefixes also serve plain event_id / owner_id filters
+    ("files", [("event_id", ASCENDING), ("_id", ASCENDING)], {"name": "event_id_id"}),
+    ("files", [("owner_id", ASCENDING), ("_id", ASCENDING)], {"name": "owner_id_id"}),
+    # Uploads deduplicated by reference, updated when the original's embeddings land
+    ("files", [("storage_ref", ASCENDING)], {"name": "storage_ref", "sparse": True}),
+    # Only pending and processing files are ever looked up by status (requeue at startup)
+    ("files", [("embedding_status", ASCENDING)], {
+        "name": "embedding_status_pending",
+        "partialFilterExpression": {"embedding_status": "pending"}
+    }),
+    ("files", [("embedding_status", ASCENDING), ("embedding_claimed_at", ASCENDING)], {
+        "name": "embedding_status_processing",
+        "partialFilterExpression": {"embedding_status": "processing"}
+    }),
+    ("files", [("embeddings_id", ASCENDING)], {"name": "embeddings_id", "sparse": True}),
+    ("embeddings", [("file_id", ASCENDING)], {"name": "file_id", "sparse": True}),
+    ("embeddings", [("face_id", ASCENDING)], {"name": "face_id", "sparse": True}),
+    ("chunks", [("file_id", ASCENDING), ("chunk_index", ASCENDING)], {"name": "file_id_chunk_index"}),
+    # Events a guest attended: distinct event_id over their faces, answered from the index
+    ("faces", [("owner_id", ASCENDING), ("event_id", ASCENDING)], {"name": "owner_id_event_id"}),
+    ("file_metadata", [("file_id", ASCENDING)], {"name": "file_id"}),
+    ("users", [("email", ASCENDING)], {"name": "email", "unique": True}),
+    ("user_auth", [("user_id", ASCENDING)], {"name": "user_id", "unique": True}),
+]
+
+def ensure_indexes(database=None) -> dict:
+    """
+    Creates every index in INDEXES. Existing identical indexes are a no-op, so this runs
+    at each startup. An index that cannot be built (e.g. duplicate emails under a unique
+    index, or a same-named index with other options) is logged and skipped instead of
+    stopping startup.
+    """
+    database = database if database is not None else mongo_db
+    report = {"ensured": [], "failed": []}
+    for collection, keys, options in INDEXES:
+        name = f"{collection}.{options['name']}"
+        try:
+            database[collection].create_index(keys, **options)
+            report["ensured"].append(name)
+        except OperationFailure as e:
+            logger.warning(f"[Indexes] could not create {name}: {e}")
+            report["failed"].append(name)
+    return report
+
+def index_report(database=None) -> dict:
+    """
+    Per collection: declared indexes that are missing, indexes present but not declared,
+    and indexes with no recorded use ($indexStats counts since the server last started).
+    """
+    database = database if database is not None else mongo_db
+    declared = {}
+    for collection, _, options in INDEXES:
+        declared.setdefault(collection, set()).add(options["name"])
+
+    report = {}
+    for collection in sorted(set(declared) | set(database.list_collection_names())):
+        usage = {
+            stats["name"]: stats["accesses"]["ops"]
+            for stats in database[collection].aggregate([{"$indexStats": {}}])
+        }
+        usage.pop("_id_", None)
+        expected = declared.get(collection, set())
+        report[collection] = {
+            "missing": sorted(expected - set(usage)),
+            "undeclared": sorted(set(usage) - expected),
+            "unused": sorted(name for name, ops in usage.items() if ops == 0),
+        }
+    return report
+
 # Optional: Exported init functions
 def init_mongo():
     return mongo_client, mongo_db, db
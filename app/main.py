@@ -6,7 +6,8 @@ from fastapi.staticfiles import StaticFiles
 
 from app.routes import router as api_router
 from app.config import Config
-from app.db import init_mongo, init_redis
+from app.db import init_mongo, init_redis, ensure_indexes
+from app.services import inference_service, pipeline_service, model_registry, rendition_service
 
 app = FastAPI(
     title="Photobooth",
@@ -34,6 +35,18 @@ app.add_middleware(
 async def startup_event():
     init_mongo()
     init_redis()
+    ensure_indexes()
+    # With an inference pool the models live in its worker processes, not here
+    if inference_service.start_pool() == 0 and Config.WARM_UP_MODELS:
+        model_registry.warm_up()
+    pipeline_service.start_workers()
+    pipeline_service.requeue_pending_files()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    pipeline_service.stop_workers()
+    inference_service.stop_pool()
+    rendition_service.shutdown(wait=False)
 
 # ✅ Includes all API routes
 app.include_router(api_router, prefix="/api")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Union
 from datetime import datetime
 
 
@@ -75,7 +75,9 @@ class FaceMetadata(BaseModel):
 
 class Embedding(BaseModel):
     embeddings_id: str
-    embeddings_vector: List[float]
+    embeddings_vector: Union[bytes, List[List[float]]]  # packed Binary; legacy documents hold arrays
+    dim: Optional[int] = None
+    dtype: Optional[str] = None
     face_id: Optional[str] = None
     file_id: Optional[str] = None
 
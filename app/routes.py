@@ -14,10 +14,16 @@ from app.services import (
     search_service,
     user_service,
     duplicate_service,
-    chunk_service
+    chunk_service,
+    pipeline_service,
+    model_registry,
+    phash_service,
+    cache_service,
+    inference_service
 )
 from app.db import db
 from app.services.user_service import get_current_user_id
+from app.utils import parse_file_id
 
 router = APIRouter()
 
@@ -30,31 +36,73 @@ async def upload_file(
 ):
     try:
         return await file_service.handle_file_upload(file, user_id, event_id)
+    except HTTPException:
+        raise
     except Exception as e:
         print("🔥 Upload Failed:", str(e))
         raise HTTPException(status_code=500, detail=f"Upload route error: {str(e)}")
 
+# Endpoint to poll the background embedding status of an uploaded file
+@router.get("/files/{file_id}/embedding-status")
+def get_embedding_status(file_id: str):
+    status = pipeline_service.get_embedding_status(parse_file_id(file_id))
+    if status is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return status
+
+# Endpoint listing burst-shot near-duplicates of a file by perceptual hash
+@router.get("/files/{file_id}/near-duplicates")
+def get_near_duplicates(file_id: str, max_distance: int = None):
+    file_doc = db.files.find_one({"_id": parse_file_id(file_id)}, {"event_id": 1, "phash": 1})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not file_doc.get("phash"):
+        return {"file_id": file_id, "near_duplicates": []}
+
+    matches = phash_service.find_near_duplicates(file_doc["event_id"], file_doc["phash"], max_distance)
+    return {
+        "file_id": file_id,
+        "near_duplicates": [
+            {"file_id": str(match_id), "distance": distance}
+            for match_id, distance in matches if match_id != file_doc["_id"]
+        ]
+    }
+
+# Endpoint serving gallery renditions ("thumb" or "preview") of an uploaded file
+@router.get("/files/{file_id}/renditions/{name}")
+def get_rendition(file_id: str, name: str):
+    return file_service.get_rendition_file(file_id, name)
+
+# Endpoint reporting model load time and resident memory (for sizing worker counts)
+@router.get("/models/status")
+def get_model_status():
+    return {**model_registry.get_stats(), "inference": inference_service.get_stats()}
+
+# Endpoint reporting face-match cache hits and misses
+@router.get("/cache/stats")
+def get_cache_stats():
+    return cache_service.get_match_cache_stats()
+
 # Endpoint for uploading face images
 @router.post("/upload/face")
 async def upload_face(
     face: UploadFile = File(...),
     user_id: str = Form(...),
     event_id: str = Form(...),
+    echo_image: bool = Form(False),
 ):
     file_bytes = await face.read()
     filename = face.filename
 
-    result = face_service.handle_face_upload(file_bytes, filename, user_id, event_id)
+    result = await face_service.handle_face_upload_async(file_bytes, filename, user_id, event_id)
 
     if result is None:
         return {"error": "No face detected in the image."}
 
-    base64_image = base64.b64encode(file_bytes).decode("utf-8")
-
-    return {
-        "face_id": str(result),
-        "base64_image": base64_image,
-    }
+    response = {"face_id": str(result)}
+    if echo_image:
+        response["base64_image"] = base64.b64encode(file_bytes).decode("utf-8")
+    return response
 
 # Endpoint for uploading chunked files
 @router.post("/upload/chunked-file")
@@ -78,25 +126,33 @@ async def upload_chunked_file(
         "chunk_count": len(chunk_ids),
     }
 
-# Endpoint for reconstructing files from chunks
+# Endpoint for reconstructing files from chunks (supports HTTP Range)
 @router.get("/reconstruct-file/{file_id}")
-def reconstruct_file(file_id: str):
-    file_doc = db.files.find_one({"_id": ObjectId(file_id)})
-    if not file_doc:
-        raise HTTPException(status_code=404, detail="File not found")
-
-    output_path = f"/tmp/reconstructed_{file_doc['filename']}"
-    chunk_service.reconstruct_file_from_chunks(ObjectId(file_id), output_path)
-
-    return FileResponse(path=output_path, filename=file_doc["filename"])
+def reconstruct_file(file_id: str, request: Request):
+    return file_service.stream_file_from_chunks(file_id, request.headers.get("range"))
 
 # Endpoint for matching faces with uploaded files
 @router.post("/match-face")
-async def match_face(
+def match_face(
     face_id: str = Form(...),
     event_id: str = Form(...),
+    limit: int = Form(None),
+    cursor: str = Form(None),
+    top_k: int = Form(None),
+    inline: bool = Form(False),
+):
+    return face_service.match_face_with_files(face_id, event_id, limit, cursor, top_k, inline)
+
+# Endpoint for approximate face matching across all events the guest attended
+@router.post("/match-face/across-events")
+def match_face_across_events(
+    face_id: str = Form(...),
+    event_ids: str = Form(None),
+    top_k: int = Form(None),
+    nprobe: int = Form(None),
 ):
-    return face_service.match_face_with_files(face_id, event_id)
+    events = [event_id.strip() for event_id in event_ids.split(",") if event_id.strip()] if event_ids else None
+    return search_service.search_files_across_events(face_id, events, top_k, nprobe)
 
 # Endpoint for searching files by event
 @router.get("/search/event/{event_id}")
@@ -157,8 +213,8 @@ def get_file(file_id: str):
 
 # Endpoint to get files uploaded by current user
 @router.get("/my-files")
-async def get_my_files(user_id: str = Depends(get_current_user_id)):
-    return file_service.get_files_by_user(user_id)
+def get_my_files(limit: int = None, cursor: str = None, user_id: str = Depends(get_current_user_id)):
+    return file_service.get_files_by_user(user_id, limit, cursor)
 
 # Endpoint to delete files by IDs
 @router.delete("/delete-files/")
@@ -174,16 +230,18 @@ async def delete_my_file(file_id: str, user_id: str = Depends(get_current_user_i
 
 # Endpoint to get files for a specific event
 @router.get("/event/{event_id}/files")
-def get_event_images(event_id: str):
-    return {"files": file_service.get_files_by_event(event_id)}
+def get_event_images(event_id: str, limit: int = None, cursor: str = None):
+    return file_service.get_files_by_event(event_id, limit, cursor)
 
 # Endpoint to fetch gallery for a specific event
 @router.get("/gallery/{event_id}")
-async def get_gallery(event_id: str):
+def get_gallery(event_id: str, limit: int = None, cursor: str = None):
     try:
-        gallery_files = file_service.get_files_by_event(event_id)
-        if not gallery_files:
+        page = file_service.get_files_by_event(event_id, limit, cursor)
+        if not page["files"] and not cursor:
             raise HTTPException(status_code=404, detail="No files found for this event.")
-        return {"event_id": event_id, "gallery": gallery_files}
+        return {"event_id": event_id, "gallery": page["files"], "next_cursor": page["next_cursor"]}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching gallery: {str(e)}")
\ No newline at end of file
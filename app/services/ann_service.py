@@ -0,0 +1,402 @@
+# app/services/ann_service.py
+
+import os
+import json
+import logging
+import threading
+import numpy as np
+from bson import ObjectId
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.db import db
+from app.config import Config
+from app.services import embedding_store, index_service
+from app.services.id_service import get_allocator
+from app.services.index_service import FileId, normalize_vectors
+
+logger = logging.getLogger(__name__)
+
+
+def train_kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means (cosine) on normalised rows with k-means++ seeding.
+    Returns k unit-length centroids; empty clusters are re-seeded from the worst-fit points.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = min(k, n)
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(n)]
+    closest = 1.0 - vectors @ centroids[0]
+    for i in range(1, k):
+        weights = np.maximum(closest, 0) ** 2
+        total = weights.sum()
+        pick = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centroids[i] = vectors[pick]
+        closest = np.minimum(closest, 1.0 - vectors @ centroids[i])
+
+    for _ in range(iterations):
+        scores = vectors @ centroids.T
+        assignment = scores.argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=k)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            worst = np.argsort(scores[np.arange(n), assignment])[:len(empty)]
+            sums[empty] = vectors[worst]
+        centroids = normalize_vectors(sums)
+    return centroids
+
+
+class InvertedList:
+    """Growable (vectors, owner slot) buffer for the rows assigned to one centroid."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.owners = np.empty(0, dtype=np.int32)
+        self.size = 0
+
+    def add(self, vectors: np.ndarray, slot: int):
+        needed = self.size + len(vectors)
+        if needed > len(self.vectors):
+            capacity = max(needed, len(self.vectors) * 2, 16)
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            owners = np.empty(capacity, dtype=np.int32)
+            grown[:self.size] = self.vectors[:self.size]
+            owners[:self.size] = self.owners[:self.size]
+            self.vectors, self.owners = grown, owners
+        self.vectors[self.size:needed] = vectors
+        self.owners[self.size:needed] = slot
+        self.size = needed
+
+    def remove(self, slot: int) -> int:
+        keep = self.owners[:self.size] != slot
+        kept = int(keep.sum())
+        removed = self.size - kept
+        if removed:
+            self.vectors[:kept] = self.vectors[:self.size][keep]
+            self.owners[:kept] = self.owners[:self.size][keep]
+            self.size = kept
+        return removed
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over face vectors of every event. A query scores the
+    `nprobe` nearest of `nlist` k-means centroids and then only the rows filed under
+    them, so cost grows with nprobe / nlist of the collection instead of all of it.
+    Rows map to (file_id, event_id) through owner slots, like EventFaceIndex.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = None):
+        self.centroids = normalize_vectors(centroids)
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe or Config.ANN_NPROBE
+        self.lists = [InvertedList(self.dim) for _ in range(len(self.centroids))]
+        self.files: List[Optional[Tuple[FileId, str]]] = []
+        self._slots: Dict[FileId, int] = {}
+        self._slot_lists: Dict[int, List[int]] = {}
+        self._lock = threading.RLock()
+        # Last change-feed sequence applied with no gaps before it; later entries are replayed
+        self.watermark = None
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return sum(inverted.size for inverted in self.lists)
+
+    def add(self, file_id: FileId, event_id: str, vectors) -> int:
+        if vectors is None or len(vectors) == 0:
+            return 0
+        matrix = normalize_vectors(vectors)
+        if matrix.shape[1] != self.dim:
+            return 0
+        assignment = (matrix @ self.centroids.T).argmax(axis=1)
+        with self._lock:
+            self.remove(file_id)
+            slot = len(self.files)
+            self.files.append((file_id, event_id))
+            self._slots[file_id] = slot
+            self._slot_lists[slot] = sorted(set(assignment.tolist()))
+            for list_id in self._slot_lists[slot]:
+                self.lists[list_id].add(matrix[assignment == list_id], slot)
+        return len(matrix)
+
+    def remove(self, file_id: FileId) -> int:
+        with self._lock:
+            slot = self._slots.pop(file_id, None)
+            if slot is None:
+                return 0
+            self.files[slot] = None
+            return sum(self.lists[list_id].remove(slot) for list_id in self._slot_lists.pop(slot, []))
+
+    def search(
+        self,
+        query,
+        k: int = 10,
+        nprobe: int = None,
+        threshold: float = -1.0,
+        event_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[FileId, str, float]]:
+        """(file_id, event_id, similarity) of the best `k` files, best face per file, highest first."""
+        queries = normalize_vectors(query)
+        if queries.shape[1] != self.dim:
+            return []
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        events = set(event_ids) if event_ids else None
+
+        with self._lock:
+            centroid_scores = queries @ self.centroids.T
+            probe = np.unique(np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe])
+            scores, owners = [], []
+            for list_id in probe:
+                inverted = self.lists[list_id]
+                if inverted.size:
+                    scores.append((inverted.vectors[:inverted.size] @ queries.T).max(axis=1))
+                    owners.append(inverted.owners[:inverted.size])
+            files = list(self.files)
+        if not scores:
+            return []
+
+        scores, owners = np.concatenate(scores), np.concatenate(owners)
+        hits = np.flatnonzero(scores >= threshold)
+        order = hits[np.argsort(-scores[hits], kind="stable")]
+        # First occurrence of a slot in descending order is that file's best face
+        _, first = np.unique(owners[order], return_index=True)
+        order = order[np.sort(first)]
+
+        results = []
+        for row in order.tolist():
+            file_id, event_id = files[owners[row]]
+            if events is None or event_id in events:
+                results.append((file_id, event_id, float(scores[row])))
+                if len(results) == k:
+                    break
+        return results
+
+    def save(self, path: str):
+        """Writes centroids, rows and the slot table to `path` atomically (tmp file + os.replace)."""
+        with self._lock:
+            vectors = [inverted.vectors[:inverted.size] for inverted in self.lists]
+            owners = [inverted.owners[:inverted.size] for inverted in self.lists]
+            files = [
+                None if entry is None else [str(entry[0]), type(entry[0]).__name__, entry[1]]
+                for entry in self.files
+            ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                vectors=np.concatenate(vectors) if vectors else np.empty((0, self.dim), dtype=np.float32),
+                owners=np.concatenate(owners) if owners else np.empty(0, dtype=np.int32),
+                list_sizes=np.array([len(o) for o in owners], dtype=np.int64),
+                files=np.frombuffer(json.dumps(files).encode("utf-8"), dtype=np.uint8),
+                nprobe=np.array([self.nprobe]),
+                watermark=np.array(["" if self.watermark is None else str(self.watermark)])
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            index = cls(data["centroids"], int(data["nprobe"][0]))
+            watermark = str(data["watermark"][0]) if "watermark" in data.files else ""
+            # Snapshots from before the change feed (ObjectId watermarks) are not caught up
+            index.watermark = int(watermark) if watermark.isdigit() else None
+            files = json.loads(data["files"].tobytes().decode("utf-8"))
+            for entry in files:
+                if entry is None:
+                    index.files.append(None)
+                    continue
+                value, kind, event_id = entry
+                file_id = int(value) if kind == "int" else ObjectId(value) if kind == "ObjectId" else value
+                index._slots[file_id] = len(index.files)
+                index.files.append((file_id, event_id))
+            offset = 0
+            vectors, owners = data["vectors"], data["owners"]
+            for list_id, size in enumerate(data["list_sizes"].tolist()):
+                rows = slice(offset, offset + size)
+                for slot in np.unique(owners[rows]).tolist():
+                    mask = owners[rows] == slot
+                    index.lists[list_id].add(vectors[rows][mask], slot)
+                    index._slot_lists.setdefault(slot, []).append(list_id)
+                offset += size
+        return index
+
+
+# ========== Global Index ==========
+
+_index: Optional[IVFIndex] = None
+_loaded_mtime = None
+_index_lock = threading.Lock()
+_catch_up_lock = threading.Lock()
+
+FEED_COUNTER = "ann_feed"
+
+
+def default_nlist(rows: int) -> int:
+    """About 4·sqrt(n) lists, the usual IVF sizing, unless ANN_NLIST pins it."""
+    return Config.ANN_NLIST or max(1, int(4 * np.sqrt(rows)))
+
+
+def feed_position() -> int:
+    """Highest change-feed sequence reserved so far (0 before the first)."""
+    counter = db.counters.find_one({"_id": FEED_COUNTER})
+    return counter["sequence_value"] if counter else 0
+
+
+def record_change(event_id: str, file_id: FileId):
+    """
+    Appends a file whose vectors became searchable to the `ann_feed` change feed, read
+    by catch_up in every process. Sequences come one at a time from the counter (not
+    from a per-process id block), so the feed has no holes except for writes in flight.
+    """
+    sequence = get_allocator().reserve(FEED_COUNTER, 1).start
+    db.ann_feed.insert_one({"_id": sequence, "file_id": file_id, "event_id": event_id, "created_at": datetime.utcnow()})
+
+
+def iter_file_vectors(query: dict = None, batch_size: int = 1000):
+    """Yields (file_id, event_id, vectors) for embedded files, loading linked embeddings in batches."""
+    batch = []
+    query = query or {"$or": [{"embeddings_id": {"$ne": None}}, {embedding_store.INLINE_FIELD: {"$exists": True}}]}
+    projection = {"event_id": 1, **embedding_store.DOCUMENT_PROJECTION}
+    for file_doc in db.files.find(query, projection).batch_size(batch_size):
+        batch.append(file_doc)
+        if len(batch) == batch_size:
+            yield from _resolve(batch)
+            batch = []
+    yield from _resolve(batch)
+
+
+def _resolve(file_docs: list):
+    vectors_by_file = embedding_store.load_document_vectors(file_docs)
+    for doc in file_docs:
+        vectors = vectors_by_file.get(doc["_id"])
+        if vectors is not None:
+            yield doc["_id"], doc.get("event_id"), vectors
+
+
+def build_index(nlist: int = None, sample_size: int = None) -> Optional[IVFIndex]:
+    """Trains centroids on a sample of all face vectors and files every vector. None if there are none."""
+    # Read before the scan: every file behind a sequence up to here is already written
+    watermark = feed_position()
+    entries = list(iter_file_vectors())
+    if not entries:
+        return None
+    matrix = normalize_vectors(np.concatenate([vectors for _, _, vectors in entries]))
+    nlist = nlist or default_nlist(len(matrix))
+    sample_size = sample_size or Config.ANN_TRAIN_SAMPLE
+    if len(matrix) > sample_size:
+        matrix = matrix[np.random.default_rng(0).choice(len(matrix), sample_size, replace=False)]
+    index = IVFIndex(train_kmeans(matrix, nlist))
+    index.watermark = watermark
+    for file_id, event_id, vectors in entries:
+        index.add(file_id, event_id, vectors)
+    logger.info(f"[ANN] built {index.nlist} lists over {len(index)} vectors of {len(entries)} files")
+    return index
+
+
+def catch_up(index: IVFIndex) -> int:
+    """
+    Adds files published after the snapshot, in change-feed order. Sequences are taken
+    before the feed entry is written, so a missing one is usually a write still in flight:
+    the watermark stops below it and the entries after it are re-read on the next lookup
+    (adding a file again is a no-op). A hole older than ANN_FEED_GRACE_SECONDS is a writer
+    that died between the two steps and is skipped.
+    """
+    if index.watermark is None:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(seconds=Config.ANN_FEED_GRACE_SECONDS)
+    watermark, blocked = index.watermark, False
+    events_by_file = {}
+    for entry in db.ann_feed.find({"_id": {"$gt": index.watermark}}).sort("_id", 1):
+        if entry["_id"] != watermark + 1 and entry["created_at"] > cutoff:
+            blocked = True
+        if not blocked:
+            watermark = entry["_id"]
+        events_by_file[entry["file_id"]] = entry["event_id"]
+
+    added = 0
+    file_ids = list(events_by_file)
+    for start in range(0, len(file_ids), 1000):
+        query = {"_id": {"$in": file_ids[start:start + 1000]}}
+        for file_id, _, vectors in iter_file_vectors(query):
+            added += index.add(file_id, events_by_file[file_id], vectors) > 0
+    index.watermark = watermark
+    return added
+
+
+def get_index() -> Optional[IVFIndex]:
+    """
+    The process-wide index: loaded from ANN_INDEX_PATH (reloaded when a newer snapshot
+    lands) and caught up on every lookup with files other processes have embedded since.
+    None until app.commands.build_ann_index has written a snapshot; k-means never runs
+    inside a request.
+    """
+    global _index, _loaded_mtime
+    path = Config.ANN_INDEX_PATH
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    if mtime is not None and mtime != _loaded_mtime:
+        with _index_lock:
+            if mtime != _loaded_mtime:
+                _index, _loaded_mtime = IVFIndex.load(path), mtime
+    index = _index
+    # One catch-up at a time; concurrent lookups search what is already there
+    if index is not None and _catch_up_lock.acquire(blocking=False):
+        try:
+            catch_up(index)
+        finally:
+            _catch_up_lock.release()
+    return index
+
+
+def exact_search(query, k: int = 10, threshold: float = -1.0, event_ids=None) -> List[Tuple[FileId, str, float]]:
+    """The per-event exact scans merged, for when there is no snapshot to search yet."""
+    matches = [
+        (file_id, event_id, similarity)
+        for event_id in event_ids or []
+        for file_id, similarity in index_service.search_event(event_id, query, threshold, k)
+    ]
+    return sorted(matches, key=lambda match: match[2], reverse=True)[:k]
+
+
+def search(query, k: int = 10, nprobe: int = None, threshold: float = -1.0, event_ids=None):
+    """
+    Top-k (file_id, event_id, similarity) across events. Files deleted by another
+    process since the snapshot are dropped from the results and from the index.
+    Without a snapshot the given events are scanned exactly (nothing when `event_ids` is empty).
+    """
+    index = get_index()
+    if index is None:
+        return exact_search(query, k, threshold, event_ids)
+    matches = index.search(query, k, nprobe, threshold, event_ids)
+    if not matches:
+        return []
+    existing = {doc["_id"] for doc in db.files.find({"_id": {"$in": [file_id for file_id, _, _ in matches]}}, {"_id": 1})}
+    for file_id, _, _ in matches:
+        if file_id not in existing:
+            index.remove(file_id)
+    return [match for match in matches if match[0] in existing]
+
+
+def add_file(event_id: str, file_id: FileId, vectors):
+    """
+    Publishes the file to other processes through the change feed and keeps a loaded
+    index current; snapshots are refreshed by app.commands.build_ann_index.
+    """
+    if vectors is None or len(vectors) == 0:
+        return
+    record_change(event_id, file_id)
+    if _index is not None:
+        _index.add(file_id, event_id, vectors)
+
+
+def remove_file(file_id: FileId):
+    if _index is not None:
+        _index.remove(file_id)
@@ -1,47 +1,261 @@
 import redis
 import json
+import time
+import uuid
+import logging
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
 from app.config import Config
+from app.services import vector_codec
+
+logger = logging.getLogger(__name__)
 
 # Initialize Redis client
 redis_client = redis.StrictRedis(
     host=Config.REDIS_HOST,
     port=Config.REDIS_PORT,
     db=Config.REDIS_DB,
-    decode_responses=True
+    decode_responses=True,
+    socket_connect_timeout=Config.REDIS_TIMEOUT,
+    socket_timeout=Config.REDIS_TIMEOUT
+)
+
+# Bytes-mode client for binary payloads (encoded vectors)
+binary_client = redis.StrictRedis(
+    host=Config.REDIS_HOST,
+    port=Config.REDIS_PORT,
+    db=Config.REDIS_DB,
+    decode_responses=False,
+    socket_connect_timeout=Config.REDIS_TIMEOUT,
+    socket_timeout=Config.REDIS_TIMEOUT
 )
 
-def cache_embedding(embedding_id: str, embedding_vector: list, ttl: int = 3600):
+# After a Redis error the cache is bypassed for a while instead of failing every request
+_unavailable_until = 0.0
+RETRY_AFTER_SECONDS = 10.0
+
+def _available() -> bool:
+    return time.monotonic() >= _unavailable_until
+
+def _mark_unavailable(e: Exception):
+    global _unavailable_until
+    if _available():
+        logger.warning(f"[Cache] Redis unavailable ({e}), bypassing cache for {RETRY_AFTER_SECONDS:.0f}s")
+    _unavailable_until = time.monotonic() + RETRY_AFTER_SECONDS
+
+def embedding_key(embedding_id) -> str:
+    return f"embedding:{embedding_id}"
+
+def cache_embedding(embedding_id: str, embedding_vector, ttl: int = None):
     """
-    Cache embedding vector with optional TTL (default 1 hour)
+    Cache embedding vector(s) in the binary vector codec with optional TTL (default 1 hour)
     """
-    redis_client.setex(f"embedding:{embedding_id}", ttl, json.dumps(embedding_vector))
+    data = vector_codec.encode(embedding_vector, Config.EMBEDDING_CACHE_DTYPE)
+    binary_client.setex(embedding_key(embedding_id), ttl or Config.EMBEDDING_CACHE_TTL, data)
 
-def get_cached_embedding(embedding_id: str):
+def get_cached_embedding(embedding_id: str) -> Optional[np.ndarray]:
     """
-    Retrieve cached embedding vector if exists
+    Retrieve cached embedding as a (faces, dim) float32 matrix if exists
     """
-    cached = redis_client.get(f"embedding:{embedding_id}")
+    cached = binary_client.get(embedding_key(embedding_id))
     if cached:
-        return json.loads(cached)
+        return vector_codec.decode(cached)
     return None
 
 def invalidate_cached_embedding(embedding_id: str):
     """
     Remove embedding from cache
     """
-    redis_client.delete(f"embedding:{embedding_id}")
+    binary_client.delete(embedding_key(embedding_id))
+
+def cache_embeddings(embeddings: Dict[object, object], ttl: int = None):
+    """Caches many embeddings in one pipelined round trip. Redis errors are ignored."""
+    if not embeddings or not _available():
+        return
+    ttl = ttl or Config.EMBEDDING_CACHE_TTL
+    try:
+        pipe = binary_client.pipeline(transaction=False)
+        for embedding_id, vectors in embeddings.items():
+            pipe.setex(embedding_key(embedding_id), ttl, vector_codec.encode(vectors, Config.EMBEDDING_CACHE_DTYPE))
+        pipe.execute()
+    except redis.RedisError as e:
+        _mark_unavailable(e)
+
+def get_cached_embeddings(embedding_ids: List[object]) -> Dict[object, np.ndarray]:
+    """
+    Fetches many embeddings with a single MGET. Returns {embedding_id: matrix} for the
+    ids found; missing, undecodable or unreachable entries are simply left out.
+    """
+    if not embedding_ids or not _available():
+        return {}
+    try:
+        values = binary_client.mget([embedding_key(embedding_id) for embedding_id in embedding_ids])
+    except redis.RedisError as e:
+        _mark_unavailable(e)
+        return {}
+    found = {}
+    for embedding_id, value in zip(embedding_ids, values):
+        if value:
+            try:
+                found[embedding_id] = vector_codec.decode(value)
+            except vector_codec.CodecError:
+                continue
+    return found
+
+# ========== Event Generations ==========
+
+def event_generation(event_id: str) -> Optional[int]:
+    """
+    Current generation of an event's searchable content, or None when Redis is unavailable.
+    Every cached result of the event embeds it in its key, so bumping it invalidates them all.
+    """
+    if not _available():
+        return None
+    try:
+        return int(redis_client.get(f"event_gen:{event_id}") or 0)
+    except redis.RedisError as e:
+        _mark_unavailable(e)
+        return None
 
-def cache_face_match_result(face_id: str, matched_file_ids: list, ttl: int = 300):
+def bump_event_generation(event_id: str) -> Optional[int]:
+    """Called whenever files enter or leave an event's index. O(1) invalidation."""
+    if not _available():
+        return None
+    try:
+        return redis_client.incr(f"event_gen:{event_id}")
+    except redis.RedisError as e:
+        _mark_unavailable(e)
+        return None
+
+def advance_generation(holder, generation: Optional[int]):
+    """
+    Moves an in-memory structure built at `holder.generation` to `generation` after a
+    change it applied itself. Only our own +1 bump is followed; any gap means another
+    process changed the event too, so the holder is marked stale (None) for a rebuild.
+    """
+    if generation is not None and holder.generation is not None and generation == holder.generation + 1:
+        holder.generation = generation
+    else:
+        holder.generation = None
+
+# ========== Face Match Results ==========
+
+_stats = {"hits": 0, "misses": 0, "waits": 0}
+_stats_lock = threading.Lock()
+_flight_locks = {}  # key -> [lock, callers holding or waiting for it]
+_flight_registry_lock = threading.Lock()
+
+def match_cache_key(face_id: str, event_id: str, threshold: float, generation: int, top_k: Optional[int] = None) -> str:
+    return f"match:{event_id}:{generation}:{face_id}:{threshold}:{top_k or 'all'}"
+
+def cache_face_match_result(key: str, matched_file_ids: list, ttl: int = None):
     """
     Cache face-to-file match results for quick repeated lookups
     """
-    redis_client.setex(f"match:{face_id}", ttl, json.dumps(matched_file_ids))
+    redis_client.setex(key, ttl or Config.MATCH_CACHE_TTL, json.dumps(matched_file_ids))
 
-def get_cached_match_result(face_id: str):
+def get_cached_match_result(key: str):
     """
     Retrieve cached match results for a face
     """
-    cached = redis_client.get(f"match:{face_id}")
+    cached = redis_client.get(key)
     if cached:
         return json.loads(cached)
     return None
+
+def _record(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+    try:
+        redis_client.hincrby("cache_stats:match", stat, 1)
+    except redis.RedisError:
+        pass
+
+def get_match_cache_stats() -> dict:
+    """Hit/miss counters for this process and, when Redis answers, across all processes."""
+    with _stats_lock:
+        local = dict(_stats)
+    total = None
+    if _available():
+        try:
+            total = {stat: int(count) for stat, count in redis_client.hgetall("cache_stats:match").items()}
+        except redis.RedisError as e:
+            _mark_unavailable(e)
+    return {"process": local, "total": total}
+
+@contextmanager
+def _flight_lock(key: str):
+    """
+    Holds the per-key lock. Callers are counted so the entry is dropped only when the
+    last one leaves: removing it while others still wait on it would let a newcomer
+    create a second lock and compute the same key concurrently.
+    """
+    with _flight_registry_lock:
+        entry = _flight_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _flight_registry_lock:
+            entry[1] -= 1
+            if entry[1] == 0 and _flight_locks.get(key) is entry:
+                del _flight_locks[key]
+
+def _release(lock_key: str, token: str):
+    try:
+        if redis_client.get(lock_key) == token:
+            redis_client.delete(lock_key)
+    except redis.RedisError:
+        pass  # the lock expires on its own
+
+def get_or_compute_match_result(key: str, compute: Callable[[], list], ttl: int = None) -> list:
+    """
+    Returns the cached result for `key`, computing and caching it on a miss.
+    Single-flight: within a process a per-key lock serialises identical requests;
+    across processes a Redis SET NX lock lets one compute while the rest wait for its result.
+    """
+    if not _available():
+        return compute()
+    try:
+        cached = get_cached_match_result(key)
+        if cached is not None:
+            _record("hits")
+            return cached
+
+        with _flight_lock(key):
+            cached = get_cached_match_result(key)
+            if cached is not None:
+                _record("hits")
+                return cached
+
+            lock_key = f"lock:{key}"
+            token = uuid.uuid4().hex
+            timeout = Config.MATCH_CACHE_LOCK_TIMEOUT
+            if not redis_client.set(lock_key, token, nx=True, px=int(timeout * 1000)):
+                _record("waits")
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    cached = get_cached_match_result(key)
+                    if cached is not None:
+                        _record("hits")
+                        return cached
+                    if not redis_client.exists(lock_key):
+                        break
+
+            _record("misses")
+            try:
+                result = compute()
+                try:
+                    cache_face_match_result(key, result, ttl)
+                except redis.RedisError as e:
+                    _mark_unavailable(e)
+            finally:
+                _release(lock_key, token)
+            return result
+    except redis.RedisError as e:
+        _mark_unavailable(e)
+        return compute()
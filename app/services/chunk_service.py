@@ -2,8 +2,10 @@
 
 import os
 from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor
 from app.db import db
-from typing import BinaryIO, Union
+from app.config import Config
+from typing import BinaryIO, Iterable, Iterator, Union
 
 CHUNK_SIZE = 1024 * 512  # 512 KB
 
@@ -46,21 +48,116 @@ def chunk_image_bytes(file_bytes: bytes, chunk_size: int = CHUNK_SIZE) -> list:
     return [file_bytes[i:i + chunk_size] for i in range(0, len(file_bytes), chunk_size)]
 
 
-def save_chunks(file_id: Union[int, str], chunks: list) -> list:
+class ChunkWriter:
     """
-    Saves byte chunks into MongoDB `chunks` collection.
+    Buffers chunk documents for one file and writes them with ordered `insert_many`
+    batches of about `byte_budget` bytes. Each batch is written on a background
+    thread while the next one fills, with at most one batch in flight.
     """
-    chunk_ids = []
-    for index, chunk_data in enumerate(chunks):
+
+    def __init__(self, file_id: Union[int, str], byte_budget: int = None, start_index: int = 0):
+        self.file_id = file_id
+        self.byte_budget = byte_budget or Config.CHUNK_WRITE_BUDGET
+        self.next_index = start_index
+        self.chunk_ids = []
+        self._batch = []
+        self._batch_bytes = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._in_flight = None
+
+    def write(self, chunk_data: bytes) -> ObjectId:
         chunk_id = ObjectId()
-        db.chunks.insert_one({
+        self._batch.append({
             "_id": chunk_id,
-            "file_id": file_id,
-            "chunk_index": index,
+            "file_id": self.file_id,
+            "chunk_index": self.next_index,
             "chunk_data": chunk_data,
         })
-        chunk_ids.append(chunk_id)
-    return chunk_ids
+        self.chunk_ids.append(chunk_id)
+        self.next_index += 1
+        self._batch_bytes += len(chunk_data)
+        if self._batch_bytes >= self.byte_budget:
+            self.flush()
+        return chunk_id
+
+    def flush(self):
+        self._wait()
+        if self._batch:
+            self._in_flight = self._executor.submit(db.chunks.insert_many, self._batch, ordered=True)
+            self._batch = []
+            self._batch_bytes = 0
+
+    def close(self) -> list:
+        """Writes whatever is buffered and waits for it. Returns all chunk ids in order."""
+        try:
+            self.flush()
+            self._wait()
+        finally:
+            self._executor.shutdown(wait=True)
+        return self.chunk_ids
+
+    def _wait(self):
+        if self._in_flight is not None:
+            in_flight, self._in_flight = self._in_flight, None
+            in_flight.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def save_chunks(file_id: Union[int, str], chunks: Iterable[bytes], byte_budget: int = None) -> list:
+    """
+    Saves byte chunks into MongoDB `chunks` collection using byte-budgeted bulk writes.
+    `chunks` may be any iterable, so callers can stream without building a list.
+    """
+    with ChunkWriter(file_id, byte_budget) as writer:
+        for chunk_data in chunks:
+            writer.write(chunk_data)
+    return writer.chunk_ids
+
+
+def iter_chunks(file_id: Union[int, str], start_index: int = 0, batch_size: int = None) -> Iterator[bytes]:
+    """
+    Yields the file's chunk payloads in order from `start_index`, pulling
+    `batch_size` documents per cursor round trip.
+    """
+    cursor = db.chunks.find(
+        {"file_id": file_id, "chunk_index": {"$gte": start_index}},
+        {"chunk_data": 1}
+    ).sort("chunk_index", 1).batch_size(batch_size or Config.CHUNK_READ_BATCH)
+    for chunk in cursor:
+        yield chunk["chunk_data"]
+
+
+def iter_byte_range(file_id: Union[int, str], start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+    """
+    Yields bytes `start`..`end` (inclusive) of a file whose chunks are all `chunk_size`
+    long except the last. Chunks before the range are never read.
+    """
+    first_index = start // chunk_size
+    offset = start - first_index * chunk_size
+    remaining = end - start + 1
+    for chunk_data in iter_chunks(file_id, first_index):
+        if remaining <= 0:
+            break
+        piece = chunk_data[offset:offset + remaining]
+        offset = 0
+        remaining -= len(piece)
+        yield piece
+
+
+def stored_chunk_size(file_id: Union[int, str]) -> int:
+    """Length of the file's first chunk, i.e. the size it was chunked with, for documents that don't record it."""
+    chunk = db.chunks.find_one({"file_id": file_id, "chunk_index": 0}, {"chunk_data": 1})
+    return len(chunk["chunk_data"]) if chunk else CHUNK_SIZE
+
+
+def chunked_file_size(file_id: Union[int, str]) -> int:
+    """Total stored bytes of a file, for documents written before `size` was recorded."""
+    return sum(len(chunk_data) for chunk_data in iter_chunks(file_id))
 
 
 def reconstruct_file_from_chunks(file_id: Union[int, str], output_path: str) -> str:
@@ -68,10 +165,8 @@ def reconstruct_file_from_chunks(file_id: Union[int, str], output_path: str) ->
     Reassembles and writes the file from chunks based on `file_id`.
     Returns the path to the reconstructed file.
     """
-    chunks = db.chunks.find({"file_id": file_id}).sort("chunk_index", 1)
-
     with open(output_path, "wb") as output_file:
-        for chunk in chunks:
-            output_file.write(chunk["chunk_data"])
+        for chunk_data in iter_chunks(file_id):
+            output_file.write(chunk_data)
 
     return output_path
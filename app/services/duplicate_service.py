@@ -1,9 +1,20 @@
 import numpy as np
 from app.db import db
 from bson import ObjectId
-from app.utils import cosine_similarity
+from app.config import Config
+from app.utils import parse_file_id
+from app.services import ann_service, embedding_store, index_service, file_service, phash_service
+from app.services.index_service import normalize_vectors
+
+DUPLICATE_THRESHOLD = Config.DUPLICATE_THRESHOLD
+BLOCK_SIZE = Config.DUPLICATE_BLOCK_SIZE
+PHASH_MAX_DISTANCE = Config.PHASH_MAX_DISTANCE
+
+
+def file_signature(vectors) -> np.ndarray:
+    """One unit vector per file: the renormalised mean of its face vectors."""
+    return normalize_vectors(normalize_vectors(vectors).mean(axis=0))[0]
 
-DUPLICATE_THRESHOLD = 0.95
 
 def get_all_file_embeddings(user_id=None, event_id=None):
     query = {}
@@ -12,50 +23,155 @@ def get_all_file_embeddings(user_id=None, event_id=None):
     if event_id:
         query["event_id"] = event_id
 
-    files = list(db["file"].find(query))
+    files = list(db.files.find(query, {"path": 1, **embedding_store.DOCUMENT_PROJECTION}))
+    vectors_by_file = embedding_store.load_document_vectors(files)
+
     embeddings = []
     for file in files:
-        embedding_doc = db["embeddings"].find_one({"_id": file["embeddings_id"]})
-        if embedding_doc:
+        vectors = vectors_by_file.get(file["_id"])
+        if vectors is not None:
             embeddings.append({
                 "file_id": str(file["_id"]),
-                "vector": np.array(embedding_doc["embeddings_vector"]),
+                "vector": file_signature(vectors),
                 "path": file["path"]
             })
     return embeddings
 
 
-def find_duplicate_files(user_id=None, event_id=None):
+def get_all_file_hashes(user_id=None, event_id=None):
+    query = {"phash": {"$ne": None}}
+    if user_id:
+        query["owner_id"] = ObjectId(user_id)
+    if event_id:
+        query["event_id"] = event_id
+
+    return [
+        {"file_id": str(file["_id"]), "phash": file["phash"], "path": file["path"]}
+        for file in db.files.find(query, {"path": 1, "phash": 1})
+        if file.get("phash")
+    ]
+
+
+def hash_pairs(hashes: list, max_distance: int = PHASH_MAX_DISTANCE):
+    """(i, j, similarity) for every pair i < j of perceptual hashes within `max_distance` bits, via a BK-tree."""
+    tree = phash_service.BKTree()
+    pairs = []
+    for i, value in enumerate(phash_service.from_hex(h) for h in hashes):
+        for j, distance in tree.search(value, max_distance):
+            pairs.append((j, i, 1.0 - distance / phash_service.HASH_BITS))
+        tree.add(value, i)
+    return pairs
+
+
+def similar_pairs(matrix: np.ndarray, threshold: float, block_size: int = BLOCK_SIZE):
+    """
+    Yields (i, j, similarity) arrays for every pair i < j of normalised rows above `threshold`.
+    Similarities are computed tile by tile so memory stays at block_size² floats.
+    """
+    n = len(matrix)
+    for row_start in range(0, n, block_size):
+        rows = matrix[row_start:row_start + block_size]
+        for col_start in range(row_start, n, block_size):
+            sims = rows @ matrix[col_start:col_start + block_size].T
+            i, j = np.nonzero(sims > threshold)
+            i += row_start
+            j += col_start
+            upper = j > i
+            if upper.any():
+                yield i[upper], j[upper], sims[i[upper] - row_start, j[upper] - col_start]
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def group_pairs(pairs: list) -> list:
+    """Merges (i, j, similarity) edges with union-find into [(member_indices, best_similarity)]."""
+    if not pairs:
+        return []
+    sets = UnionFind(max(max(a, b) for a, b, _ in pairs) + 1)
+    for a, b, _ in pairs:
+        sets.union(a, b)
+
+    members, best = {}, {}
+    for a, b, sim in pairs:
+        root = sets.find(a)
+        members.setdefault(root, set()).update((a, b))
+        best[root] = max(best.get(root, sim), sim)
+    return sorted((sorted(members[root]), best[root]) for root in members)
+
+
+def group_duplicates(matrix: np.ndarray, threshold: float = DUPLICATE_THRESHOLD, block_size: int = BLOCK_SIZE) -> list:
+    """Returns [(member_indices, best_similarity)] for every connected group of near-identical rows."""
+    pairs = []
+    for i, j, sims in similar_pairs(matrix, threshold, block_size):
+        pairs.extend(zip(i.tolist(), j.tolist(), sims.tolist()))
+    return group_pairs(pairs)
+
+
+def find_duplicate_files(user_id=None, event_id=None, threshold: float = DUPLICATE_THRESHOLD,
+                         max_hash_distance: int = PHASH_MAX_DISTANCE):
+    """
+    Groups files that are near-duplicates by face embeddings or by perceptual hash.
+    The hash pass also catches burst shots with no detectable faces.
+    """
     embeddings = get_all_file_embeddings(user_id, event_id)
+    hashes = get_all_file_hashes(user_id, event_id)
+
+    nodes, paths = {}, {}
+    for entry in embeddings + hashes:
+        nodes.setdefault(entry["file_id"], len(nodes))
+        paths[entry["file_id"]] = entry["path"]
+    file_ids = list(nodes)
+
+    pairs = []
+    if len(embeddings) > 1:
+        matrix = normalize_vectors(np.stack([e["vector"] for e in embeddings]))
+        for i, j, sims in similar_pairs(matrix, threshold):
+            pairs.extend(
+                (nodes[embeddings[a]["file_id"]], nodes[embeddings[b]["file_id"]], sim)
+                for a, b, sim in zip(i.tolist(), j.tolist(), sims.tolist())
+            )
+    for a, b, sim in hash_pairs([h["phash"] for h in hashes], max_hash_distance):
+        pairs.append((nodes[hashes[a]["file_id"]], nodes[hashes[b]["file_id"]], sim))
+
     duplicates = []
-    visited = set()
-
-    for i in range(len(embeddings)):
-        for j in range(i + 1, len(embeddings)):
-            file1 = embeddings[i]
-            file2 = embeddings[j]
-            sim = cosine_similarity(file1["vector"], file2["vector"])
-
-            if sim > DUPLICATE_THRESHOLD:
-                key = frozenset([file1["file_id"], file2["file_id"]])
-                if key not in visited:
-                    visited.add(key)
-                    duplicates.append({
-                        "file_ids": [file1["file_id"], file2["file_id"]],
-                        "similarity": round(sim, 4),
-                        "paths": [file1["path"], file2["path"]]
-                    })
+    for indices, similarity in group_pairs(pairs):
+        duplicates.append({
+            "file_ids": [file_ids[i] for i in indices],
+            "similarity": round(float(similarity), 4),
+            "paths": [paths[file_ids[i]] for i in indices]
+        })
     return duplicates
 
 
 def delete_files(file_ids):
     deleted = []
     for fid in file_ids:
-        file = db["file"].find_one({"_id": ObjectId(fid)})
+        file_id = parse_file_id(fid)
+        file = db.files.find_one({"_id": file_id})
         if file:
-            db["file"].delete_one({"_id": ObjectId(fid)})
-            db["embeddings"].delete_one({"_id": file["embeddings_id"]})
-            db["chunk"].delete_many({"file_id": ObjectId(fid)})
-            db["file_metadata"].delete_one({"file_id": ObjectId(fid)})
+            storage = file_service.release_file_storage(file)
+            if storage:
+                file_service.purge_file_storage(storage)
+            db.files.delete_one({"_id": file_id})
+            db.file_metadata.delete_one({"file_id": file_id})
+            generation = index_service.remove_file(file.get("event_id"), file_id)
+            ann_service.remove_file(file_id)
+            phash_service.remove_file(file.get("event_id"), file_id, file.get("phash"), generation)
             deleted.append(str(fid))
     return deleted
@@ -1,19 +1,11 @@
 import torch
 import numpy as np
+from typing import Union
 from PIL import Image
-from facenet_pytorch import InceptionResnetV1, MTCNN
 from torchvision import transforms
 from app.config import Config
-
-# Load model once on module load
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-model = InceptionResnetV1(pretrained=None).to(device)
-model.load_state_dict(torch.load(Config.MODEL_PATH, map_location=device), strict=False)
-model.eval()
-
-# Initialize MTCNN for face detection
-mtcnn = MTCNN(keep_all=True, device=device)
+from app.services import model_registry
+from app.services.image_service import DecodedImage
 
 # Transform for resizing and normalization
 face_transform = transforms.Compose([
@@ -22,27 +14,80 @@ face_transform = transforms.Compose([
     transforms.Normalize([0.5], [0.5])
 ])
 
-def extract_embeddings(image: Image.Image) -> list:
-    """Extract face embeddings from a PIL Image object."""
-    try:
-        image = image.convert("RGB")
-        boxes, _ = mtcnn.detect(image)
+def embed_faces(faces: list, batch_size: int = None) -> np.ndarray:
+    """
+    Embed face crops with as few forward passes as possible.
+    Crops are stacked into batches of `batch_size` (default Config.EMBEDDING_BATCH_SIZE).
+    Returns an (n_faces, 512) array.
+    """
+    if not faces:
+        return np.empty((0, 512), dtype=np.float32)
+
+    batch_size = max(1, batch_size or Config.EMBEDDING_BATCH_SIZE)
+    model = model_registry.get_embedder()
+    device = model_registry.get_device()
+    outputs = []
+    with torch.no_grad():
+        for start in range(0, len(faces), batch_size):
+            batch = torch.stack([face_transform(face) for face in faces[start:start + batch_size]]).to(device)
+            outputs.append(model(batch).cpu().numpy())
+    return np.concatenate(outputs)
 
-        if boxes is None:
-            return []
+def detection_proxy(image: Image.Image, max_side: int = None) -> tuple:
+    """
+    (proxy, scale): the image downscaled so its longest side is at most `max_side`
+    (Config.DETECTION_MAX_SIDE; 0 = no limit), and the proxy/original size ratio.
+    MTCNN's image pyramid costs grow with the pixel count, so 24 MP frames are
+    detected on the proxy.
+    """
+    max_side = Config.DETECTION_MAX_SIDE if max_side is None else max_side
+    longest = max(image.size)
+    if not max_side or longest <= max_side:
+        return image, 1.0
+    scale = max_side / longest
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.BILINEAR, reducing_gap=2.0), scale
 
-        embeddings = []
-        for (x1, y1, x2, y2) in boxes:
-            cropped_face = image.crop((int(x1), int(y1), int(x2), int(y2)))
-            tensor = face_transform(cropped_face).unsqueeze(0).to(device)
-            with torch.no_grad():
-                embedding = model(tensor).cpu().numpy().flatten()
-            embeddings.append(embedding.tolist())
+def detect_boxes(image: Image.Image, max_side: int = None) -> np.ndarray:
+    """(faces, 4) x1, y1, x2, y2 boxes in `image` coordinates, detected on its proxy."""
+    proxy, scale = detection_proxy(image, max_side)
+    boxes, _ = model_registry.get_detector().detect(proxy)
+    if boxes is None:
+        return np.empty((0, 4), dtype=np.float32)
+    return np.asarray(boxes, dtype=np.float32) / scale
 
-        return embeddings
+def detect_faces_with_boxes(image: Union[Image.Image, DecodedImage]) -> tuple:
+    """
+    Face crops from the full-resolution image and their (faces, 4) boxes. A DecodedImage
+    is detected on its proxy, and its full image is only decoded when there are faces to crop.
+    """
+    if isinstance(image, DecodedImage):
+        boxes = detect_boxes(image.proxy) / image.scale
+        full = image.full if len(boxes) else None
+    else:
+        full = image.convert("RGB")
+        boxes = detect_boxes(full)
+    crops = [full.crop((int(x1), int(y1), int(x2), int(y2))) for (x1, y1, x2, y2) in boxes]
+    return crops, boxes
+
+def detect_faces(image: Union[Image.Image, DecodedImage]) -> list:
+    """Face crops found by MTCNN in a PIL Image or DecodedImage (empty when there are none)."""
+    return detect_faces_with_boxes(image)[0]
+
+def extract_faces(image: Union[Image.Image, DecodedImage]) -> tuple:
+    """(embeddings, boxes) for the faces in an image; ([], None) when there are none or detection fails."""
+    try:
+        faces, boxes = detect_faces_with_boxes(image)
+        if not faces:
+            return [], None
+        return embed_faces(faces).tolist(), boxes
     except Exception as e:
         print(f"[Embedding Extraction Error] {e}")
-        return []
+        return [], None
+
+def extract_embeddings(image: Image.Image) -> list:
+    """Extract face embeddings from a PIL Image object."""
+    return extract_faces(image)[0]
 
 def compare_embeddings(embedding1: list, embedding2: list, threshold: float = 0.6) -> bool:
     """Compare two embeddings and return True if they match within threshold."""
@@ -0,0 +1,154 @@
+# app/services/embedding_store.py
+
+import numpy as np
+from bson import Binary, ObjectId
+from typing import Dict, Iterable, Optional
+
+from app.db import db
+from app.config import Config
+
+DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2"), "int8": np.dtype("i1")}
+
+# Fields a reader needs to decode an embeddings document
+PROJECTION = {"embeddings_vector": 1, "dim": 1, "dtype": 1, "scales": 1}
+
+# File/face document field holding inline vectors (EMBEDDING_STORAGE_MODE=inline)
+INLINE_FIELD = "face_vectors"
+
+# Fields a reader needs to resolve a file or face document's vectors in either mode
+DOCUMENT_PROJECTION = {"embeddings_id": 1, INLINE_FIELD: 1}
+
+
+def pack(vectors, dtype: str = None) -> dict:
+    """
+    Embedding fields for a (faces, dim) matrix: the values as one packed `Binary`
+    plus `dim`, `count` and `dtype`. int8 stores a float32 scale per row alongside.
+    """
+    dtype = dtype or Config.EMBEDDING_STORAGE_DTYPE
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+    fields = {"dim": int(matrix.shape[1]), "count": int(matrix.shape[0]), "dtype": dtype}
+
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.size else np.empty(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1.0).astype("<f4")
+        values = np.round(matrix / scales[:, None]).clip(-127, 127)
+        fields["scales"] = Binary(scales.tobytes())
+    else:
+        values = matrix
+    fields["embeddings_vector"] = Binary(np.ascontiguousarray(values, dtype=DTYPES[dtype]).tobytes())
+    return fields
+
+
+def unpack(doc: dict) -> np.ndarray:
+    """
+    The (faces, dim) matrix of an embeddings document. Packed float32 values are
+    wrapped with np.frombuffer without copying (the result is read-only); documents
+    still holding BSON arrays of doubles are converted as before.
+    """
+    stored = doc.get("embeddings_vector")
+    if stored is None:
+        return np.empty((0, 0), dtype=np.float32)
+    if not isinstance(stored, bytes):
+        matrix = np.asarray(stored, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+        return matrix
+
+    dtype = doc.get("dtype", "float32")
+    dim = doc.get("dim") or 0
+    values = np.frombuffer(stored, dtype=DTYPES[dtype])
+    values = values.reshape(-1, dim) if dim else values.reshape(0, 0)
+    if dtype == "float32":
+        return values
+    if dtype == "int8":
+        scales = np.frombuffer(doc["scales"], dtype="<f4")
+        return values.astype(np.float32) * scales[:, None]
+    return values.astype(np.float32)
+
+
+def insert_embedding(vectors, **owner) -> object:
+    """Stores vectors for a file (`file_id=`) or face (`face_id=`). Returns the document id."""
+    return db.embeddings.insert_one({**pack(vectors), **owner}).inserted_id
+
+
+def get_embedding(embedding_id) -> Optional[np.ndarray]:
+    doc = db.embeddings.find_one({"_id": embedding_id}, PROJECTION)
+    return unpack(doc) if doc else None
+
+
+def load_embeddings(embedding_ids: Iterable) -> Dict[object, np.ndarray]:
+    """{embedding_id: matrix} for many documents in one query; empty embeddings are left out."""
+    embedding_ids = list(embedding_ids)
+    if not embedding_ids:
+        return {}
+    found = {}
+    for doc in db.embeddings.find({"_id": {"$in": embedding_ids}}, PROJECTION):
+        matrix = unpack(doc)
+        if len(matrix):
+            found[doc["_id"]] = matrix
+    return found
+
+
+# ========== Inline Storage ==========
+
+def pack_inline(vectors, boxes=None, embedding_id=None) -> dict:
+    """
+    The `face_vectors` sub-document: packed vectors plus, when known, the (faces, 4)
+    detection boxes as float32 x1, y1, x2, y2. Its `_id` orders writes like an
+    embeddings document's would (the ANN index catches up on it).
+    """
+    fields = {"_id": embedding_id or ObjectId(), **pack(vectors)}
+    if boxes is not None:
+        fields["boxes"] = Binary(np.ascontiguousarray(boxes, dtype="<f4").reshape(-1, 4).tobytes())
+    return fields
+
+
+def unpack_boxes(doc: dict) -> Optional[np.ndarray]:
+    """(faces, 4) boxes of a `face_vectors` sub-document, None when they were not stored."""
+    stored = (doc or {}).get("boxes")
+    if stored is None:
+        return None
+    return np.frombuffer(stored, dtype="<f4").reshape(-1, 4)
+
+
+def attach_fields(vectors, boxes=None, **owner) -> dict:
+    """
+    Fields that attach vectors to a file (`file_id=`) or face (`face_id=`) document.
+    Inline mode packs them into the document so the caller's one insert or update
+    writes everything; collection mode inserts an embeddings document and links it.
+    """
+    if Config.EMBEDDING_STORAGE_MODE == "inline":
+        return {INLINE_FIELD: pack_inline(vectors, boxes), "embeddings_id": None}
+    return {"embeddings_id": insert_embedding(vectors, **owner)}
+
+
+def document_vectors(doc: dict) -> Optional[np.ndarray]:
+    """Vectors of a file or face document: inline when present, else its embeddings document."""
+    if doc.get(INLINE_FIELD):
+        return unpack(doc[INLINE_FIELD])
+    if doc.get("embeddings_id"):
+        return get_embedding(doc["embeddings_id"])
+    return None
+
+
+def load_document_vectors(docs: Iterable[dict]) -> Dict[object, np.ndarray]:
+    """
+    {document _id: matrix} for documents read with DOCUMENT_PROJECTION. Inline vectors
+    decode in place; the rest are joined in one query. Empty embeddings are left out.
+    """
+    found, linked = {}, {}
+    for doc in docs:
+        if doc.get(INLINE_FIELD):
+            matrix = unpack(doc[INLINE_FIELD])
+            if len(matrix):
+                found[doc["_id"]] = matrix
+        elif doc.get("embeddings_id"):
+            linked.setdefault(doc["embeddings_id"], []).append(doc["_id"])
+    for embedding_id, matrix in load_embeddings(linked).items():
+        for doc_id in linked[embedding_id]:
+            found[doc_id] = matrix
+    return found
@@ -1,36 +1,21 @@
 import os
 import hashlib
-from PIL import Image
-import torch
 import numpy as np
-from facenet_pytorch import InceptionResnetV1, MTCNN
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from bson import ObjectId
-from sklearn.metrics.pairwise import cosine_similarity
 import base64
 from app.config import Config
 from app.db import db
+from app.services import cache_service, embedding_service, embedding_store, index_service, inference_service, rendition_service
+from app.services.id_service import get_next_sequence
+from app.services.image_service import DecodedImage
+from app.utils import clamp_limit, decode_cursor, encode_cursor, parse_file_id
 from typing import Union, List
 
-# ========== Initialize Models ==========
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model = InceptionResnetV1(pretrained=None).to(device)
-model.load_state_dict(torch.load(Config.MODEL_PATH, map_location=device), strict=False)
-model.eval()
-mtcnn = MTCNN(keep_all=True, device=device)
-
 # ========== Helpers ==========
 
-def get_next_sequence(name: str) -> int:
-    counter = db.counters.find_one_and_update(
-        {"_id": name},
-        {"$inc": {"sequence_value": 1}},
-        upsert=True,
-        return_document=True
-    )
-    return counter["sequence_value"]
-
 def save_face_locally(file: bytes, filename: str) -> str:
     path = os.path.join(Config.LOCAL_STORAGE_PATH, 'faces')
     os.makedirs(path, exist_ok=True)
@@ -39,36 +24,56 @@ def save_face_locally(file: bytes, filename: str) -> str:
         f.write(file)
     return full_path
 
-def extract_face_embeddings(image_path: str, return_all=False) -> Union[np.ndarray, List[np.ndarray], None]:
-    image = Image.open(image_path).convert('RGB')
-    boxes, _ = mtcnn.detect(image)
-
-    if boxes is None or len(boxes) == 0:
+def extract_face_embeddings(image: Union[str, bytes, DecodedImage], return_all=False) -> Union[np.ndarray, List[np.ndarray], None]:
+    """
+    Face vectors of an image path, its bytes or an already DecodedImage. Detection runs
+    on the decoded proxy; faces are cropped from the full-resolution image.
+    """
+    if inference_service.is_running():
+        source = image.source if isinstance(image, DecodedImage) else image
+        vectors = inference_service.embed(**({"data": source} if isinstance(source, bytes) else {"path": source}))
+        if not len(vectors):
+            return None
+        return list(vectors) if return_all else vectors[0]
+
+    # Same detection, crop and normalisation as the pool workers and the file pipeline,
+    # so query vectors live in the same space as the stored ones
+    decoded = image if isinstance(image, DecodedImage) else DecodedImage(image)
+    faces, _ = embedding_service.detect_faces_with_boxes(decoded)
+    if not faces:
         return None
 
-    embeddings = []
-    for box in boxes:
-        (x1, y1, x2, y2) = box
-        face = image.crop((int(x1), int(y1), int(x2), int(y2)))
-        face = face.resize((160, 160))
-        face_tensor = torch.tensor(np.array(face)).permute(2, 0, 1).float().div(255).unsqueeze(0).to(device)
-
-        with torch.no_grad():
-            embedding = model(face_tensor).cpu().numpy().flatten()
-        embeddings.append(embedding)
-
-        if not return_all:
-            break
-
-    return embeddings if return_all else embeddings[0]
+    vectors = embedding_service.embed_faces(faces if return_all else faces[:1])
+    return list(vectors) if return_all else vectors[0]
 
 # ========== Core Service ==========
 
 def handle_face_upload(file: bytes, filename: str, owner_id: str, event_id: str) -> Union[str, None]:
     file_path = save_face_locally(file, filename)
     file_hash = hashlib.sha256(file).hexdigest()
-    embedding_vectors = extract_face_embeddings(file_path, return_all=True)
+    # Decoded from the bytes in hand rather than re-read from disk
+    embedding_vectors = extract_face_embeddings(file, return_all=True)
+    return register_face(file_path, file_hash, owner_id, event_id, embedding_vectors)
+
+
+async def handle_face_upload_async(file: bytes, filename: str, owner_id: str, event_id: str) -> Union[str, None]:
+    """
+    handle_face_upload for request handlers: embeds through the async inference client
+    so the event loop keeps serving while a worker process runs the models.
+    """
+    if not inference_service.is_running():
+        return await run_in_threadpool(handle_face_upload, file, filename, owner_id, event_id)
+    file_path = save_face_locally(file, filename)
+    file_hash = hashlib.sha256(file).hexdigest()
+    try:
+        vectors = await inference_service.embed_async(data=file)
+    except inference_service.InferenceBusy:
+        raise HTTPException(status_code=503, detail="Face detection is busy, retry later", headers={"Retry-After": "2"})
+    return register_face(file_path, file_hash, owner_id, event_id, list(vectors))
+
 
+def register_face(file_path: str, file_hash: str, owner_id: str, event_id: str, embedding_vectors: list) -> Union[str, None]:
+    """Stores the face document with its embeddings attached, in one insert. None when no face was detected."""
     if not embedding_vectors:
         return None
 
@@ -79,22 +84,11 @@ def handle_face_upload(file: bytes, filename: str, owner_id: str, event_id: str)
         "path": file_path,
         "file_hash": file_hash,
         "owner_id": ObjectId(owner_id),
-        "embeddings_id": None,
-        "event_id": event_id
+        "event_id": event_id,
+        **embedding_store.attach_fields(np.stack(embedding_vectors), face_id=next_face_id)
     }
     db.faces.insert_one(face_doc)
 
-    embedding_doc = {
-        "embeddings_vector": [vec.tolist() for vec in embedding_vectors],  # Store list of embeddings
-        "face_id": next_face_id
-    }
-    embedding_id = db.embeddings.insert_one(embedding_doc).inserted_id
-
-    db.faces.update_one(
-        {"_id": next_face_id},
-        {"$set": {"embeddings_id": embedding_id}}
-    )
-
     return str(next_face_id)
 
 
@@ -105,65 +99,106 @@ def get_face_embedding_by_id(face_id: str) -> Union[List[float], None]:
         print(f"[get_face_embedding_by_id] Invalid face_id format.")
         return None
 
-    face = db.faces.find_one({"_id": face_id})
-    if face and face.get("embeddings_id"):
-        embedding = db.embeddings.find_one({"_id": face["embeddings_id"]})
-        if embedding:
-            return embedding["embeddings_vector"]
-    return None
-
-
-
-def match_face_with_files(face_id: str, event_id: str):
+    face = db.faces.find_one({"_id": face_id}, embedding_store.DOCUMENT_PROJECTION)
+    embedding = embedding_store.document_vectors(face) if face else None
+    return embedding.tolist() if embedding is not None else None
+
+
+
+def ranked_matches(face_id: str, event_id: str, query_embedding: np.ndarray, threshold: float, top_k: int = None) -> list:
+    """
+    (file_id, similarity) pairs for the face, served from the match cache when the
+    event hasn't changed since they were computed.
+    """
+    generation = cache_service.event_generation(event_id) if Config.MATCH_CACHE_ENABLED else None
+    if generation is None:
+        return index_service.search_event(event_id, query_embedding, threshold, top_k)
+
+    def compute():
+        matches = index_service.search_event(event_id, query_embedding, threshold, top_k, generation)
+        return [[str(file_id), similarity] for file_id, similarity in matches]
+
+    key = cache_service.match_cache_key(face_id, event_id, threshold, generation, top_k)
+    cached = cache_service.get_or_compute_match_result(key, compute)
+    return [(parse_file_id(file_id), similarity) for file_id, similarity in cached]
+
+
+def match_face_with_files(
+    face_id: str,
+    event_id: str,
+    limit: int = None,
+    cursor: str = None,
+    top_k: int = None,
+    inline: bool = False
+) -> dict:
+    """
+    Ranks the event's files against the face and returns one page of references
+    (file id, similarity, rendition and download URLs), best match first.
+    `cursor` is the previous page's `next_cursor`; `top_k` caps the ranking itself.
+    `inline` adds base64 previews, limited to small pages and a byte budget.
+    """
     query_embedding = get_face_embedding_by_id(face_id)
     if query_embedding is None or len(query_embedding) == 0:
         raise HTTPException(status_code=404, detail="Face embedding not found or empty.")
 
-    query_embedding = np.array(query_embedding).reshape(1, -1)
-    if query_embedding.shape[1] == 0:
+    query_embedding = np.array(query_embedding, dtype=np.float32)
+    if query_embedding.shape[-1] == 0:
         raise HTTPException(status_code=400, detail="Query embedding has zero features.")
 
-    files = db.files.find({"event_id": event_id})
-    threshold = 0.6  # Similarity threshold
-
-    matched_images = []
+    matches = ranked_matches(face_id, event_id, query_embedding, Config.MATCH_THRESHOLD, top_k)
+    if not matches:
+        raise HTTPException(status_code=404, detail="No matching image found above the threshold.")
 
-    for file_doc in files:
-        embedding_data = db.embeddings.find_one({"file_id": file_doc["_id"]})
-        if not embedding_data:
+    # Keyset over (similarity desc, file id) so pages stay stable as files are added
+    matches.sort(key=lambda match: (-match[1], str(match[0])))
+    limit = clamp_limit(limit, Config.MATCH_PAGE_SIZE, Config.MATCH_MAX_PAGE_SIZE)
+    if inline:
+        limit = min(limit, Config.MATCH_INLINE_MAX_RESULTS)
+    position = decode_cursor(cursor)
+    if position:
+        after = (-float(position.get("s", 0)), str(position.get("id", "")))
+        matches = [match for match in matches if (-match[1], str(match[0])) > after]
+    page, has_more = matches[:limit], len(matches) > limit
+
+    results = [
+        {
+            "file_id": str(file_id),
+            "similarity": similarity,
+            "download_url": f"/api/reconstruct-file/{file_id}",
+            **rendition_service.rendition_urls(file_id)
+        }
+        for file_id, similarity in page
+    ]
+    if inline:
+        inline_previews(page, results)
+
+    next_cursor = None
+    if has_more and page:
+        next_cursor = encode_cursor({"s": page[-1][1], "id": str(page[-1][0])})
+    return {"face_id": str(face_id), "event_id": event_id, "matches": results, "next_cursor": next_cursor}
+
+
+def inline_previews(page: list, results: List[dict]):
+    """Adds `image_base64` previews to `results` until MATCH_INLINE_MAX_BYTES is spent."""
+    file_docs = {
+        file_doc["_id"]: file_doc
+        for file_doc in db.files.find({"_id": {"$in": [file_id for file_id, _ in page]}}, {"path": 1, "storage_ref": 1})
+    }
+    budget = Config.MATCH_INLINE_MAX_BYTES
+    for (file_id, _), result in zip(page, results):
+        file_doc = file_docs.get(file_id)
+        if not file_doc:
             continue
-
-        embeddings_list = embedding_data.get("embeddings_vector")
-        if not embeddings_list:
+        storage_id = file_doc.get("storage_ref") or file_id
+        path = rendition_service.get_rendition(storage_id, file_doc["path"], "preview") or file_doc["path"]
+        try:
+            if os.path.getsize(path) > budget:
+                result["inline_truncated"] = True
+                break
+            with open(path, "rb") as f:
+                data = f.read()
+        except Exception as e:
+            print(f"Error reading file {path}: {e}")
             continue
-
-        for emb in embeddings_list:
-            db_embedding = np.array(emb).reshape(1, -1)
-            if db_embedding.shape[1] != query_embedding.shape[1]:
-                continue
-
-            similarity = cosine_similarity(query_embedding, db_embedding)[0][0]
-
-            if similarity >= threshold:
-                try:
-                    with open(file_doc["path"], "rb") as f:
-                        encoded = base64.b64encode(f.read()).decode("utf-8")
-                        matched_images.append({
-                            "image_base64": encoded,
-                            "similarity": similarity
-                        })
-                    break  # One match per file is enough
-                except Exception as e:
-                    print(f"Error reading file {file_doc['path']}: {e}")
-                continue
-
-    if not matched_images:
-        raise HTTPException(status_code=404, detail="No matching image found above the threshold.")
-
-    return {"matched_images": matched_images}
-
-
-
-
-
-
+        budget -= len(data)
+        result["image_base64"] = base64.b64encode(data).decode("utf-8")
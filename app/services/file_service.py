@@ -1,112 +1,21 @@
 import os
-import io
-import numpy as np
 import hashlib
-from PIL import Image, UnidentifiedImageError  
+import mimetypes
 from fastapi import UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from typing import Union
 from app.db import db
 from app.config import Config
-from app.services.chunk_service import chunk_image_bytes, reconstruct_file_from_chunks
-from app.services.embedding_service import extract_embeddings
+from app.services import chunk_service
+from app.services.chunk_service import ChunkWriter, reconstruct_file_from_chunks
 from bson.json_util import dumps
-from app.services import face_service
-from fastapi.responses import FileResponse, JSONResponse
-
-def get_next_sequence(name: str) -> int:
-    counter = db.counters.find_one_and_update(
-        {"_id": name},
-        {"$inc": {"sequence_value": 1}},
-        upsert=True,
-        return_document=True
-    )
-    return counter["sequence_value"]
-
-# async def handle_file_upload(upload_file: UploadFile, user_id: str, event_id: str):
-#     try:
-#         valid_extensions = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tiff', 'ico', 'svg']
-#         file_extension = os.path.splitext(upload_file.filename)[-1].lower()[1:]
-
-#         if file_extension not in valid_extensions:
-#             raise HTTPException(status_code=400, detail="Unsupported file type")
-
-#         file_bytes = await upload_file.read()
-
-#         event_folder = os.path.join(Config.LOCAL_STORAGE_PATH, f"event_{event_id}")
-#         os.makedirs(event_folder, exist_ok=True)
-
-#         filename = f"{ObjectId()}_{upload_file.filename}"
-#         local_path = os.path.join(event_folder, filename)
-#         with open(local_path, "wb") as f:
-#             f.write(file_bytes)
-
-#         chunks = chunk_image_bytes(file_bytes)
-#         chunk_ids = []
-#         for index, chunk_data in enumerate(chunks):
-#             chunk_id = ObjectId()
-#             db.chunks.insert_one({
-#                 "_id": chunk_id,
-#                 "file_id": None,
-#                 "chunk_index": index,
-#                 "chunk_data": chunk_data
-#             })
-#             chunk_ids.append(chunk_id)
-
-#         try:
-#             image = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-#             embeddings = extract_embeddings(image)
-#         except UnidentifiedImageError:
-#             embeddings = []
-#         except Exception as e:
-#             print("[Embedding Error]:", str(e))
-#             embeddings = []
-
-#         if isinstance(embeddings, np.ndarray):
-#             embeddings = [embeddings.tolist()]
-#         elif isinstance(embeddings, list):
-#             embeddings = [e.tolist() if isinstance(e, np.ndarray) else e for e in embeddings]
-#         else:
-#             embeddings = []
-
-#         next_file_id = get_next_sequence("file_id")
-#         file_doc = {
-#             "_id": next_file_id,
-#             "filename": upload_file.filename,
-#             "path": local_path,
-#             "file_version": 1,
-#             "owner_id": ObjectId(user_id),
-#             "event_id": event_id,
-#             "embeddings_id": None
-#         }
-#         db.files.insert_one(file_doc)
-
-#         embedding_doc = {
-#             "embeddings_vector": embeddings,
-#             "file_id": next_file_id
-#         }
-#         embedding_id = db.embeddings.insert_one(embedding_doc).inserted_id
-
-#         db.files.update_one(
-#             {"_id": next_file_id},
-#             {"$set": {"embeddings_id": embedding_id}}
-#         )
-
-#         db.chunks.update_many(
-#             {"_id": {"$in": chunk_ids}},
-#             {"$set": {"file_id": next_file_id}}
-#         )
-
-#         return {
-#             "status": "success",
-#             "file_id": str(next_file_id),
-#             "filename": upload_file.filename,
-#             "path": local_path,
-#             "event_folder": event_folder,
-#             "embedding_status": "created" if embeddings else "not created"
-#         }
-
-#     except Exception as e:
-#         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+from app.services import ann_service, embedding_store, index_service, inference_service, phash_service, pipeline_service, rendition_service
+from fastapi.responses import FileResponse, StreamingResponse
+from app.services.id_service import get_next_sequence
+from app.utils import after_id_filter, clamp_limit, id_cursor, parse_file_id, parse_range_header
 
 async def handle_file_upload(upload_file: UploadFile, user_id: str, event_id: str):
     try:
@@ -117,20 +26,6 @@ async def handle_file_upload(upload_file: UploadFile, user_id: str, event_id: st
         if file_extension not in valid_extensions:
             raise HTTPException(status_code=400, detail="Unsupported file type")
 
-        # Read file content
-        file_bytes = await upload_file.read()
-        
-        # Calculate file hash
-        file_hash = hashlib.sha256(file_bytes).hexdigest()
-        
-        # Check for existing file with same hash and same user (just for tracking)
-        existing_file = db.files.find_one({
-            "owner_id": ObjectId(user_id),
-            "content_hash": file_hash
-        })
-        
-        is_duplicate = existing_file is not None
-
         # Create event folder if not exists
         event_folder = os.path.join(Config.LOCAL_STORAGE_PATH, f"event_{event_id}")
         os.makedirs(event_folder, exist_ok=True)
@@ -138,79 +33,89 @@ async def handle_file_upload(upload_file: UploadFile, user_id: str, event_id: st
         # Generate unique filename even for duplicates
         filename = f"{ObjectId()}_{upload_file.filename}"
         local_path = os.path.join(event_folder, filename)
-        
-        # Save file locally
-        with open(local_path, "wb") as f:
-            f.write(file_bytes)
-
-        # Chunking logic (unchanged)
-        chunks = chunk_image_bytes(file_bytes)
-        chunk_ids = []
-        for index, chunk_data in enumerate(chunks):
-            chunk_id = ObjectId()
-            db.chunks.insert_one({
-                "_id": chunk_id,
-                "file_id": None,
-                "chunk_index": index,
-                "chunk_data": chunk_data
-            })
-            chunk_ids.append(chunk_id)
 
-        # Embedding extraction (unchanged)
-        try:
-            image = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-            embeddings = extract_embeddings(image)
-        except UnidentifiedImageError:
-            embeddings = []
-        except Exception as e:
-            print("[Embedding Error]:", str(e))
-            embeddings = []
+        # Back-pressure: refuse before reading the body when the embedding queue is full
+        if Config.EMBEDDING_WORKERS > 0 and not pipeline_service.has_capacity():
+            raise HTTPException(
+                status_code=503,
+                detail="Embedding queue is full, retry later",
+                headers={"Retry-After": "5"}
+            )
 
-        if isinstance(embeddings, np.ndarray):
-            embeddings = [embeddings.tolist()]
-        elif isinstance(embeddings, list):
-            embeddings = [e.tolist() if isinstance(e, np.ndarray) else e for e in embeddings]
-        else:
-            embeddings = []
+        # Hash while spooling to disk; nothing is stored until the dedup lookup has run
+        part_path = local_path + ".part"
+        file_hash, file_size = await spool_upload(upload_file, part_path)
 
-        # Get next file ID
-        next_file_id = get_next_sequence("file_id")
-
-        # Create file document with duplicate info
-        file_doc = {
-            "_id": next_file_id,
-            "filename": upload_file.filename,
-            "path": local_path,
-            "file_version": 1,
-            "owner_id": ObjectId(user_id),
-            "event_id": event_id,
-            "embeddings_id": None,
-            "content_hash": file_hash,
-            "is_duplicate": is_duplicate,
-            "original_file_id": existing_file["_id"] if is_duplicate else None,
-            "duplicate_upload_time": datetime.utcnow() if is_duplicate else None
-        }
-
-        db.files.insert_one(file_doc)
-
-        # Create embedding document
-        embedding_doc = {
-            "embeddings_vector": embeddings,
-            "file_id": next_file_id
-        }
-        embedding_id = db.embeddings.insert_one(embedding_doc).inserted_id
-
-        # Update file with embedding ID
-        db.files.update_one(
-            {"_id": next_file_id},
-            {"$set": {"embeddings_id": embedding_id}}
-        )
+        # Until the file document is in, a failure rolls back the spooled file and chunks
+        next_file_id, stored_path = None, part_path
+        try:
+            # Check for existing file with same hash and same user (owner_content_hash index)
+            existing_file = db.files.find_one({
+                "owner_id": ObjectId(user_id),
+                "content_hash": file_hash
+            })
 
-        # Update chunks with file ID
-        db.chunks.update_many(
-            {"_id": {"$in": chunk_ids}},
-            {"$set": {"file_id": next_file_id}}
-        )
+            is_duplicate = existing_file is not None
+
+            # Exact re-upload: share the original's storage, chunks and embeddings
+            if is_duplicate and Config.DEDUP_MODE == "reference":
+                discard_upload(None, part_path)
+                return create_file_reference(existing_file, upload_file.filename, user_id, event_id)
+
+            # New content: only now take a file id and write the chunks under it
+            next_file_id = get_next_sequence("file_id")
+            await run_in_threadpool(store_chunks, next_file_id, part_path)
+            os.replace(part_path, local_path)
+            stored_path = local_path
+
+            # Create file document with duplicate info
+            file_doc = {
+                "_id": next_file_id,
+                "filename": upload_file.filename,
+                "path": local_path,
+                "file_version": 1,
+                "owner_id": ObjectId(user_id),
+                "event_id": event_id,
+                "embeddings_id": None,
+                "embedding_status": pipeline_service.STATUS_PENDING,
+                "content_hash": file_hash,
+                "size": file_size,
+                "chunk_size": Config.CHUNK_SIZE,
+                "is_duplicate": is_duplicate,
+                "original_file_id": existing_file["_id"] if is_duplicate else None,
+                "duplicate_upload_time": datetime.utcnow() if is_duplicate else None
+            }
+
+            # Without a worker pool the vectors are computed before the insert, so the file
+            # document is written once with them attached (inline or via embeddings_id)
+            embeddings = None
+            if Config.EMBEDDING_WORKERS == 0:
+                try:
+                    if inference_service.is_running():
+                        embeddings = (await inference_service.embed_async(path=local_path)).tolist()
+                    fields, embeddings = await run_in_threadpool(pipeline_service.embed_file, next_file_id, local_path, embeddings)
+                    file_doc.update(fields)
+                except Exception as e:
+                    # No worker will pick the file up later, so a busy or failed pool is recorded
+                    # as failed (like process_job does) rather than left pending
+                    embeddings = None
+                    print(f"[Embedding Error] file {next_file_id}: {e}")
+                    file_doc.update(embedding_status=pipeline_service.STATUS_FAILED, embedding_error=str(e))
+
+            db.files.insert_one(file_doc)
+        except Exception:
+            await run_in_threadpool(discard_upload, next_file_id, stored_path)
+            raise
+
+        rendition_service.schedule_renditions(next_file_id, local_path)
+        embedding_status = file_doc["embedding_status"]
+
+        # Publish the vectors computed above, or hand the file to the embedding pipeline
+        if embeddings is not None:
+            pipeline_service.publish_file(event_id, next_file_id, embeddings, file_doc["phash"])
+        elif Config.EMBEDDING_WORKERS > 0:
+            if not pipeline_service.enqueue_file(next_file_id, local_path, event_id):
+                print(f"[Embedding Queue] full, file {next_file_id} left pending")
 
         return {
             "status": "success",
@@ -219,15 +124,166 @@ async def handle_file_upload(upload_file: UploadFile, user_id: str, event_id: st
             "path": local_path,
             "is_duplicate": is_duplicate,
             "original_file_id": str(existing_file["_id"]) if is_duplicate else None,
-            "embedding_status": "created" if embeddings else "not created"
+            "embedding_status": embedding_status
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
+async def spool_upload(upload_file: UploadFile, path: str, block_size: int = None) -> tuple:
+    """
+    Reads the upload in `block_size` blocks (Config.CHUNK_SIZE by default), updating the
+    SHA-256 and appending each block to `path`, so memory stays bounded by one block
+    whatever the file size. Hashing and the disk write run in the threadpool, so a large
+    upload doesn't hold up the event loop.
+    Returns (content_hash, size). The partial file is removed if the stream fails.
+    """
+    block_size = block_size or Config.CHUNK_SIZE
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                block = await upload_file.read(block_size)
+                if not block:
+                    break
+                await run_in_threadpool(spool_block, block, sha256, f)
+                size += len(block)
+    except Exception:
+        await run_in_threadpool(discard_upload, None, path)
+        raise
+    return sha256.hexdigest(), size
+
+def spool_block(block: bytes, sha256, f):
+    """Hashes one upload block and appends it to the spool file."""
+    sha256.update(block)
+    f.write(block)
+
+def store_chunks(file_id: int, path: str, chunk_size: int = None):
+    """
+    Writes the spooled file to the chunks collection under `file_id`, one
+    Config.CHUNK_SIZE chunk per block read. Blocking: call through the threadpool.
+    """
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+    with open(path, "rb") as f, ChunkWriter(file_id) as writer:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            writer.write(block)
+
+def discard_upload(file_id: Union[int, None], path: str):
+    """
+    Rolls back an upload that will not be stored: its file on disk and any chunks or
+    embeddings (written by inline embedding) under `file_id`.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    if file_id is not None:
+        db.chunks.delete_many({"file_id": file_id})
+        db.embeddings.delete_many({"file_id": file_id})
+
+def create_file_reference(original: dict, filename: str, user_id: str, event_id: str) -> dict:
+    """
+    Registers a byte-identical re-upload as a new file document that points at the
+    original's stored bytes, chunks and embeddings instead of copying them.
+    `file_refs` counts the references so deletes know when the bytes can go.
+    """
+    root_id = original.get("storage_ref") or original["_id"]
+    next_file_id = get_next_sequence("file_id")
+
+    file_doc = {
+        "_id": next_file_id,
+        "filename": filename,
+        "path": original["path"],
+        "file_version": 1,
+        "owner_id": ObjectId(user_id),
+        "event_id": event_id,
+        "embeddings_id": original.get("embeddings_id"),
+        "embedding_status": original.get("embedding_status", pipeline_service.STATUS_CREATED),
+        "content_hash": original["content_hash"],
+        "phash": original.get("phash"),
+        "size": original.get("size"),
+        "chunk_size": original.get("chunk_size"),
+        "storage_ref": root_id,
+        "is_duplicate": True,
+        "original_file_id": original["_id"],
+        "duplicate_upload_time": datetime.utcnow()
+    }
+    if original.get(embedding_store.INLINE_FIELD):
+        file_doc[embedding_store.INLINE_FIELD] = original[embedding_store.INLINE_FIELD]
+    db.file_refs.update_one({"_id": root_id}, {"$inc": {"count": 1}}, upsert=True)
+    db.files.insert_one(file_doc)
+
+    vectors = embedding_store.document_vectors(file_doc)
+    generation = index_service.add_file(event_id, next_file_id, vectors)
+    if vectors is not None:
+        ann_service.add_file(event_id, next_file_id, vectors)
+    phash_service.add_file(event_id, next_file_id, file_doc["phash"], generation)
+
+    return {
+        "status": "success",
+        "file_id": str(next_file_id),
+        "filename": filename,
+        "path": file_doc["path"],
+        "is_duplicate": True,
+        "original_file_id": str(original["_id"]),
+        "dedup": "reference",
+        "embedding_status": file_doc["embedding_status"]
+    }
+
+def release_file_storage(file_doc: dict) -> Union[dict, None]:
+    """
+    Drops `file_doc`'s claim on its stored bytes.
+    Returns {"file_id", "path"} of storage nobody references any more, or None while
+    other deduplicated uploads still point at it.
+    """
+    root_id = file_doc.get("storage_ref")
+    if root_id is None:
+        # Original being deleted: keep the bytes if references remain
+        refs = db.file_refs.find_one_and_update(
+            {"_id": file_doc["_id"], "count": {"$gt": 0}},
+            {"$set": {"root_deleted": True, "path": file_doc["path"]}}
+        )
+        if refs:
+            return None
+        db.file_refs.delete_one({"_id": file_doc["_id"]})
+        return {"file_id": file_doc["_id"], "path": file_doc["path"]}
+
+    refs = db.file_refs.find_one_and_update(
+        {"_id": root_id},
+        {"$inc": {"count": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if refs and refs["count"] <= 0:
+        db.file_refs.delete_one({"_id": root_id})
+        if refs.get("root_deleted"):
+            return {"file_id": root_id, "path": refs["path"]}
+    return None
+
+def purge_file_storage(storage: dict):
+    """Removes the bytes and renditions on disk plus the chunks and embeddings stored under `storage["file_id"]`."""
+    if os.path.exists(storage["path"]):
+        os.remove(storage["path"])
+    rendition_service.remove_renditions(storage["file_id"], storage["path"])
+    db.embeddings.delete_many({"file_id": storage["file_id"]})
+    db.chunks.delete_many({"file_id": storage["file_id"]})
+
+def page_files(query: dict, projection: dict, limit: int = None, cursor: str = None) -> tuple:
+    """
+    One `_id`-ordered page of file documents, resuming after `cursor`.
+    Returns (documents, next_cursor); next_cursor is None on the last page.
+    """
+    limit = clamp_limit(limit, Config.LISTING_PAGE_SIZE, Config.LISTING_MAX_PAGE_SIZE)
+    query = {**query, **after_id_filter(cursor)}
+    docs = list(db.files.find(query, projection).sort("_id", 1).limit(limit + 1))
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, id_cursor(docs[-1]["_id"])
+    return docs, None
+
 # Fetch files associated with a specific event and display in a gallery format
-def get_files_by_event(event_id: str):
-    files = db.files.find({"event_id": event_id})
+def get_files_by_event(event_id: str, limit: int = None, cursor: str = None):
+    files, next_cursor = page_files({"event_id": event_id}, {"path": 1}, limit, cursor)
     result = []
 
     for file in files:
@@ -237,14 +293,36 @@ def get_files_by_event(event_id: str):
                 "file_id": file["_id"],
                 "filename": filename,
                 "url": f"/files/{filename}",
+                "download_url": f"/api/reconstruct-file/{file['_id']}",
+                **rendition_service.rendition_urls(file["_id"]),
                 "delete_url": f"/delete/{file['_id']}",  # URL to delete the file
             })
 
-    return result
+    return {"files": result, "next_cursor": next_cursor}
+
+def get_rendition_file(file_id: str, name: str) -> FileResponse:
+    """Serves a gallery rendition, generating it on first request; falls back to the original."""
+    if name not in rendition_service.RENDITIONS:
+        raise HTTPException(status_code=404, detail="Unknown rendition")
+    file_doc = db.files.find_one({"_id": parse_file_id(file_id)}, {"path": 1, "storage_ref": 1})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not os.path.exists(file_doc["path"]):
+        raise HTTPException(status_code=404, detail="Original not found")
+
+    storage_id = file_doc.get("storage_ref") or file_doc["_id"]
+    path = rendition_service.get_rendition(storage_id, file_doc["path"], name)
+    if path is None:
+        return FileResponse(file_doc["path"])
+    return FileResponse(
+        path,
+        media_type=rendition_service.MEDIA_TYPES.get(Config.RENDITION_FORMAT),
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
 
 # Fetch all files uploaded by a user
-def get_files_by_user(user_id: str):
-    files = db.files.find({"owner_id": ObjectId(user_id)})
+def get_files_by_user(user_id: str, limit: int = None, cursor: str = None):
+    files, next_cursor = page_files({"owner_id": ObjectId(user_id)}, {"path": 1, "event_id": 1}, limit, cursor)
     result = []
     for file in files:
         result.append({
@@ -253,14 +331,11 @@ def get_files_by_user(user_id: str):
             "event_id": file.get("event_id"),
             "path": file["path"],
         })
-    return result
+    return {"files": result, "next_cursor": next_cursor}
 
 # Endpoint to delete a file (gallery delete option)
 def delete_user_file(file_id: str, user_id: str):
-    try:
-        file_id = ObjectId(file_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid file_id format")
+    file_id = parse_file_id(file_id)
 
     file_doc = db.files.find_one({"_id": file_id})
 
@@ -270,18 +345,59 @@ def delete_user_file(file_id: str, user_id: str):
     if str(file_doc["owner_id"]) != str(user_id):
         raise HTTPException(status_code=403, detail="Unauthorized to delete this file")
 
-    try:
-        if os.path.exists(file_doc["path"]):
-            os.remove(file_doc["path"])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
+    storage = release_file_storage(file_doc)
+    if storage:
+        try:
+            purge_file_storage(storage)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
 
     db.files.delete_one({"_id": file_id})
-    db.embeddings.delete_many({"file_id": file_id})
-    db.chunks.delete_many({"file_id": file_id})
+    generation = index_service.remove_file(file_doc.get("event_id"), file_id)
+    ann_service.remove_file(file_id)
+    phash_service.remove_file(file_doc.get("event_id"), file_id, file_doc.get("phash"), generation)
 
     return {"status": "success", "deleted_file_id": str(file_id)}
 
+def stream_file_from_chunks(file_id: str, range_header: str = None) -> StreamingResponse:
+    """
+    Streams a file straight from its stored chunks, honouring a single HTTP Range.
+    Deduplicated uploads are served from the chunks of the file they reference.
+    """
+    file_doc = db.files.find_one({"_id": parse_file_id(file_id)})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    storage_id = file_doc.get("storage_ref") or file_doc["_id"]
+    # References written before size/chunk_size were copied fall back to what is stored
+    chunk_size = file_doc.get("chunk_size") or chunk_service.stored_chunk_size(storage_id)
+    size = file_doc.get("size")
+    if size is None:
+        size = chunk_service.chunked_file_size(storage_id)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{file_doc["filename"]}"'
+    }
+    media_type = mimetypes.guess_type(file_doc["filename"])[0] or "application/octet-stream"
+    if size == 0:
+        return StreamingResponse(iter([b""]), media_type=media_type, headers={**headers, "Content-Length": "0"})
+
+    byte_range = parse_range_header(range_header, size)
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    return StreamingResponse(
+        chunk_service.iter_byte_range(storage_id, start, end, chunk_size),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
 def serve_file(filename: str):
     try:
         file_path = os.path.join(Config.LOCAL_STORAGE_PATH, filename)
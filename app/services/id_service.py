@@ -0,0 +1,72 @@
+# app/services/id_service.py
+
+import os
+import threading
+from pymongo import ReturnDocument
+
+from app.db import db
+from app.config import Config
+
+
+class SequenceAllocator:
+    """
+    Hi/lo allocation of the integer `_id`s kept in `db.counters`. One `$inc` by
+    `block_size` reserves a block of ids for this process, which then hands them
+    out from memory, so uploads don't all queue on the one counters document.
+    The counter still holds the highest id ever reserved, so ids never repeat,
+    including ids from before blocks were used. Ids stay unique and increasing
+    within a process, but processes interleave and ids left in a block at
+    shutdown are skipped.
+    """
+
+    def __init__(self, collection, block_size: int):
+        self.collection = collection
+        self.block_size = max(1, block_size)
+        self.pid = os.getpid()
+        self._blocks = {}  # name -> [next id, last reserved id]
+        self._lock = threading.Lock()
+        self.stats = {"allocated": 0, "round_trips": 0}
+
+    def reserve(self, name: str, size: int) -> range:
+        """Reserves `size` consecutive ids with one counters update."""
+        counter = self.collection.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"sequence_value": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.stats["round_trips"] += 1
+        high = counter["sequence_value"]
+        return range(high - size + 1, high + 1)
+
+    def next(self, name: str) -> int:
+        with self._lock:
+            block = self._blocks.get(name)
+            if block is None or block[0] > block[1]:
+                reserved = self.reserve(name, self.block_size)
+                block = self._blocks[name] = [reserved.start, reserved.stop - 1]
+            value = block[0]
+            block[0] += 1
+            self.stats["allocated"] += 1
+            return value
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator() -> SequenceAllocator:
+    """The process-wide allocator. A forked child starts a fresh one rather than reuse the parent's blocks."""
+    global _allocator
+    if _allocator is not None and _allocator.pid == os.getpid():
+        return _allocator
+    with _allocator_lock:
+        if _allocator is None or _allocator.pid != os.getpid():
+            _allocator = SequenceAllocator(db.counters, Config.ID_BLOCK_SIZE)
+    return _allocator
+
+
+def get_next_sequence(name: str) -> int:
+    """Next integer id for `name` ("file_id", "face_id")."""
+    return get_allocator().next(name)
+
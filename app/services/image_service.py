@@ -0,0 +1,77 @@
+# app/services/image_service.py
+
+import io
+import math
+import threading
+from typing import Union
+from PIL import Image
+
+from app.config import Config
+
+# EXIF orientation -> transpose that puts the image upright (as ImageOps.exif_transpose)
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# Orientations that swap width and height (90/270 degree rotations)
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class DecodedImage:
+    """
+    One decode of an upload, shared by everything that reads it during a request or job.
+    `proxy` is what detection needs: JPEGs are decoded with draft mode, which has libjpeg
+    scale by 1/2, 1/4 or 1/8 inside the DCT, down to about DETECTION_MAX_SIDE. `full` is
+    decoded on first access only, e.g. once faces have been found and need cropping;
+    without a size cap it is the proxy itself. EXIF orientation is applied to both, so
+    sizes and boxes are in display orientation.
+    """
+
+    def __init__(self, source: Union[str, bytes], max_side: int = None):
+        self.source = source
+        self.max_side = Config.DETECTION_MAX_SIDE if max_side is None else max_side
+        self._full = None
+        self._lock = threading.Lock()
+
+        with self._open() as image:
+            width, height = image.size
+            self.orientation = image.getexif().get(0x0112, 1)
+            self.size = (height, width) if self.orientation in TRANSPOSED_ORIENTATIONS else (width, height)
+            if self.max_side and max(width, height) > self.max_side:
+                ratio = self.max_side / max(width, height)
+                image.draft("RGB", (math.ceil(width * ratio), math.ceil(height * ratio)))
+            self.proxy = self._upright(image)
+
+        if self.proxy.size == self.size:
+            self._full = self.proxy
+        # proxy / original; boxes found on the proxy divide by this
+        self.scale = self.proxy.width / self.size[0]
+
+    def _open(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.source) if isinstance(self.source, bytes) else self.source)
+
+    def _upright(self, image: Image.Image) -> Image.Image:
+        """RGB in display orientation, copying only when a conversion or rotation needs it."""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.load()
+        transpose = ORIENTATION_TRANSPOSE.get(self.orientation)
+        return image.transpose(transpose) if transpose is not None else image
+
+    @property
+    def full(self) -> Image.Image:
+        if self._full is None:
+            with self._lock:
+                if self._full is None:
+                    with self._open() as image:
+                        self._full = self._upright(image)
+        return self._full
+
+    @property
+    def megapixels(self) -> float:
+        return self.size[0] * self.size[1] / 1e6
@@ -0,0 +1,358 @@
+# app/services/index_service.py
+
+import time
+import logging
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+from bson import ObjectId
+
+from app.db import db
+from app.config import Config
+from app.services import cache_service, embedding_store, pq_codec, shard_service
+
+logger = logging.getLogger(__name__)
+
+FileId = Union[int, str, ObjectId]
+
+
+def normalize_vectors(vectors) -> np.ndarray:
+    """
+    Returns `vectors` as a contiguous (n, dim) float32 matrix with L2-normalised rows.
+    Accepts a single flat vector or a list of vectors.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.ascontiguousarray(matrix / (norms + 1e-10), dtype=np.float32)
+
+
+class EventFaceIndex:
+    """
+    All face vectors of one event stacked into a single normalised float32 matrix.
+    `owners[row]` is a slot into `file_ids`, so every row maps back to its file.
+    `generation` is the event generation the contents reflect (None if unknown).
+    With a `quantizer` the rows are product-quantised uint8 codes scored by ADC.
+    A `shared` index maps its rows read-only from an on-disk shard (see from_shard);
+    `unsaved_since` is when it first took a change its shard doesn't have yet.
+    """
+
+    def __init__(self, event_id: str, generation: Optional[int] = None, quantizer: Optional[pq_codec.ProductQuantizer] = None):
+        self.event_id = event_id
+        self.generation = generation
+        self.quantizer = quantizer
+        self.dim = quantizer.dim if quantizer else None
+        self.file_ids: List[Optional[FileId]] = []
+        self._slots: Dict[FileId, int] = {}
+        if quantizer:
+            self._vectors = np.empty((0, quantizer.m), dtype=np.uint8)
+        else:
+            self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._owners = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self.shared = False
+        self.unsaved_since = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_shard(cls, event_id: str, generation: int, quantizer, rows: np.ndarray, owners: np.ndarray, file_ids: list):
+        """Wraps memory-mapped shard arrays without copying them."""
+        index = cls(event_id, generation, quantizer)
+        index._vectors, index._owners, index._size = rows, owners, len(rows)
+        index.dim = index.dim or (rows.shape[1] if rows.ndim == 2 and len(rows) else None)
+        index.file_ids = file_ids
+        index._slots = {file_id: slot for slot, file_id in enumerate(file_ids) if file_id is not None}
+        index.shared = True
+        return index
+
+    @property
+    def codec(self) -> str:
+        return f"pq{self.quantizer.m}" if self.quantizer else "float32"
+
+    def _make_private(self):
+        """Copies mapped rows into process memory before the first in-place change."""
+        if not self._vectors.flags.writeable or not self._owners.flags.writeable:
+            self._vectors, self._owners = np.array(self._vectors), np.array(self._owners)
+            self.shared = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Stored rows: float32 vectors, or (rows, m) codes when quantised."""
+        return self._vectors[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.owners.nbytes
+
+    @property
+    def owners(self) -> np.ndarray:
+        return self._owners[:self._size]
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 64)
+        vectors = np.empty((capacity, self._vectors.shape[1]), dtype=self._vectors.dtype)
+        owners = np.empty(capacity, dtype=np.int32)
+        vectors[:self._size] = self.vectors
+        owners[:self._size] = self.owners
+        self._vectors, self._owners = vectors, owners
+
+    def add(self, file_id: FileId, vectors) -> int:
+        """Adds the face vectors of one file. Returns the number of rows added."""
+        if vectors is None or len(vectors) == 0:
+            return 0
+        matrix = normalize_vectors(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            if matrix.shape[1] != self.dim:
+                return 0
+            self._make_private()
+            self.remove(file_id)
+            slot = len(self.file_ids)
+            self.file_ids.append(file_id)
+            self._slots[file_id] = slot
+            self._reserve(len(matrix))
+            rows = self.quantizer.encode(matrix) if self.quantizer else matrix
+            self._vectors[self._size:self._size + len(matrix)] = rows
+            self._owners[self._size:self._size + len(matrix)] = slot
+            self._size += len(matrix)
+            return len(matrix)
+
+    def remove(self, file_id: FileId) -> int:
+        """Drops every row owned by `file_id`. Returns the number of rows removed."""
+        with self._lock:
+            slot = self._slots.pop(file_id, None)
+            if slot is None:
+                return 0
+            self.file_ids[slot] = None
+            self._make_private()
+            keep = self.owners != slot
+            removed = self._size - int(keep.sum())
+            if removed:
+                kept = int(keep.sum())
+                self._vectors[:kept] = self.vectors[keep]
+                self._owners[:kept] = self.owners[keep]
+                self._size = kept
+            return removed
+
+    def search(self, query, threshold: float = 0.6, top_k: Optional[int] = None) -> List[Tuple[FileId, float]]:
+        """
+        Scores every row against `query` with one matrix product and returns
+        (file_id, similarity) pairs, best face per file, highest first.
+        """
+        with self._lock:
+            if self._size == 0:
+                return []
+            queries = normalize_vectors(query)
+            if queries.shape[1] != self.dim:
+                return []
+            if self.quantizer:
+                row_scores = self.quantizer.scores(queries, self.vectors)
+            else:
+                row_scores = self.vectors @ queries.T
+            if row_scores.shape[1] > 1:
+                row_scores = row_scores.max(axis=1)
+            else:
+                row_scores = row_scores[:, 0]
+            file_scores = np.full(len(self.file_ids), -np.inf, dtype=np.float32)
+            np.maximum.at(file_scores, self.owners, row_scores)
+            file_ids = list(self.file_ids)
+
+        candidates = np.flatnonzero(file_scores >= threshold)
+        if top_k is not None and 0 < top_k < len(candidates):
+            part = np.argpartition(-file_scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[part]
+        candidates = candidates[np.argsort(-file_scores[candidates], kind="stable")]
+        return [(file_ids[slot], float(file_scores[slot])) for slot in candidates]
+
+
+_indexes: Dict[str, EventFaceIndex] = {}
+_registry_lock = threading.Lock()
+_build_locks: Dict[str, threading.Lock] = {}
+
+
+def _build_lock(event_id: str) -> threading.Lock:
+    """Per-event lock: one build per event at a time, other events are not held up."""
+    with _registry_lock:
+        return _build_locks.setdefault(event_id, threading.Lock())
+
+
+def build_event_index(event_id: str) -> EventFaceIndex:
+    """
+    Loads every file embedding of an event with two queries instead of one per file,
+    reading vectors from the binary embedding cache first.
+    Inline vectors come with the file query; linked ones join on embeddings_id, so
+    deduplicated uploads share their original's vectors.
+    The generation is read first, so changes made while loading force a later rebuild.
+    With FACE_INDEX_SHARDS the result is written as a memory-mapped shard that other
+    workers map instead of building their own copy.
+    """
+    generation = cache_service.event_generation(event_id)
+    index = EventFaceIndex(event_id, generation, pq_codec.get_quantizer())
+    use_shards = Config.FACE_INDEX_SHARDS and generation is not None
+    if use_shards:
+        shard = shard_service.load_shard(event_id, generation, index.codec)
+        if shard is not None:
+            return EventFaceIndex.from_shard(event_id, generation, index.quantizer, *shard)
+
+    files_by_embedding = {}
+    for file_doc in db.files.find({"event_id": event_id}, embedding_store.DOCUMENT_PROJECTION):
+        if file_doc.get(embedding_store.INLINE_FIELD):
+            # Inline vectors arrive with the file document: no join, nothing to cache
+            vectors = embedding_store.unpack(file_doc[embedding_store.INLINE_FIELD])
+            if len(vectors):
+                index.add(file_doc["_id"], vectors)
+        elif file_doc.get("embeddings_id"):
+            files_by_embedding.setdefault(file_doc["embeddings_id"], []).append(file_doc["_id"])
+
+    if files_by_embedding:
+        # Vectors cached by earlier builds come back in one MGET; only the rest hit Mongo
+        vectors_by_embedding = cache_service.get_cached_embeddings(list(files_by_embedding))
+        missing = [embedding_id for embedding_id in files_by_embedding if embedding_id not in vectors_by_embedding]
+        if missing:
+            loaded = embedding_store.load_embeddings(missing)
+            cache_service.cache_embeddings(loaded)
+            vectors_by_embedding.update(loaded)
+
+        for embedding_id, vectors in vectors_by_embedding.items():
+            if len(vectors):
+                for file_id in files_by_embedding[embedding_id]:
+                    index.add(file_id, vectors)
+
+    if use_shards and len(index):
+        return _write_and_map(index) or index
+    return index
+
+
+def _write_and_map(index: EventFaceIndex, copy: bool = False) -> Optional[EventFaceIndex]:
+    """
+    Writes the index as the event's shard for its generation and returns the mapped copy,
+    so this worker shares the pages too. None if the shard could not be written.
+    `copy` snapshots the rows first, for an index that requests may still change.
+    """
+    with index._lock:
+        generation, rows, owners, file_ids = index.generation, index.vectors, index.owners, list(index.file_ids)
+        if copy:
+            rows, owners = rows.copy(), owners.copy()
+    try:
+        shard_service.write_shard(index.event_id, generation, index.codec, rows, owners, file_ids)
+        shard = shard_service.load_shard(index.event_id, generation, index.codec)
+    except OSError as e:
+        logger.warning(f"[Shards] could not write shard for event {index.event_id}: {e}")
+        return None
+    if shard is None:
+        return None
+    return EventFaceIndex.from_shard(index.event_id, generation, index.quantizer, *shard)
+
+
+def _save_shard(index: EventFaceIndex) -> EventFaceIndex:
+    """
+    Rewrites the shard of an index patched in place once SHARD_WRITE_DELAY has passed
+    since its first unsaved change, so a burst of uploads costs one rewrite. Returns the
+    index to use: the mapped one once written, else `index`. Skipped while the event is
+    being built or saved by another request.
+    """
+    lock = _build_lock(index.event_id)
+    if not lock.acquire(blocking=False):
+        return index
+    try:
+        if index.unsaved_since is None or index.generation is None:
+            return index
+        mapped = _write_and_map(index, copy=True)
+        with index._lock:
+            if mapped is None:
+                index.unsaved_since = time.monotonic()  # retry after another delay
+                return index
+            # Changes applied while writing moved the generation on: keep the patched copy
+            if mapped.generation != index.generation:
+                return index
+            index.unsaved_since = None
+            with _registry_lock:
+                if _indexes.get(index.event_id) is not index:
+                    return index
+                _indexes[index.event_id] = mapped
+            return mapped
+    finally:
+        lock.release()
+
+
+def get_event_index(event_id: str, generation: Optional[int] = None) -> EventFaceIndex:
+    """
+    Returns the event's index, building it on first use and rebuilding it when another
+    process has changed the event since (its generation moved on). Builds hold only
+    their event's lock, so a slow build never stalls lookups of other events.
+    """
+    if generation is None:
+        generation = cache_service.event_generation(event_id)
+    index = _indexes.get(event_id)
+    if index is not None and (generation is None or index.generation == generation):
+        if index.unsaved_since is not None and time.monotonic() - index.unsaved_since >= Config.SHARD_WRITE_DELAY:
+            return _save_shard(index)
+        return index
+    with _build_lock(event_id):
+        index = _indexes.get(event_id)
+        if index is None or (generation is not None and index.generation != generation):
+            index = build_event_index(event_id)
+            with _registry_lock:
+                _indexes[event_id] = index
+    return index
+
+
+def search_event(
+    event_id: str,
+    query,
+    threshold: float = 0.6,
+    top_k: Optional[int] = None,
+    generation: Optional[int] = None
+) -> List[Tuple[FileId, float]]:
+    return get_event_index(event_id, generation).search(query, threshold, top_k)
+
+
+def add_file(event_id: str, file_id: FileId, vectors) -> Optional[int]:
+    """
+    Publishes a new file to the event: bumps its generation (invalidating cached matches)
+    and keeps an already-built index in sync. Unbuilt indexes pick the file up on first query.
+    Files without faces bump it too: the event's near-duplicate trees key on the same
+    generation. Returns the new generation (None without Redis).
+    """
+    generation = cache_service.bump_event_generation(event_id)
+    index = _indexes.get(event_id)
+    if index is not None:
+        with index._lock:
+            if vectors is not None and len(vectors):
+                index.add(file_id, vectors)
+            cache_service.advance_generation(index, generation)
+            _mark_unsaved(index)
+    return generation
+
+
+def remove_file(event_id: str, file_id: FileId) -> Optional[int]:
+    generation = cache_service.bump_event_generation(event_id)
+    index = _indexes.get(event_id)
+    if index is not None:
+        with index._lock:
+            index.remove(file_id)
+            cache_service.advance_generation(index, generation)
+            _mark_unsaved(index)
+    return generation
+
+
+def _mark_unsaved(index: EventFaceIndex):
+    """With shards, a change applied in place is written out later by _save_shard."""
+    if Config.FACE_INDEX_SHARDS and index.unsaved_since is None:
+        index.unsaved_since = time.monotonic()
+
+
+def drop_event(event_id: str):
+    with _registry_lock:
+        _indexes.pop(event_id, None)
+        _build_locks.pop(event_id, None)
@@ -0,0 +1,343 @@
+# app/services/inference_service.py
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+
+
+class InferenceError(RuntimeError):
+    pass
+
+
+class InferenceBusy(InferenceError):
+    """The request queue is at INFERENCE_QUEUE_DEPTH."""
+
+
+class InferenceTimeout(InferenceError):
+    pass
+
+
+# ========== Worker Process ==========
+
+def _load_faces(kind: str, payload) -> list:
+    from PIL import Image
+    from app.services import embedding_service
+    from app.services.image_service import DecodedImage
+    if kind == "crops":
+        return [Image.fromarray(np.asarray(crop, dtype=np.uint8)) for crop in payload]
+    return embedding_service.detect_faces(DecodedImage(payload))
+
+
+def run_batch(batch: list) -> list:
+    """
+    Detects faces in every request of the batch, then embeds all their crops together
+    (EMBEDDING_BATCH_SIZE per forward pass) and splits the rows back per request.
+    Returns [(request_id, (faces, 512) array or None, error or None)].
+    """
+    from app.services import embedding_service
+    loaded = []
+    for request_id, kind, payload in batch:
+        try:
+            loaded.append((request_id, _load_faces(kind, payload), None))
+        except Exception as e:
+            loaded.append((request_id, None, f"{type(e).__name__}: {e}"))
+
+    faces = [face for _, request_faces, _ in loaded if request_faces for face in request_faces]
+    try:
+        vectors = embedding_service.embed_faces(faces).astype(np.float32)
+    except Exception as e:
+        return [(request_id, None, error or f"{type(e).__name__}: {e}") for request_id, _, error in loaded]
+
+    results, offset = [], 0
+    for request_id, request_faces, error in loaded:
+        count = len(request_faces) if request_faces else 0
+        results.append((request_id, None if error else vectors[offset:offset + count], error))
+        offset += count
+    return results
+
+
+def _worker_main(tasks, results, max_batch: int, batch_wait: float, threads: int):
+    """
+    Owns one copy of the models. Takes a request, then merges whatever else arrives
+    within `batch_wait` seconds (up to `max_batch` requests) into the same forward passes.
+    Each batch is claimed on the result queue before it runs, so the pool can fail its
+    requests if this process dies mid-batch.
+    """
+    import torch
+    from app.services import model_registry
+    torch.set_num_threads(threads)
+    model_registry.warm_up()
+
+    stopping = False
+    while not stopping:
+        task = tasks.get()
+        if task is None:
+            break
+        batch = [task]
+        deadline = time.monotonic() + batch_wait
+        while len(batch) < max_batch:
+            try:
+                task = tasks.get(timeout=max(0.0, deadline - time.monotonic())) if batch_wait else tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                stopping = True
+                break
+            batch.append(task)
+        results.put(("claim", os.getpid(), [request_id for request_id, _, _ in batch]))
+        results.put((len(batch), run_batch(batch)))
+
+
+# ========== Pool ==========
+
+class InferencePool:
+    """
+    `size` spawned processes fed from one bounded request queue. Callers get a Future;
+    a collector thread resolves it from the shared result queue and replaces dead workers,
+    failing the requests they had claimed.
+    """
+
+    def __init__(self, size: int, queue_depth: int, max_batch: int, batch_wait: float, threads: int):
+        self.size = size
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.threads = threads
+        self._ctx = mp.get_context("spawn")
+        self._tasks = self._ctx.Queue(maxsize=queue_depth)
+        self._results = self._ctx.Queue()
+        self._processes: List = []
+        self._pending: Dict[int, Future] = {}
+        self._claimed: Dict[int, int] = {}  # request id -> pid of the worker running it
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._collector = threading.Thread(target=self._collect, name="inference-collector", daemon=True)
+        self.stats = {"requests": 0, "batches": 0, "batched_requests": 0, "restarts": 0}
+
+    def _spawn(self):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self._tasks, self._results, self.max_batch, self.batch_wait, self.threads),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def start(self):
+        self._processes = [self._spawn() for _ in range(self.size)]
+        self._collector.start()
+
+    def submit(self, kind: str, payload, block: bool = True, timeout: Optional[float] = None) -> Future:
+        request_id = next(self._ids)
+        future = Future()
+        future.request_id = request_id
+        with self._lock:
+            self._pending[request_id] = future
+            self.stats["requests"] += 1
+        try:
+            self._tasks.put((request_id, kind, payload), block=block, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise InferenceBusy("Inference queue is full")
+        return future
+
+    def discard(self, future: Future):
+        """Forgets a request its caller stopped waiting for; a late result is dropped."""
+        with self._lock:
+            self._pending.pop(future.request_id, None)
+            self._claimed.pop(future.request_id, None)
+        future.cancel()
+
+    def _collect(self):
+        while not self._stopping.is_set():
+            # Checked on every pass, not only when idle, so a death under load is noticed
+            self._replace_dead_workers()
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if message[0] == "claim":
+                _, pid, request_ids = message
+                with self._lock:
+                    self._claimed.update((request_id, pid) for request_id in request_ids if request_id in self._pending)
+                continue
+            batch_size, results = message
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["batched_requests"] += batch_size
+                for request_id, _, _ in results:
+                    self._claimed.pop(request_id, None)
+                futures = [(self._pending.pop(request_id, None), vectors, error) for request_id, vectors, error in results]
+            for future, vectors, error in futures:
+                if future is None or future.done():
+                    continue
+                if error:
+                    future.set_exception(InferenceError(error))
+                else:
+                    future.set_result(vectors)
+
+    def _replace_dead_workers(self):
+        for i, process in enumerate(self._processes):
+            if not process.is_alive() and not self._stopping.is_set():
+                logger.warning(f"[Inference] worker {process.pid} exited ({process.exitcode}), restarting")
+                self._fail_claimed(process.pid, f"Inference worker exited ({process.exitcode})")
+                self._processes[i] = self._spawn()
+                self.stats["restarts"] += 1
+
+    def _fail_claimed(self, pid: int, reason: str):
+        """Fails the requests a dead worker had taken; their results will never arrive."""
+        with self._lock:
+            request_ids = [request_id for request_id, owner in self._claimed.items() if owner == pid]
+            futures = []
+            for request_id in request_ids:
+                del self._claimed[request_id]
+                futures.append(self._pending.pop(request_id, None))
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_exception(InferenceError(reason))
+
+    def alive(self) -> int:
+        return sum(process.is_alive() for process in self._processes)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        for _ in self._processes:
+            try:
+                self._tasks.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+            self._claimed.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(InferenceError("Inference pool stopped"))
+
+
+_pool: Optional[InferencePool] = None
+_pool_lock = threading.Lock()
+
+
+def start_pool(size: int = None) -> int:
+    """Starts INFERENCE_POOL_SIZE model processes; 0 keeps inference in the API process."""
+    global _pool
+    size = Config.INFERENCE_POOL_SIZE if size is None else size
+    with _pool_lock:
+        if _pool is None and size > 0:
+            threads = Config.INFERENCE_THREADS or max(1, (os.cpu_count() or 1) // size)
+            _pool = InferencePool(
+                size,
+                Config.INFERENCE_QUEUE_DEPTH,
+                Config.INFERENCE_MAX_BATCH,
+                Config.INFERENCE_BATCH_WAIT_MS / 1000,
+                threads
+            )
+            _pool.start()
+            logger.info(f"[Inference] started {size} worker processes ({threads} torch threads each)")
+    return _pool.size if _pool else 0
+
+
+def stop_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.stop()
+            _pool = None
+
+
+def is_running() -> bool:
+    return _pool is not None
+
+
+def _request(path: str = None, data: bytes = None, crops: list = None):
+    if path is not None:
+        return "path", path
+    if data is not None:
+        return "bytes", data
+    return "crops", [np.asarray(crop, dtype=np.uint8) for crop in crops or []]
+
+
+def _run_locally(kind: str, payload) -> np.ndarray:
+    (_, vectors, error), = run_batch([(0, kind, payload)])
+    if error:
+        raise InferenceError(error)
+    return vectors
+
+
+def embed(path: str = None, data: bytes = None, crops: list = None, timeout: float = None) -> np.ndarray:
+    """
+    Sync client: (faces, 512) embeddings of the image at `path`, of encoded image
+    `data`, or of ready-made RGB `crops`. Blocks while the queue is full.
+    Runs in this process when the pool is not started.
+    """
+    kind, payload = _request(path, data, crops)
+    timeout = timeout or Config.INFERENCE_TIMEOUT
+    pool = _pool
+    if pool is None:
+        return _run_locally(kind, payload)
+    future = pool.submit(kind, payload, block=True, timeout=timeout)
+    try:
+        return future.result(timeout)
+    except FutureTimeout:
+        pool.discard(future)
+        raise InferenceTimeout(f"No inference result within {timeout}s")
+
+
+async def embed_async(path: str = None, data: bytes = None, crops: list = None, timeout: float = None) -> np.ndarray:
+    """
+    Async client for request handlers: never blocks the event loop. Raises
+    InferenceBusy at once when the queue is full instead of waiting for room.
+    """
+    kind, payload = _request(path, data, crops)
+    timeout = timeout or Config.INFERENCE_TIMEOUT
+    pool = _pool
+    if pool is None:
+        return await run_in_threadpool(_run_locally, kind, payload)
+    future = pool.submit(kind, payload, block=False)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        pool.discard(future)
+        raise InferenceTimeout(f"No inference result within {timeout}s")
+
+
+def get_stats() -> dict:
+    pool = _pool
+    if pool is None:
+        return {"running": False}
+    with pool._lock:
+        stats = dict(pool.stats)
+    return {
+        "running": True,
+        "workers": pool.size,
+        "alive": pool.alive(),
+        "pending": pool.pending(),
+        "mean_batch": round(stats["batched_requests"] / stats["batches"], 2) if stats["batches"] else None,
+        **stats
+    }
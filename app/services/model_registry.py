@@ -0,0 +1,95 @@
+# app/services/model_registry.py
+
+import time
+import logging
+import threading
+import torch
+from facenet_pytorch import InceptionResnetV1, MTCNN
+
+from app.config import Config
+from app.utils import get_rss_mb
+
+logger = logging.getLogger(__name__)
+
+# Process-wide model handles, loaded once on first use (or by warm_up at startup)
+_lock = threading.Lock()
+_device = None
+_embedder = None
+_detector = None
+_stats = {
+    "embedder_load_seconds": None,
+    "detector_load_seconds": None,
+    "rss_before_load_mb": None,
+    "rss_after_load_mb": None,
+}
+
+
+def get_device() -> torch.device:
+    global _device
+    if _device is None:
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return _device
+
+
+def get_embedder() -> InceptionResnetV1:
+    """InceptionResnetV1 with Config.MODEL_PATH weights, shared by every service."""
+    global _embedder
+    if _embedder is not None:
+        return _embedder
+    with _lock:
+        if _embedder is None:
+            _record_rss_before()
+            start = time.perf_counter()
+            device = get_device()
+            model = InceptionResnetV1(pretrained=None).to(device)
+            model.load_state_dict(torch.load(Config.MODEL_PATH, map_location=device), strict=False)
+            model.eval()
+            _stats["embedder_load_seconds"] = round(time.perf_counter() - start, 3)
+            _stats["rss_after_load_mb"] = get_rss_mb()
+            _embedder = model
+    return _embedder
+
+
+def get_detector() -> MTCNN:
+    """MTCNN face detector (DETECTION_MIN_FACE_SIZE, DETECTION_THRESHOLDS), shared by every service."""
+    global _detector
+    if _detector is not None:
+        return _detector
+    with _lock:
+        if _detector is None:
+            _record_rss_before()
+            start = time.perf_counter()
+            detector = MTCNN(
+                keep_all=True,
+                device=get_device(),
+                min_face_size=Config.DETECTION_MIN_FACE_SIZE,
+                thresholds=Config.DETECTION_THRESHOLDS
+            )
+            _stats["detector_load_seconds"] = round(time.perf_counter() - start, 3)
+            _stats["rss_after_load_mb"] = get_rss_mb()
+            _detector = detector
+    return _detector
+
+
+def _record_rss_before():
+    if _stats["rss_before_load_mb"] is None:
+        _stats["rss_before_load_mb"] = get_rss_mb()
+
+
+def warm_up() -> dict:
+    """Loads both models up front so the first request doesn't pay for it."""
+    get_embedder()
+    get_detector()
+    stats = get_stats()
+    logger.info(f"[Model Registry] loaded: {stats}")
+    return stats
+
+
+def get_stats() -> dict:
+    return {
+        "device": str(get_device()),
+        "embedder_loaded": _embedder is not None,
+        "detector_loaded": _detector is not None,
+        **_stats,
+        "rss_mb": get_rss_mb(),
+    }
@@ -0,0 +1,154 @@
+# app/services/phash_service.py
+
+import threading
+import numpy as np
+from PIL import Image
+from typing import Dict, List, Optional, Tuple
+
+from app.db import db
+from app.config import Config
+from app.services import cache_service
+
+HASH_BITS = 64
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: shrink to (hash_size + 1) x hash_size greyscale and set one bit
+    per horizontally adjacent pixel pair. Burst frames land a few bits apart.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def to_hex(value: int) -> str:
+    """Hashes are stored as fixed-width hex; 64-bit unsigned ints don't fit BSON int64."""
+    return f"{value:016x}"
+
+
+def from_hex(value: str) -> int:
+    return int(value, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance. A search for radius r only descends
+    into children whose edge distance d satisfies |d - dist(query, node)| <= r.
+    """
+
+    def __init__(self, generation: Optional[int] = None):
+        self.root = None  # [hash, items, children{distance: node}]
+        self.generation = generation  # event generation the tree reflects (None = unknown)
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, item):
+        with self._lock:
+            self._size += 1
+            if self.root is None:
+                self.root = [value, [item], {}]
+                return
+            node = self.root
+            while True:
+                distance = hamming(value, node[0])
+                if distance == 0:
+                    node[1].append(item)
+                    return
+                child = node[2].get(distance)
+                if child is None:
+                    node[2][distance] = [value, [item], {}]
+                    return
+                node = child
+
+    def remove(self, value: int, item) -> bool:
+        """Drops `item`; its node stays in place as a routing node for its subtree."""
+        with self._lock:
+            node = self.root
+            while node is not None:
+                distance = hamming(value, node[0])
+                if distance == 0:
+                    if item in node[1]:
+                        node[1].remove(item)
+                        self._size -= 1
+                        return True
+                    return False
+                node = node[2].get(distance)
+            return False
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[object, int]]:
+        results = []
+        with self._lock:
+            stack = [self.root] if self.root is not None else []
+            while stack:
+                node = stack.pop()
+                distance = hamming(value, node[0])
+                if distance <= max_distance:
+                    results.extend((item, distance) for item in node[1])
+                for edge, child in node[2].items():
+                    if distance - max_distance <= edge <= distance + max_distance:
+                        stack.append(child)
+        return sorted(results, key=lambda result: result[1])
+
+
+_trees: Dict[str, BKTree] = {}
+_registry_lock = threading.Lock()
+
+
+def build_event_tree(event_id: str) -> BKTree:
+    """The generation is read first, so changes made while loading force a later rebuild."""
+    tree = BKTree(cache_service.event_generation(event_id))
+    for file_doc in db.files.find({"event_id": event_id, "phash": {"$ne": None}}, {"phash": 1}):
+        if file_doc.get("phash"):
+            tree.add(from_hex(file_doc["phash"]), file_doc["_id"])
+    return tree
+
+
+def get_event_tree(event_id: str) -> BKTree:
+    """
+    Returns the event's BK-tree, building it on first use and rebuilding it when another
+    process has changed the event since (its generation moved on).
+    """
+    generation = cache_service.event_generation(event_id)
+    tree = _trees.get(event_id)
+    if tree is not None and (generation is None or tree.generation == generation):
+        return tree
+    with _registry_lock:
+        tree = _trees.get(event_id)
+        if tree is None or (generation is not None and tree.generation != generation):
+            tree = build_event_tree(event_id)
+            _trees[event_id] = tree
+    return tree
+
+
+def find_near_duplicates(event_id: str, phash: str, max_distance: Optional[int] = None) -> List[Tuple[object, int]]:
+    """(file_id, hamming distance) pairs of event files within `max_distance` bits of `phash`."""
+    max_distance = Config.PHASH_MAX_DISTANCE if max_distance is None else max_distance
+    return get_event_tree(event_id).search(from_hex(phash), max_distance)
+
+
+def add_file(event_id: str, file_id, phash: Optional[str], generation: Optional[int] = None):
+    """Keeps a built tree in sync; `generation` is what index_service.add_file bumped the event to."""
+    tree = _trees.get(event_id)
+    if tree is not None:
+        with tree._lock:
+            if phash:
+                tree.add(from_hex(phash), file_id)
+            cache_service.advance_generation(tree, generation)
+
+
+def remove_file(event_id: str, file_id, phash: Optional[str], generation: Optional[int] = None):
+    tree = _trees.get(event_id)
+    if tree is not None:
+        with tree._lock:
+            if phash:
+                tree.remove(from_hex(phash), file_id)
+            cache_service.advance_generation(tree, generation)
@@ -0,0 +1,295 @@
+# app/services/pipeline_service.py
+
+import json
+import queue
+import logging
+import threading
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Optional, Union
+from PIL import UnidentifiedImageError
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.db import db, redis_client
+from app.config import Config
+from app.services import ann_service, embedding_store, index_service, inference_service, phash_service
+from app.services.embedding_service import extract_faces
+from app.services.image_service import DecodedImage
+
+logger = logging.getLogger(__name__)
+
+# embedding_status values on file documents
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_CREATED = "created"
+STATUS_NOT_CREATED = "not created"
+STATUS_FAILED = "failed"
+
+
+# ========== Job Queues ==========
+
+class MemoryJobQueue:
+    """In-process bounded queue, used for tests or when Redis is unavailable."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, job: dict) -> bool:
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout: float = 1.0) -> Optional[dict]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+# Length check and push in one step, so concurrent producers can't overshoot maxsize
+_BOUNDED_LPUSH = """
+if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class RedisJobQueue:
+    """Bounded FIFO on a Redis list, shared by every API process."""
+
+    def __init__(self, client, key: str, maxsize: int):
+        self.client = client
+        self.key = key
+        self.maxsize = maxsize
+        self._bounded_lpush = client.register_script(_BOUNDED_LPUSH)
+
+    def put(self, job: dict) -> bool:
+        return bool(self._bounded_lpush(keys=[self.key], args=[json.dumps(job), self.maxsize]))
+
+    def get(self, timeout: float = 1.0) -> Optional[dict]:
+        item = self.client.brpop(self.key, timeout=max(1, int(timeout)))
+        if not item:
+            return None
+        return json.loads(item[1])
+
+    def qsize(self) -> int:
+        return self.client.llen(self.key)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Picks the Redis-backed queue when Redis answers, else the in-process fallback."""
+    global _queue
+    if _queue is not None:
+        return _queue
+    with _queue_lock:
+        if _queue is None:
+            if Config.EMBEDDING_QUEUE_BACKEND == "redis":
+                try:
+                    redis_client.ping()
+                    _queue = RedisJobQueue(redis_client, Config.EMBEDDING_QUEUE_KEY, Config.EMBEDDING_QUEUE_MAXSIZE)
+                except Exception as e:
+                    logger.warning(f"[Embedding Queue] Redis unavailable ({e}), using in-process queue")
+            if _queue is None:
+                _queue = MemoryJobQueue(Config.EMBEDDING_QUEUE_MAXSIZE)
+    return _queue
+
+
+def has_capacity() -> bool:
+    q = get_queue()
+    return q.qsize() < q.maxsize
+
+
+def queue_depth() -> int:
+    return get_queue().qsize()
+
+
+def enqueue_file(file_id: Union[int, str], path: str, event_id: str) -> bool:
+    """Queues a file for embedding. Returns False when the queue is full."""
+    return get_queue().put({"file_id": file_id, "path": path, "event_id": event_id})
+
+
+# ========== Job Processing ==========
+
+def open_image(path: str) -> Optional[DecodedImage]:
+    """The job's one decode: detection and the perceptual hash read its proxy, face crops its full image."""
+    try:
+        return DecodedImage(path)
+    except UnidentifiedImageError:
+        return None
+    except Exception as e:
+        print("[Image Open Error]:", str(e))
+        return None
+
+
+def compute_file_faces(image: Optional[DecodedImage], path: str = None) -> tuple:
+    """
+    (embeddings, boxes) for a file. Boxes are None when the inference pool ran
+    detection, since its workers return vectors only.
+    """
+    if image is None:
+        return [], None
+    if path and inference_service.is_running():
+        # Errors (timeouts, crashed workers) propagate so the job is marked failed
+        return inference_service.embed(path=path).tolist(), None
+    try:
+        embeddings, boxes = extract_faces(image)
+    except Exception as e:
+        print("[Embedding Error]:", str(e))
+        embeddings, boxes = [], None
+
+    if isinstance(embeddings, np.ndarray):
+        embeddings = [embeddings.tolist()]
+    elif isinstance(embeddings, list):
+        embeddings = [e.tolist() if isinstance(e, np.ndarray) else e for e in embeddings]
+    else:
+        embeddings = []
+    return embeddings, boxes
+
+
+def compute_file_embeddings(image: Optional[DecodedImage], path: str = None) -> list:
+    return compute_file_faces(image, path)[0]
+
+
+def embed_file(file_id: Union[int, str], path: str, embeddings: list = None) -> tuple:
+    """
+    Computes a file's face vectors and perceptual hash. Returns (fields, embeddings):
+    the file-document fields to write (vectors attached per EMBEDDING_STORAGE_MODE,
+    embedding_status, phash) and the vectors for the in-memory indexes.
+    """
+    image = open_image(path)
+    boxes = None
+    if embeddings is None:
+        embeddings, boxes = compute_file_faces(image, path)
+    phash = phash_service.to_hex(phash_service.dhash(image.proxy)) if image is not None else None
+    fields = embedding_store.attach_fields(embeddings, boxes, file_id=file_id)
+    fields["embedding_status"] = STATUS_CREATED if len(embeddings) else STATUS_NOT_CREATED
+    fields["phash"] = phash
+    return fields, embeddings
+
+
+def publish_file(event_id: str, file_id: Union[int, str], embeddings, phash: Optional[str]):
+    """Adds a newly embedded file to the event, ANN and perceptual-hash indexes."""
+    generation = index_service.add_file(event_id, file_id, embeddings)
+    ann_service.add_file(event_id, file_id, embeddings)
+    phash_service.add_file(event_id, file_id, phash, generation)
+
+
+def process_job(job: dict, embeddings: list = None) -> Optional[str]:
+    """
+    Embeds one queued file and attaches the result to its document with one update.
+    The pending -> processing claim makes re-delivered jobs a no-op; its timestamp
+    lets requeue_pending_files recover the file if this worker dies mid-job.
+    `embeddings` already computed by the caller (e.g. via the async inference client) are used as is.
+    """
+    file_id = job["file_id"]
+    file_doc = db.files.find_one_and_update(
+        {"_id": file_id, "embedding_status": STATUS_PENDING},
+        {"$set": {"embedding_status": STATUS_PROCESSING, "embedding_claimed_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not file_doc:
+        return None
+
+    try:
+        update, embeddings = embed_file(file_id, job["path"], embeddings)
+        db.files.update_one({"_id": file_id}, {"$set": update})
+        publish_file(job["event_id"], file_id, embeddings, update["phash"])
+
+        # Byte-identical re-uploads made while this file was pending share its results
+        db.files.update_many({"storage_ref": file_id}, {"$set": update})
+        for ref_doc in db.files.find({"storage_ref": file_id}, {"event_id": 1}):
+            publish_file(ref_doc.get("event_id"), ref_doc["_id"], embeddings, update["phash"])
+        return update["embedding_status"]
+    except Exception as e:
+        logger.error(f"[Embedding Worker] file {file_id} failed: {e}")
+        db.files.update_one(
+            {"_id": file_id},
+            {"$set": {"embedding_status": STATUS_FAILED, "embedding_error": str(e)}}
+        )
+        return STATUS_FAILED
+
+
+def requeue_pending_files() -> int:
+    """
+    Re-queues files left pending by a restart (lost in-process jobs) and files whose
+    processing claim is older than EMBEDDING_LEASE_SECONDS (a worker that crashed
+    mid-job). Expired claims go back to pending first so the new job can claim them.
+    """
+    expired = datetime.utcnow() - timedelta(seconds=Config.EMBEDDING_LEASE_SECONDS)
+    released = db.files.update_many(
+        {"embedding_status": STATUS_PROCESSING, "$or": [
+            {"embedding_claimed_at": {"$lt": expired}},
+            {"embedding_claimed_at": {"$exists": False}}  # claimed before claims were timestamped
+        ]},
+        {"$set": {"embedding_status": STATUS_PENDING}, "$unset": {"embedding_claimed_at": ""}}
+    )
+    if released.modified_count:
+        logger.warning(f"[Embedding Queue] {released.modified_count} expired processing claims released")
+    count = 0
+    for file_doc in db.files.find({"embedding_status": STATUS_PENDING}, {"path": 1, "event_id": 1}):
+        if not enqueue_file(file_doc["_id"], file_doc["path"], file_doc.get("event_id")):
+            break
+        count += 1
+    return count
+
+
+def get_embedding_status(file_id: Union[int, str, ObjectId]) -> Optional[dict]:
+    file_doc = db.files.find_one({"_id": file_id}, {"embedding_status": 1, "embedding_error": 1})
+    if not file_doc:
+        return None
+    return {
+        "file_id": str(file_id),
+        "embedding_status": file_doc.get("embedding_status", STATUS_CREATED),
+        "error": file_doc.get("embedding_error"),
+        "queue_depth": queue_depth()
+    }
+
+
+# ========== Worker Pool ==========
+
+_workers = []
+_stop_event = threading.Event()
+
+
+def _worker_loop():
+    q = get_queue()
+    while not _stop_event.is_set():
+        try:
+            job = q.get(timeout=1.0)
+        except Exception as e:
+            logger.error(f"[Embedding Worker] queue error: {e}")
+            _stop_event.wait(1.0)
+            continue
+        if job is not None:
+            process_job(job)
+
+
+def start_workers(count: int = None) -> int:
+    """Starts the bounded embedding worker pool. Safe to call more than once."""
+    count = Config.EMBEDDING_WORKERS if count is None else count
+    _stop_event.clear()
+    while len(_workers) < count:
+        worker = threading.Thread(target=_worker_loop, name=f"embedding-worker-{len(_workers)}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    return len(_workers)
+
+
+def stop_workers(timeout: float = 5.0):
+    _stop_event.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
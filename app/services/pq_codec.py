@@ -0,0 +1,132 @@
+# app/services/pq_codec.py
+
+import os
+import logging
+import threading
+import numpy as np
+from typing import Optional
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+CENTROIDS_PER_SUBSPACE = 256  # one uint8 code per subvector
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Plain (Euclidean) Lloyd's k-means; empty clusters take the points farthest from their centroid."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    squared = (vectors ** 2).sum(axis=1)
+    for _ in range(iterations):
+        distances = squared[:, None] - 2 * vectors @ centroids.T + (centroids ** 2).sum(axis=1)
+        assignment = distances.argmin(axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            farthest = np.argsort(-distances[np.arange(len(vectors)), assignment])[:len(empty)]
+            centroids[empty] = vectors[farthest]
+    return centroids
+
+
+class ProductQuantizer:
+    """
+    Splits each unit-normalised vector into `m` subvectors and stores the index of the
+    nearest of 256 sub-centroids for each: a 512-d float32 face (2 KB) becomes `m` bytes.
+    Queries stay uncompressed (asymmetric distance computation): one (m, 256) table of
+    query-subvector x sub-centroid dot products per query, then a score is `m` lookups.
+    """
+
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = np.ascontiguousarray(codebooks, dtype=np.float32)  # (m, 256, dim / m)
+        self.m, self.ks, self.dsub = self.codebooks.shape
+        self.dim = self.m * self.dsub
+
+    @classmethod
+    def train(cls, normalised: np.ndarray, m: int = None, iterations: int = 20) -> "ProductQuantizer":
+        """Trains `m` sub-codebooks on unit-normalised rows (as the face indexes store them)."""
+        matrix = np.ascontiguousarray(normalised, dtype=np.float32)
+        m = m or Config.PQ_SUBVECTORS
+        if matrix.shape[1] % m:
+            raise ValueError(f"Vector dimension {matrix.shape[1]} is not divisible by {m} subvectors")
+        if len(matrix) < CENTROIDS_PER_SUBSPACE:
+            raise ValueError(f"Need at least {CENTROIDS_PER_SUBSPACE} training vectors, got {len(matrix)}")
+        dsub = matrix.shape[1] // m
+        codebooks = np.stack([
+            kmeans(matrix[:, i * dsub:(i + 1) * dsub], CENTROIDS_PER_SUBSPACE, iterations, seed=i)
+            for i in range(m)
+        ])
+        return cls(codebooks)
+
+    def _split(self, matrix: np.ndarray) -> np.ndarray:
+        return matrix.reshape(len(matrix), self.m, self.dsub)
+
+    def encode(self, normalised: np.ndarray) -> np.ndarray:
+        """(n, dim) unit rows -> (n, m) uint8 codes."""
+        sub = self._split(normalised)
+        codes = np.empty((len(normalised), self.m), dtype=np.uint8)
+        for i in range(self.m):
+            book = self.codebooks[i]
+            distances = (book ** 2).sum(axis=1) - 2 * sub[:, i] @ book.T
+            codes[:, i] = distances.argmin(axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.codebooks[np.arange(self.m), codes].reshape(len(codes), self.dim)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate (rows, queries) dot products of normalised queries against coded rows."""
+        columns = np.ascontiguousarray(codes.T)  # one contiguous gather per subspace
+        tables = np.einsum("mkd,qmd->qmk", self.codebooks, queries.reshape(len(queries), self.m, self.dsub))
+        result = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for q, table in enumerate(tables):
+            scores = np.zeros(len(codes), dtype=np.float32)
+            for i in range(self.m):
+                scores += table[i].take(columns[i])
+            result[:, q] = scores
+        return result
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.codebooks)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ProductQuantizer":
+        return cls(np.load(path))
+
+
+def codebook_path() -> str:
+    """PQ_CODEBOOK_PATH, or a file next to the model weights (codebooks are per deployment)."""
+    return Config.PQ_CODEBOOK_PATH or os.path.join(os.path.dirname(Config.MODEL_PATH), "pq_codebook.npy")
+
+
+_quantizer: Optional[ProductQuantizer] = None
+_missing_warned = False
+_quantizer_lock = threading.Lock()
+
+
+def get_quantizer() -> Optional[ProductQuantizer]:
+    """
+    The deployment's quantizer when FACE_INDEX_CODEC is "pq" and a codebook has been
+    trained (app.commands.train_pq); otherwise None and indexes keep float32 rows.
+    """
+    global _quantizer, _missing_warned
+    if Config.FACE_INDEX_CODEC != "pq":
+        return None
+    if _quantizer is None:
+        with _quantizer_lock:
+            path = codebook_path()
+            if _quantizer is None and os.path.exists(path):
+                _quantizer = ProductQuantizer.load(path)
+            elif _quantizer is None and not _missing_warned:
+                logger.warning(f"[PQ] no codebook at {path}, face indexes stay float32")
+                _missing_warned = True
+    return _quantizer
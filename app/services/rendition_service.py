@@ -0,0 +1,186 @@
+# app/services/rendition_service.py
+
+import os
+import glob
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from PIL import Image, ImageOps
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels per rendition name
+RENDITIONS = {"thumb": 256, "preview": 1024}
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def rendition_dir(original_path: str) -> str:
+    """Renditions live in a `renditions/` folder inside the original's event folder."""
+    return os.path.join(os.path.dirname(original_path), "renditions")
+
+
+def rendition_path(storage_id, original_path: str, name: str) -> str:
+    """Keyed by the id owning the bytes, so deduplicated uploads share renditions."""
+    return os.path.join(rendition_dir(original_path), f"{storage_id}_{name}.{Config.RENDITION_FORMAT}")
+
+
+def rendition_urls(file_id) -> dict:
+    """API URLs of every rendition of a file, keyed `<name>_url`."""
+    return {f"{name}_url": f"/api/files/{file_id}/renditions/{name}" for name in RENDITIONS}
+
+
+def render(original_path: str, target_path: str, max_edge: int) -> int:
+    """
+    Writes a `max_edge` rendition of the original and returns its size in bytes.
+    JPEGs are decoded at reduced scale via draft mode; EXIF orientation is applied.
+    """
+    with Image.open(original_path) as image:
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format=Config.RENDITION_FORMAT.upper(), quality=Config.RENDITION_QUALITY)
+    os.replace(tmp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+class DiskLRU:
+    """
+    Tracks rendition files on disk and deletes the least recently served ones once
+    their total size exceeds `budget_bytes`. Recency survives restarts via mtime.
+    """
+
+    def __init__(self, root: str, budget_bytes: int):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.total_bytes = 0
+        self._entries = None  # path -> size, oldest first
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        paths = glob.glob(os.path.join(self.root, "*", "renditions", "*"))
+        stats = []
+        for path in paths:
+            if path.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats.append((stat.st_mtime, path, stat.st_size))
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(stats))
+        self.total_bytes = sum(self._entries.values())
+
+    def touch(self, path: str):
+        with self._lock:
+            self._load()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def add(self, path: str, size: int):
+        with self._lock:
+            self._load()
+            self.total_bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._evict()
+
+    def discard(self, path: str):
+        with self._lock:
+            if self._entries is not None and path in self._entries:
+                self.total_bytes -= self._entries.pop(path)
+
+    def _evict(self):
+        while self.total_bytes > self.budget_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_lru = None
+_executor = None
+_init_lock = threading.Lock()
+_path_locks = {}
+
+
+def get_lru() -> DiskLRU:
+    global _lru
+    with _init_lock:
+        if _lru is None:
+            _lru = DiskLRU(Config.LOCAL_STORAGE_PATH, Config.RENDITION_DISK_BUDGET_MB * 1024 * 1024)
+    return _lru
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _init_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.RENDITION_WORKERS, thread_name_prefix="rendition")
+    return _executor
+
+
+def _path_lock(path: str) -> threading.Lock:
+    with _init_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def get_rendition(storage_id, original_path: str, name: str) -> Optional[str]:
+    """
+    Returns the rendition's path, generating it on demand.
+    Returns None for originals Pillow can't decode (e.g. SVG).
+    """
+    if name not in RENDITIONS:
+        raise ValueError(f"Unknown rendition: {name}")
+    path = rendition_path(storage_id, original_path, name)
+    if os.path.exists(path):
+        get_lru().touch(path)
+        return path
+
+    lock = _path_lock(path)
+    with lock:
+        if not os.path.exists(path):
+            try:
+                size = render(original_path, path, RENDITIONS[name])
+            except Exception as e:
+                logger.warning(f"[Rendition] {name} of {original_path} failed: {e}")
+                return None
+            get_lru().add(path, size)
+    with _init_lock:
+        _path_locks.pop(path, None)
+    return path
+
+
+def schedule_renditions(storage_id, original_path: str):
+    """Pre-generates every rendition of a new upload on the background pool."""
+    executor = _get_executor()
+    for name in RENDITIONS:
+        executor.submit(get_rendition, storage_id, original_path, name)
+
+
+def remove_renditions(storage_id, original_path: str):
+    for name in RENDITIONS:
+        path = rendition_path(storage_id, original_path, name)
+        get_lru().discard(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def shutdown(wait: bool = True):
+    global _executor
+    with _init_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
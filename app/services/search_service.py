@@ -1,11 +1,15 @@
 # app/services/search_service.py
 
 import numpy as np
-from typing import List, Dict
-from bson import ObjectId
+from typing import List, Dict, Optional
+from fastapi import HTTPException
 
 from app.db import db
+from app.config import Config
+from app.services import ann_service, embedding_store, rendition_service
 from app.services.face_service import get_face_embedding_by_id
+from app.services.index_service import normalize_vectors
+from app.utils import clamp_limit, parse_file_id
 
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
@@ -23,7 +27,7 @@ def search_files_by_face(face_id: str, similarity_threshold: float = 0.7) -> Lis
     Returns a list of matching file metadata.
     """
     # Fetch the face document
-    face_doc = db.faces.find_one({"_id": ObjectId(face_id)})
+    face_doc = db.faces.find_one({"_id": parse_file_id(face_id)})
     if not face_doc:
         return []
 
@@ -32,35 +36,74 @@ def search_files_by_face(face_id: str, similarity_threshold: float = 0.7) -> Lis
     if face_embedding is None:
         return []
 
-    matching_files = []
-
-    # Fetch all file embeddings with matching event_id
-    file_cursor = db.files.find({"event_id": event_id})
-
-    for file_doc in file_cursor:
-        file_id = file_doc["_id"]
-
-        # Try to get the embedding_id from the file document
-        embedding_id = file_doc.get("embeddings_id")
+    # The event's files and their vectors: inline ones come with this query, linked ones in one join
+    file_docs = list(db.files.find({"event_id": event_id}, {"path": 1, **embedding_store.DOCUMENT_PROJECTION}))
+    vectors_by_file = embedding_store.load_document_vectors(file_docs)
 
-        # If missing, fall back to embeddings collection using file_id
-        if not embedding_id:
-            embedding_doc = db.embeddings.find_one({"file_id": file_id})
-        else:
-            embedding_doc = db.embeddings.find_one({"_id": embedding_id})
+    # Legacy files without embeddings_id: fall back to the embeddings collection by file_id
+    unlinked = [doc["_id"] for doc in file_docs if not doc.get("embeddings_id") and not doc.get(embedding_store.INLINE_FIELD)]
+    if unlinked:
+        for embedding_doc in db.embeddings.find({"file_id": {"$in": unlinked}}, {"file_id": 1, **embedding_store.PROJECTION}):
+            file_embedding = embedding_store.unpack(embedding_doc)
+            if len(file_embedding):
+                vectors_by_file[embedding_doc["file_id"]] = file_embedding
 
-        if not embedding_doc:
+    query = normalize_vectors(face_embedding)
+    matching_files = []
+    for file_doc in file_docs:
+        file_embedding = vectors_by_file.get(file_doc["_id"])
+        if file_embedding is None:
             continue
-
-        file_embedding = embedding_doc["embeddings_vector"]
-        similarity = cosine_similarity(face_embedding, file_embedding)
+        # Best pair between the face's and the file's face vectors
+        similarity = float((query @ normalize_vectors(file_embedding).T).max())
 
         if similarity >= similarity_threshold:
             matching_files.append({
-                "file_id": str(file_id),
+                "file_id": str(file_doc["_id"]),
                 "path": file_doc["path"],
                 "similarity": similarity
             })
 
     # Sort results by highest similarity first
     return sorted(matching_files, key=lambda x: x["similarity"], reverse=True)
+
+
+def attended_events(owner_id) -> List[str]:
+    """Events a guest has registered a face for, i.e. the events they attended."""
+    return [event_id for event_id in db.faces.distinct("event_id", {"owner_id": owner_id}) if event_id]
+
+
+def search_files_across_events(
+    face_id: str,
+    event_ids: Optional[List[str]] = None,
+    top_k: int = None,
+    nprobe: int = None
+) -> Dict:
+    """
+    Approximate search for a face over every event the guest attended (or `event_ids`)
+    through the IVF index instead of one exact scan per event. `nprobe` trades recall for latency.
+    """
+    face_doc = db.faces.find_one({"_id": parse_file_id(face_id)}, {"owner_id": 1, **embedding_store.DOCUMENT_PROJECTION})
+    if not face_doc:
+        raise HTTPException(status_code=404, detail="Face not found")
+    face_embedding = embedding_store.document_vectors(face_doc)
+    if face_embedding is None or not len(face_embedding):
+        raise HTTPException(status_code=404, detail="Face embedding not found or empty.")
+
+    event_ids = event_ids or attended_events(face_doc.get("owner_id"))
+    top_k = clamp_limit(top_k, Config.MATCH_PAGE_SIZE, Config.MATCH_MAX_PAGE_SIZE)
+    matches = ann_service.search(face_embedding, top_k, nprobe, Config.MATCH_THRESHOLD, event_ids)
+    return {
+        "face_id": str(face_id),
+        "event_ids": event_ids,
+        "matches": [
+            {
+                "file_id": str(file_id),
+                "event_id": event_id,
+                "similarity": similarity,
+                "download_url": f"/api/reconstruct-file/{file_id}",
+                **rendition_service.rendition_urls(file_id)
+            }
+            for file_id, event_id, similarity in matches
+        ]
+    }
@@ -0,0 +1,105 @@
+# app/services/shard_service.py
+
+import os
+import glob
+import json
+import logging
+import numpy as np
+from bson import ObjectId
+from typing import List, Optional
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+def shard_dir(event_id: str) -> str:
+    return os.path.join(Config.SHARD_PATH, f"event_{event_id}")
+
+
+def encode_ids(file_ids: List) -> list:
+    """JSON-safe file ids that keep their type (sequence ints, legacy ObjectIds)."""
+    return [None if file_id is None else [str(file_id), type(file_id).__name__] for file_id in file_ids]
+
+
+def decode_ids(entries: list) -> List:
+    decoded = []
+    for entry in entries:
+        if entry is None:
+            decoded.append(None)
+            continue
+        value, kind = entry
+        decoded.append(int(value) if kind == "int" else ObjectId(value) if kind == "ObjectId" else value)
+    return decoded
+
+
+def _write_npy(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+
+
+def write_shard(event_id: str, generation: int, codec: str, rows: np.ndarray, owners: np.ndarray, file_ids: List) -> str:
+    """
+    Writes an event's index rows, row owners and the file-id sidecar as a new version,
+    then swaps the manifest over to it with os.replace, so readers see either the old
+    or the new shard, never a partial one. Older versions are removed afterwards;
+    processes that still map them keep their pages until they remap.
+    """
+    directory = shard_dir(event_id)
+    os.makedirs(directory, exist_ok=True)
+    version = f"{generation}.{os.getpid()}"
+    files = {"rows": f"rows.{version}.npy", "owners": f"owners.{version}.npy", "ids": f"ids.{version}.json"}
+    _write_npy(os.path.join(directory, files["rows"]), rows)
+    _write_npy(os.path.join(directory, files["owners"]), owners.astype(np.int32))
+    with open(os.path.join(directory, files["ids"]), "w") as f:
+        json.dump(encode_ids(file_ids), f)
+
+    manifest = {"generation": generation, "codec": codec, "rows": len(rows), "files": files}
+    tmp_path = os.path.join(directory, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST))
+    _remove_older(directory, generation)
+    return directory
+
+
+def _remove_older(directory: str, generation: int):
+    for path in glob.glob(os.path.join(directory, "*.*.*.*")):
+        try:
+            if int(os.path.basename(path).split(".")[1]) < generation:
+                os.remove(path)
+        except (ValueError, OSError):
+            continue  # another writer's file, or still open on a platform that refuses the delete
+
+
+def read_manifest(event_id: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(shard_dir(event_id), MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_shard(event_id: str, generation: int, codec: str):
+    """
+    (rows, owners, file_ids) of the event's shard if it matches `generation` and `codec`,
+    with rows and owners memory-mapped read-only so every worker shares the same page
+    cache pages. None when there is no usable shard.
+    """
+    manifest = read_manifest(event_id)
+    if not manifest or manifest.get("generation") != generation or manifest.get("codec") != codec:
+        return None
+    directory = shard_dir(event_id)
+    files = manifest["files"]
+    try:
+        rows = np.load(os.path.join(directory, files["rows"]), mmap_mode="r")
+        owners = np.load(os.path.join(directory, files["owners"]), mmap_mode="r")
+        with open(os.path.join(directory, files["ids"])) as f:
+            file_ids = decode_ids(json.load(f))
+    except (OSError, ValueError) as e:
+        logger.warning(f"[Shards] unreadable shard for event {event_id}: {e}")
+        return None
+    return rows, owners, file_ids
+
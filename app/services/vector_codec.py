@@ -0,0 +1,53 @@
+# app/services/vector_codec.py
+
+import struct
+import numpy as np
+
+# Header: magic, version, dtype code, reserved byte, rows, dim (little-endian)
+MAGIC = b"VEC"
+VERSION = 1
+HEADER = struct.Struct("<3sBBxII")
+
+DTYPES = {"float32": (1, np.dtype("<f4")), "float16": (2, np.dtype("<f2"))}
+DTYPE_CODES = {code: dtype for code, dtype in DTYPES.values()}
+
+
+class CodecError(ValueError):
+    pass
+
+
+def encode(vectors, dtype: str = "float32") -> bytes:
+    """
+    Packs one vector or a (rows, dim) matrix into header + raw little-endian values.
+    A 512-d float32 vector takes 2 KB + 14 bytes; float16 halves that.
+    """
+    if dtype not in DTYPES:
+        raise CodecError(f"Unsupported dtype: {dtype}")
+    code, np_dtype = DTYPES[dtype]
+    matrix = np.asarray(vectors, dtype=np_dtype)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+    if matrix.ndim != 2:
+        raise CodecError(f"Expected a vector or matrix, got shape {matrix.shape}")
+    rows, dim = matrix.shape
+    return HEADER.pack(MAGIC, VERSION, code, rows, dim) + np.ascontiguousarray(matrix).tobytes()
+
+
+def decode(data: bytes, as_float32: bool = True) -> np.ndarray:
+    """Returns the (rows, dim) matrix. float16 payloads are widened unless `as_float32` is False."""
+    if len(data) < HEADER.size:
+        raise CodecError("Truncated vector header")
+    magic, version, code, rows, dim = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CodecError("Not an encoded vector")
+    if version != VERSION:
+        raise CodecError(f"Unsupported codec version: {version}")
+    np_dtype = DTYPE_CODES.get(code)
+    if np_dtype is None:
+        raise CodecError(f"Unknown dtype code: {code}")
+    if len(data) != HEADER.size + rows * dim * np_dtype.itemsize:
+        raise CodecError("Vector payload length does not match header")
+    matrix = np.frombuffer(data, dtype=np_dtype, offset=HEADER.size).reshape(rows, dim)
+    if as_float32 and np_dtype != np.float32:
+        return matrix.astype(np.float32)
+    return matrix
@@ -1,10 +1,14 @@
+import base64
 import hashlib
+import json
 import os
 import uuid
 import logging
 import numpy as np
-from typing import List
+from typing import List, Optional, Tuple
 from fastapi import HTTPException
+from bson import ObjectId
+from bson.errors import InvalidId
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
@@ -45,6 +49,96 @@ def validate_event_id(event_id: str):
         raise HTTPException(status_code=400, detail="Invalid event ID")
 
 
+def parse_file_id(file_id: str):
+    """File ids are sequence integers; older documents may still use ObjectIds."""
+    if isinstance(file_id, int):
+        return file_id
+    if isinstance(file_id, str) and file_id.isdigit():
+        return int(file_id)
+    if ObjectId.is_valid(file_id):
+        return ObjectId(file_id)
+    raise HTTPException(status_code=400, detail="Invalid file_id format")
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single `bytes=` range into inclusive (start, end) offsets.
+    Returns None when the whole file should be sent (no header, multiple or
+    malformed ranges); raises 416 when the range lies outside the file.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start, _, end = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            start, end = int(start), int(end) if end else size - 1
+        elif end:
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+# ---------- PAGINATION ----------
+
+def encode_cursor(position: dict) -> str:
+    """Opaque, URL-safe page token for a keyset position."""
+    raw = json.dumps(position, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def id_cursor(last_id) -> str:
+    """Page token resuming after `last_id` in an `_id`-ordered listing."""
+    if isinstance(last_id, ObjectId):
+        return encode_cursor({"id": str(last_id), "t": "oid"})
+    return encode_cursor({"id": last_id, "t": "int"})
+
+
+def after_id_filter(cursor: Optional[str]) -> dict:
+    """
+    Query filter for documents after an `id_cursor`. Sequence ids sort before
+    legacy ObjectIds in BSON order, so an int cursor also admits every ObjectId.
+    """
+    position = decode_cursor(cursor)
+    if not position:
+        return {}
+    try:
+        if position.get("t") == "oid":
+            return {"_id": {"$gt": ObjectId(position["id"])}}
+        return {"$or": [{"_id": {"$gt": int(position["id"])}}, {"_id": {"$type": "objectId"}}]}
+    except (KeyError, TypeError, ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def clamp_limit(limit: Optional[int], default: int, maximum: int) -> int:
+    if limit is None:
+        return default
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return min(limit, maximum)
+
+
 # ---------- VECTOR UTILS ----------
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
@@ -57,6 +151,41 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     return dot / (norm_v1 * norm_v2 + 1e-10)
 
 
+# ---------- PROCESS UTILS ----------
+
+def get_rss_mb() -> float:
+    """Resident memory of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        return None
+
+
+def get_pss_mb() -> float:
+    """
+    Proportional set size in MB: shared pages are split between the processes mapping
+    them, so unlike RSS it shows what memory-mapped shards actually save. Linux only.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
 # ---------- FILE UTILS ----------
 
 def save_file(file_data: bytes, save_path: str):
@@ -0,0 +1,75 @@
+# benchmarks/bench_ann.py
+#
+# Cross-event face search: exact brute force over every vector versus the IVF index
+# of ann_service at several nprobe values. Data is synthetic "identities" (a few faces
+# each, with noise) so neighbours are meaningful. Reports recall@k against the exact
+# top-k, query latency and the build (k-means) time.
+#
+#   python benchmarks/bench_ann.py --vectors 100000 --queries 200 --k 10 --nprobe 1 4 8 16 32
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import ann_service
+from app.services.index_service import normalize_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--faces-per-identity", type=int, default=20)
+    parser.add_argument("--noise", type=float, default=1.2)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--sample", type=int, default=50000)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    identities = rng.normal(size=(args.vectors // args.faces_per_identity + 1, args.dim)).astype(np.float32)
+    owners = rng.integers(len(identities), size=args.vectors)
+    data = normalize_vectors(identities[owners] + args.noise * rng.normal(size=(args.vectors, args.dim)).astype(np.float32))
+    query_ids = rng.choice(len(identities), args.queries, replace=False)
+    queries = normalize_vectors(identities[query_ids] + args.noise * rng.normal(size=(args.queries, args.dim)).astype(np.float32))
+
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        scores = data @ query
+        top = np.argpartition(-scores, args.k)[:args.k]
+        exact.append(set(top.tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+    nlist = args.nlist or max(1, int(4 * np.sqrt(args.vectors)))
+    start = time.perf_counter()
+    sample = data[rng.choice(args.vectors, min(args.sample, args.vectors), replace=False)]
+    index = ann_service.IVFIndex(ann_service.train_kmeans(sample, nlist))
+    train_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for row in range(args.vectors):
+        index.add(row, f"event{row % args.events}", data[row])
+    add_s = time.perf_counter() - start
+
+    print(f"vectors={args.vectors} dim={args.dim} nlist={nlist} k={args.k} queries={args.queries}")
+    print(f"train {train_s:.1f}s on {len(sample)} vectors, add {add_s:.1f}s")
+    print(f"{'method':>12} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+    print(f"{'exact':>12} {1.0:>9.3f} {exact_ms:>9.2f} {1.0:>7.1f}x")
+    for nprobe in args.nprobe:
+        hits = 0
+        start = time.perf_counter()
+        for query, truth in zip(queries, exact):
+            found = index.search(query, args.k, nprobe)
+            hits += len(truth & {file_id for file_id, _, _ in found})
+        ann_ms = (time.perf_counter() - start) * 1000 / args.queries
+        print(f"{'nprobe=' + str(nprobe):>12} {hits / (args.k * args.queries):>9.3f} {ann_ms:>9.2f} {exact_ms / ann_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
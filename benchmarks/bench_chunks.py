@@ -0,0 +1,94 @@
+# benchmarks/bench_chunks.py
+#
+# Chunk persistence throughput (MB/s): one insert_one per chunk plus the old
+# file_id backfill versus chunk_service.save_chunks bulk writes.
+# Runs against mongomock by default; --latency-ms adds a simulated round trip
+# per command, --mongo-uri points at a real server instead.
+#
+#   python benchmarks/bench_chunks.py --size-mb 25 --latency-ms 1
+
+import os
+import sys
+import time
+import argparse
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from bson import ObjectId
+from app.services import chunk_service
+
+
+class LatencyCollection:
+    """Wraps a collection so every command pays a fixed round-trip delay."""
+
+    def __init__(self, collection, latency: float):
+        self._collection = collection
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency)
+            return attr(*args, **kwargs)
+        return call
+
+
+class Database:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+
+def per_chunk_inserts(db, chunks, file_id):
+    """The pre-bulk implementation from handle_file_upload."""
+    chunk_ids = []
+    for index, chunk_data in enumerate(chunks):
+        chunk_id = ObjectId()
+        db.chunks.insert_one({"_id": chunk_id, "file_id": None, "chunk_index": index, "chunk_data": chunk_data})
+        chunk_ids.append(chunk_id)
+    db.chunks.update_many({"_id": {"$in": chunk_ids}}, {"$set": {"file_id": file_id}})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=25)
+    parser.add_argument("--chunk-kb", type=int, default=chunk_service.CHUNK_SIZE // 1024)
+    parser.add_argument("--budget-mb", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        collection = MongoClient(args.mongo_uri)["bench_chunks"]["chunks"]
+    else:
+        import mongomock
+        collection = mongomock.MongoClient()["bench_chunks"]["chunks"]
+    db = Database(LatencyCollection(collection, args.latency_ms / 1000) if args.latency_ms else collection)
+
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    chunks = chunk_service.chunk_image_bytes(payload, args.chunk_kb * 1024)
+    print(f"file={args.size_mb} MB chunks={len(chunks)} x {args.chunk_kb} KB latency={args.latency_ms} ms")
+
+    def measure(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            collection.delete_many({})
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return args.size_mb / best
+
+    print(f"{'mode':>22} {'MB/s':>10}")
+    print(f"{'insert_one + backfill':>22} {measure(lambda: per_chunk_inserts(db, chunks, 1)):>10.1f}")
+    with patch.object(chunk_service, "db", db):
+        for budget in args.budget_mb:
+            mb_per_sec = measure(lambda: chunk_service.save_chunks(1, chunks, budget * 1024 * 1024))
+            print(f"{f'bulk {budget} MB budget':>22} {mb_per_sec:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_decode.py
+#
+# Decode time and peak memory per megapixel for an upload-sized JPEG:
+#   full     Image.open().convert("RGB"), what every stage did before
+#   proxy    image_service.DecodedImage with DETECTION_MAX_SIDE, draft-mode decode only
+#            (an upload with no faces)
+#   proxy+full  the proxy, then .full for cropping (an upload with faces)
+# Each case runs in its own subprocess and peak memory is its VmHWM above the
+# resident size before decoding (Linux only).
+#
+#   python benchmarks/bench_decode.py --width 6000 --height 4000 --max-sides 2000 1600 800
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services.image_service import DecodedImage
+
+
+def synthetic_jpeg(path: str, width: int, height: int):
+    rng = np.random.default_rng(0)
+    noise = rng.normal(128, 30, (height // 8, width // 8, 3)).clip(0, 255).astype(np.uint8)
+    Image.fromarray(noise).resize((width, height), Image.BILINEAR).save(path, "JPEG", quality=90)
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field))
+
+
+def run_case(path: str, case: str, max_side: int, repeat: int) -> dict:
+    with open(path, "rb") as f:
+        data = f.read()
+    # Reset the high-water mark so import-time peaks don't hide the decode's own
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline_kb = rss_kb("VmRSS:")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if case == "full":
+            with Image.open(io.BytesIO(data)) as image:
+                decoded = image.convert("RGB")
+        else:
+            decoded = DecodedImage(data, max_side)
+            if case == "proxy+full":
+                decoded.full
+        del decoded
+    ms = (time.perf_counter() - start) * 1000 / repeat
+    peak_kb = rss_kb("VmHWM:")
+    return {"ms": ms, "peak_mb": (peak_kb - baseline_kb) / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--max-sides", type=int, nargs="+", default=[2000, 1600, 800])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--path", default="/tmp/bench_decode.jpg")
+    parser.add_argument("--case", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--max-side", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.path, args.case, args.max_side, args.repeat)))
+        return
+
+    synthetic_jpeg(args.path, args.width, args.height)
+    megapixels = args.width * args.height / 1e6
+    cases = [("full", 0)] + [(case, max_side) for max_side in args.max_sides for case in ("proxy", "proxy+full")]
+
+    print(f"jpeg={args.width}x{args.height} ({megapixels:.0f} MP, {os.path.getsize(args.path) / 1e6:.1f} MB) repeat={args.repeat}")
+    print(f"{'case':>11} {'max side':>9} {'ms':>8} {'ms/MP':>7} {'peak MB':>8} {'MB/MP':>6} {'speedup':>8}")
+    baseline = None
+    for case, max_side in cases:
+        output = subprocess.run([sys.executable, __file__, "--path", args.path, "--case", case,
+                                 "--max-side", str(max_side), "--repeat", str(args.repeat)],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        baseline = baseline or result["ms"]
+        print(f"{case:>11} {max_side or '-':>9} {result['ms']:>8.1f} {result['ms'] / megapixels:>7.2f} "
+              f"{result['peak_mb']:>8.1f} {result['peak_mb'] / megapixels:>6.2f} {baseline / result['ms']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
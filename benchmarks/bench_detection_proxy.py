@@ -0,0 +1,106 @@
+# benchmarks/bench_detection_proxy.py
+#
+# MTCNN on the full frame versus on resolution-capped proxies
+# (embedding_service.detect_boxes with DETECTION_MAX_SIDE). The frame is a synthetic
+# DSLR-sized photo: drawn faces of known sizes and positions on a noisy background.
+# Reports detection time, recall against those ground-truth boxes (IoU >= 0.5 once
+# the boxes are mapped back to the original), mean IoU, and the smallest face found.
+#
+#   python benchmarks/bench_detection_proxy.py --width 6000 --height 4000 --max-sides 0 3000 1600 800
+#   python benchmarks/bench_detection_proxy.py --max-sides 1600 --min-face-size 12
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import embedding_service, model_registry
+
+
+def drawn_face(size: int, rng) -> tuple:
+    """A cartoon face MTCNN detects reliably, and its paste mask."""
+    side = 200
+    face = Image.new("RGB", (side, side))
+    mask = Image.new("L", (side, side), 0)
+    draw, mask_draw = ImageDraw.Draw(face), ImageDraw.Draw(mask)
+    tone = tuple(int(c) for c in rng.integers([170, 120, 90], [240, 190, 160]))
+    draw.ellipse((30, 10, 170, 190), fill=tone)
+    mask_draw.ellipse((30, 10, 170, 190), fill=255)
+    draw.pieslice((25, 0, 175, 110), 180, 360, fill=(60, 40, 20))
+    for cx in (70, 130):
+        draw.line((cx - 22, 68, cx + 22, 64), fill=(50, 30, 20), width=6)
+        draw.ellipse((cx - 18, 80, cx + 18, 98), fill=(250, 250, 250))
+        draw.ellipse((cx - 8, 82, cx + 8, 97), fill=(60, 40, 30))
+    draw.polygon([(100, 95), (88, 135), (112, 135)], fill=tuple(max(0, c - 35) for c in tone))
+    draw.chord((70, 140, 130, 170), 0, 180, fill=(150, 50, 50))
+    face = face.filter(ImageFilter.GaussianBlur(2))
+    return face.resize((size, size)), mask.resize((size, size))
+
+
+def synthetic_frame(width: int, height: int, sizes: list, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(128, 20, (height // 4, width // 4, 3)).clip(0, 255).astype(np.uint8)
+    frame = Image.fromarray(noise).resize((width, height), Image.BILINEAR)
+    boxes, x, y, row = [], 50, 50, 0
+    for size in sizes:
+        if x + size > width - 50:
+            x, y, row = 50, y + row + 50, 0
+        face, mask = drawn_face(size, rng)
+        frame.paste(face, (x, y), mask)
+        # The drawn head fills the ellipse (30..170, 10..190) of the 200 px template
+        boxes.append((x + 0.15 * size, y + 0.05 * size, x + 0.85 * size, y + 0.95 * size))
+        x, row = x + size + 50, max(row, size)
+    return frame, np.array(boxes, dtype=np.float32)
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(len(a), len(b)) intersection over union."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = lambda boxes: (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / (area(a)[:, None] + area(b)[None, :] - inter)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[40, 60, 80, 120, 160, 240, 320, 480, 640, 900],
+                        help="face sizes in original pixels")
+    parser.add_argument("--max-sides", type=int, nargs="+", default=[0, 3000, 2000, 1600, 1200, 800])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--min-face-size", type=int, default=None, help="override DETECTION_MIN_FACE_SIZE (proxy px)")
+    args = parser.parse_args()
+
+    frame, truth = synthetic_frame(args.width, args.height, args.sizes)
+    detector = model_registry.get_detector()
+    if args.min_face_size:
+        detector.min_face_size = args.min_face_size
+    embedding_service.detect_boxes(frame.resize((320, 240)))  # warm-up
+
+    print(f"frame={args.width}x{args.height} ({args.width * args.height / 1e6:.0f} MP) faces={len(truth)} "
+          f"min_face_size={detector.min_face_size} thresholds={detector.thresholds}")
+    print(f"{'max side':>9} {'detect ms':>10} {'speedup':>8} {'recall':>7} {'mean IoU':>9} {'smallest found':>15}")
+    baseline = None
+    for max_side in args.max_sides:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            boxes = embedding_service.detect_boxes(frame, max_side)
+        ms = (time.perf_counter() - start) * 1000 / args.repeat
+        baseline = baseline or ms
+
+        overlaps = iou(truth, boxes).max(axis=1) if len(boxes) else np.zeros(len(truth))
+        found = overlaps >= 0.5
+        smallest = min((size for size, hit in zip(args.sizes, found) if hit), default=None)
+        print(f"{max_side or 'full':>9} {ms:>10.0f} {baseline / ms:>7.1f}x {found.mean():>7.2f} "
+              f"{overlaps[found].mean() if found.any() else 0:>9.2f} {str(smallest) + ' px' if smallest else '-':>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_duplicates.py
+#
+# Times duplicate_service.group_duplicates on random 512-d file signatures with
+# planted near-duplicates, against the old O(n²) Python pair loop (small n only).
+#
+#   python benchmarks/bench_duplicates.py --sizes 1000 10000 50000
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import duplicate_service
+from app.services.index_service import normalize_vectors
+from app.utils import cosine_similarity
+
+
+def planted_signatures(n: int, dim: int = 512, duplicate_ratio: float = 0.05, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.normal(size=(n, dim)).astype(np.float32)
+    copies = rng.choice(n, size=int(n * duplicate_ratio), replace=False)
+    sources = rng.choice(n, size=len(copies))
+    matrix[copies] = matrix[sources] + rng.normal(scale=0.02, size=(len(copies), dim)).astype(np.float32)
+    return normalize_vectors(matrix)
+
+
+def pair_loop(matrix, threshold):
+    """The pre-vectorisation implementation."""
+    pairs = []
+    for i in range(len(matrix)):
+        for j in range(i + 1, len(matrix)):
+            if cosine_similarity(matrix[i], matrix[j]) > threshold:
+                pairs.append((i, j))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--block-size", type=int, default=duplicate_service.BLOCK_SIZE)
+    parser.add_argument("--threshold", type=float, default=duplicate_service.DUPLICATE_THRESHOLD)
+    parser.add_argument("--loop-max", type=int, default=2000, help="largest n to run the pair loop on")
+    args = parser.parse_args()
+
+    print(f"block_size={args.block_size} threshold={args.threshold}")
+    print(f"{'files':>7} {'groups':>7} {'blocked s':>10} {'loop s':>10} {'tile MB':>8}")
+    for n in args.sizes:
+        matrix = planted_signatures(n)
+        start = time.perf_counter()
+        groups = duplicate_service.group_duplicates(matrix, args.threshold, args.block_size)
+        blocked = time.perf_counter() - start
+
+        loop = "-"
+        if n <= args.loop_max:
+            start = time.perf_counter()
+            pair_loop(matrix, args.threshold)
+            loop = f"{time.perf_counter() - start:.2f}"
+
+        tile_mb = min(n, args.block_size) ** 2 * 4 / 2 ** 20
+        print(f"{n:>7} {len(groups):>7} {blocked:>10.2f} {loop:>10} {tile_mb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_embedding.py
+#
+# CPU micro-benchmark for embedding_service.extract_embeddings.
+# MTCNN is stubbed to return N synthetic boxes so only crop + embedding is timed;
+# compares one forward pass per face against the batched path.
+#
+#   MODEL_PATH=/path/to/weights.pt python benchmarks/bench_embedding.py
+
+import os
+import sys
+import time
+import argparse
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import embedding_service, model_registry
+
+
+def synthetic_image(n_faces: int, face_size: int = 120):
+    cols = int(np.ceil(np.sqrt(n_faces)))
+    side = cols * face_size
+    pixels = np.random.default_rng(0).integers(0, 255, (side, side, 3), dtype=np.uint8)
+    boxes = np.array([
+        ((i % cols) * face_size, (i // cols) * face_size, (i % cols + 1) * face_size, (i // cols + 1) * face_size)
+        for i in range(n_faces)
+    ], dtype=np.float32)
+    return Image.fromarray(pixels), boxes
+
+
+def per_face_embeddings(image, boxes):
+    """The pre-batching implementation: one forward pass per face."""
+    embeddings = []
+    for (x1, y1, x2, y2) in boxes:
+        face = image.crop((int(x1), int(y1), int(x2), int(y2)))
+        tensor = embedding_service.face_transform(face).unsqueeze(0).to(model_registry.get_device())
+        with torch.no_grad():
+            embeddings.append(model_registry.get_embedder()(tensor).cpu().numpy().flatten().tolist())
+    return embeddings
+
+
+def run(fn, image, boxes, repeat):
+    fn(image, boxes)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(image, boxes)
+    elapsed = time.perf_counter() - start
+    return repeat / elapsed, repeat * len(boxes) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 10, 40])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model_registry.warm_up()
+    print(f"device={model_registry.get_device()} threads={torch.get_num_threads()} batch_size={embedding_service.Config.EMBEDDING_BATCH_SIZE}")
+    print(f"{'faces':>6} {'mode':>9} {'images/s':>10} {'faces/s':>10}")
+    for n_faces in args.faces:
+        image, boxes = synthetic_image(n_faces)
+        with patch.object(model_registry.get_detector(), "detect", return_value=(boxes, None)):
+            for mode, fn in (
+                ("per-face", per_face_embeddings),
+                ("batched", lambda img, _: embedding_service.extract_embeddings(img)),
+            ):
+                images_per_sec, faces_per_sec = run(fn, image, boxes, args.repeat)
+                print(f"{n_faces:>6} {mode:>9} {images_per_sec:>10.2f} {faces_per_sec:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# benchmarks/bench_embedding_storage.py
+#
+# Embeddings documents as Mongo sees them: BSON size and decode-to-matrix time for
+# the legacy nested arrays of doubles versus embedding_store's packed Binary
+# (float32 / float16 / int8). Decoding goes through bson like pymongo does.
+#
+#   python benchmarks/bench_embedding_storage.py --docs 5000 --faces 3
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import bson
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import embedding_store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--faces", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrices = rng.normal(size=(args.docs, args.faces, args.dim)).astype(np.float32)
+    formats = {"arrays": lambda m: {"embeddings_vector": m.tolist()}}
+    for dtype in embedding_store.DTYPES:
+        formats[dtype] = lambda m, dtype=dtype: embedding_store.pack(m, dtype)
+
+    print(f"docs={args.docs} faces/doc={args.faces} dim={args.dim}")
+    print(f"{'format':>8} {'KB/doc':>8} {'decode ms':>10} {'max abs err':>12}")
+    for name, build in formats.items():
+        raw = [bson.encode({"_id": i, "file_id": i, **build(m)}) for i, m in enumerate(matrices)]
+        start = time.perf_counter()
+        decoded = [embedding_store.unpack(bson.decode(data)) for data in raw]
+        seconds = time.perf_counter() - start
+        error = max(float(np.abs(d - m).max()) for d, m in zip(decoded[:100], matrices[:100]))
+        print(f"{name:>8} {np.mean([len(r) for r in raw]) / 1024:>8.2f} {seconds * 1000:>10.1f} {error:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_id_allocation.py
+#
+# Upload throughput against worker count with one counters update per upload
+# (--block-sizes 1, the old get_next_sequence) versus hi/lo blocks from
+# id_service.SequenceAllocator. Each worker stands for an API process: its own
+# allocator, uploading in a loop (allocate an id, insert the file document).
+# Without --mongo-uri the database is simulated: every call costs --rtt-ms, and
+# updates to the counters document also hold its write lock for --write-ms, which
+# is what serialises concurrent uploads on a real server.
+#
+#   python benchmarks/bench_id_allocation.py --workers 1 2 4 8 16 --block-sizes 1 100
+#   python benchmarks/bench_id_allocation.py --mongo-uri mongodb://localhost:27017
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services.id_service import SequenceAllocator
+
+
+class SimulatedCounters:
+    def __init__(self, rtt: float, write: float):
+        self.rtt = rtt
+        self.write = write
+        self.values = {}
+        self._document_lock = threading.Lock()
+
+    def find_one_and_update(self, query, update, **kwargs):
+        time.sleep(self.rtt / 2)
+        with self._document_lock:
+            time.sleep(self.write)
+            name = query["_id"]
+            self.values[name] = self.values.get(name, 0) + update["$inc"]["sequence_value"]
+            value = self.values[name]
+        time.sleep(self.rtt / 2)
+        return {"_id": name, "sequence_value": value}
+
+
+class SimulatedFiles:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+
+    def insert_one(self, doc):
+        time.sleep(self.rtt)
+
+
+def run(counters, files, workers: int, block_size: int, seconds: float) -> tuple:
+    stop = threading.Event()
+    done = [0] * workers
+    allocators = [SequenceAllocator(counters, block_size) for _ in range(workers)]
+
+    def worker(slot: int):
+        allocator = allocators[slot]
+        while not stop.is_set():
+            file_id = allocator.next("bench_file_id")
+            files.insert_one({"_id": file_id, "worker": slot})
+            done[slot] += 1
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(workers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    round_trips = sum(allocator.stats["round_trips"] for allocator in allocators)
+    return sum(done) / seconds, round_trips / max(1, sum(done))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--rtt-ms", type=float, default=0.5)
+    parser.add_argument("--write-ms", type=float, default=1.0, help="time the counters document stays locked per update")
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        database = MongoClient(args.mongo_uri)["bench_id_allocation"]
+        database.files.drop()
+        counters, files = database.counters, database.files
+        print(f"backend=mongo seconds={args.seconds}")
+    else:
+        counters = SimulatedCounters(args.rtt_ms / 1000, args.write_ms / 1000)
+        files = SimulatedFiles(args.rtt_ms / 1000)
+        print(f"backend=simulated rtt={args.rtt_ms}ms counters write lock={args.write_ms}ms seconds={args.seconds}")
+
+    print(f"{'block':>6} {'workers':>8} {'uploads/s':>10} {'speedup':>8} {'counter trips/upload':>21}")
+    for block_size in args.block_sizes:
+        baseline = None
+        for workers in args.workers:
+            throughput, trips = run(counters, files, workers, block_size, args.seconds)
+            baseline = baseline or throughput
+            print(f"{block_size:>6} {workers:>8} {throughput:>10.0f} {throughput / baseline:>7.2f}x {trips:>21.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_inference.py
+#
+# Concurrent embedding requests through inference_service.embed_async, first with
+# the models in this process (threadpool, competing with the event loop for the GIL)
+# and then with a pool of worker processes. Reports throughput, the mean number of
+# requests merged per batch, and event-loop lag measured by a 10 ms ticker: the
+# delay a request handler would see while inference is running.
+#
+#   MODEL_PATH=/path/to/weights.pt python benchmarks/bench_inference.py --requests 64 --faces 2 --pool 2
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import inference_service, model_registry
+
+
+async def ticker(stop: asyncio.Event, lags: list, interval: float = 0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def load(requests: int, crops: list, concurrency: int) -> dict:
+    stop, lags = asyncio.Event(), []
+    tick = asyncio.ensure_future(ticker(stop, lags))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await inference_service.embed_async(crops=crops)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    return {
+        "req_s": requests / elapsed,
+        "lag_p50_ms": np.percentile(lags, 50) * 1000 if lags else 0.0,
+        "lag_max_ms": max(lags) * 1000 if lags else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--faces", type=int, default=2, help="crops per request")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--pool", type=int, nargs="+", default=[1, 2])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    crops = [rng.integers(0, 255, (160, 160, 3), dtype=np.uint8) for _ in range(args.faces)]
+
+    print(f"requests={args.requests} faces/request={args.faces} concurrency={args.concurrency} cpus={os.cpu_count()}")
+    print(f"{'mode':>10} {'req/s':>8} {'mean batch':>11} {'loop lag p50 ms':>16} {'max ms':>8}")
+
+    model_registry.warm_up()
+    inference_service.embed(crops=crops)
+    result = asyncio.run(load(args.requests, crops, args.concurrency))
+    print(f"{'in-proc':>10} {result['req_s']:>8.1f} {'-':>11} {result['lag_p50_ms']:>16.1f} {result['lag_max_ms']:>8.1f}")
+
+    for size in args.pool:
+        inference_service.start_pool(size)
+        inference_service.embed(crops=crops)  # wait for the workers' warm-up
+        stats_before = inference_service.get_stats()
+        result = asyncio.run(load(args.requests, crops, args.concurrency))
+        stats = inference_service.get_stats()
+        batches = stats["batches"] - stats_before["batches"]
+        mean_batch = (stats["batched_requests"] - stats_before["batched_requests"]) / batches if batches else 0
+        inference_service.stop_pool()
+        print(f"{'pool=' + str(size):>10} {result['req_s']:>8.1f} {mean_batch:>11.2f} "
+              f"{result['lag_p50_ms']:>16.1f} {result['lag_max_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# benchmarks/bench_inline_embeddings.py
+#
+# Database round-trips and time per upload and per event read for the two
+# EMBEDDING_STORAGE_MODEs: "collection" (embeddings document + embeddings_id link)
+# and "inline" (packed vectors and boxes inside the file document). Uploads go
+# through the queued pipeline (insert pending, claim, attach) and the synchronous
+# path (embed, then one insert); reads build an event index and are compared with
+# the old per-file find_one join. Detection is replaced by random vectors so only
+# storage is measured. Runs against mongomock unless --mongo-uri is given.
+#
+#   python benchmarks/bench_inline_embeddings.py --files 2000 --faces 3
+
+import io
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+from unittest.mock import patch
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.db import INDEXES
+from app.services import embedding_store, index_service, pipeline_service
+from app.services.image_service import DecodedImage
+
+WRITES = {"insert_one", "insert_many", "update_one", "update_many", "find_one_and_update", "bulk_write"}
+READS = {"find_one", "find", "aggregate"}
+
+
+class CountingCollection:
+    def __init__(self, collection, counts: Counter):
+        self._collection = collection
+        self._counts = counts
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in WRITES | READS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counts["writes" if name in WRITES else "reads"] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, database):
+        self._database = database
+        self.counts = Counter()
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self.counts)
+
+    __getattr__ = __getitem__
+
+
+def upload(db, file_id: int, event_id: str, synchronous: bool):
+    file_doc = {"_id": file_id, "event_id": event_id, "path": f"/bench/{file_id}.jpg", "embeddings_id": None,
+                "embedding_status": pipeline_service.STATUS_PENDING}
+    if synchronous:
+        fields, _ = pipeline_service.embed_file(file_id, file_doc["path"])
+        db.files.insert_one({**file_doc, **fields})
+    else:
+        db.files.insert_one(file_doc)
+        pipeline_service.process_job({"file_id": file_id, "path": file_doc["path"], "event_id": event_id})
+
+
+def per_file_join(db, event_id: str) -> int:
+    """The pre-batching reader: one embeddings find_one per file of the event."""
+    faces = 0
+    for file_doc in db.files.find({"event_id": event_id}, {"embeddings_id": 1}):
+        doc = db.embeddings.find_one({"_id": file_doc["embeddings_id"]}, embedding_store.PROJECTION)
+        faces += len(embedding_store.unpack(doc)) if doc else 0
+    return faces
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--faces", type=int, default=3)
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+
+    rng = np.random.default_rng(0)
+    encoded = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(encoded, "JPEG")
+    image = DecodedImage(encoded.getvalue())
+    boxes = rng.uniform(0, 1000, (args.faces, 4)).astype(np.float32)
+
+    def faces(*_):
+        return rng.normal(size=(args.faces, 512)).astype(np.float32).tolist(), boxes
+
+    print(f"files={args.files} faces/file={args.faces} backend={'mongo' if args.mongo_uri else 'mongomock'}")
+    print(f"{'mode':>11} {'path':>12} {'writes/op':>10} {'reads/op':>9} {'ms/op':>8}")
+    for mode in ("collection", "inline"):
+        database = client[f"bench_inline_{mode}"]
+        for name in ("files", "embeddings"):
+            database[name].drop()
+        for collection, keys, options in INDEXES:
+            if args.mongo_uri and collection in ("files", "embeddings"):
+                database[collection].create_index(keys, **options)
+        db = CountingDatabase(database)
+
+        with patch.object(pipeline_service.Config, "EMBEDDING_STORAGE_MODE", mode), \
+                patch.object(pipeline_service, "db", db), patch.object(embedding_store, "db", db), \
+                patch.object(index_service, "db", db), \
+                patch.object(pipeline_service, "open_image", return_value=image), \
+                patch.object(pipeline_service, "compute_file_faces", side_effect=faces), \
+                patch.object(pipeline_service, "publish_file"), \
+                patch.object(index_service.cache_service, "event_generation", return_value=None), \
+                patch.object(index_service.cache_service, "get_cached_embeddings", return_value={}), \
+                patch.object(index_service.cache_service, "cache_embeddings"):
+            half = args.files // 2
+            for label, synchronous, file_ids in (("queued", False, range(half)), ("synchronous", True, range(half, args.files))):
+                db.counts.clear()
+                start = time.perf_counter()
+                for file_id in file_ids:
+                    upload(db, file_id, "bench", synchronous)
+                ms = (time.perf_counter() - start) * 1000 / len(file_ids)
+                print(f"{mode:>11} {label:>12} {db.counts['writes'] / len(file_ids):>10.2f} "
+                      f"{db.counts['reads'] / len(file_ids):>9.2f} {ms:>8.3f}")
+
+            db.counts.clear()
+            start = time.perf_counter()
+            index = index_service.build_event_index("bench")
+            ms = (time.perf_counter() - start) * 1000
+            print(f"{mode:>11} {'event read':>12} {db.counts['writes']:>10} {db.counts['reads']:>9} {ms:>8.1f}  ({len(index)} faces)")
+
+            if mode == "collection":
+                db.counts.clear()
+                start = time.perf_counter()
+                found = per_file_join(db, "bench")
+                ms = (time.perf_counter() - start) * 1000
+                print(f"{'per-file':>11} {'event read':>12} {db.counts['writes']:>10} {db.counts['reads']:>9} {ms:>8.1f}  ({found} faces)")
+
+
+if __name__ == "__main__":
+    main()
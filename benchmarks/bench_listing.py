@@ -0,0 +1,98 @@
+# benchmarks/bench_listing.py
+#
+# Gallery listing at scale: the old unbounded full-document scan versus keyset pages
+# from file_service.get_files_by_event (first page and a page deep in the event).
+# Runs against mongomock by default (no indexes, so it understates the gain);
+# pass --mongo-uri to measure a real server with the db.INDEXES in place.
+#
+#   python benchmarks/bench_listing.py --files 100000 --limit 100
+
+import os
+import sys
+import json
+import time
+import argparse
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from bson import ObjectId
+from bson.json_util import dumps
+from app.db import INDEXES
+from app.services import file_service
+
+
+def seed(collection, count: int, event_id: str):
+    owner = ObjectId()
+    batch = []
+    for file_id in range(1, count + 1):
+        batch.append({
+            "_id": file_id,
+            "filename": f"IMG_{file_id:06d}.jpg",
+            "path": f"/storage/event_{event_id}/{ObjectId()}_IMG_{file_id:06d}.jpg",
+            "file_version": 1,
+            "owner_id": owner,
+            "event_id": event_id,
+            "embeddings_id": ObjectId(),
+            "embedding_status": "created",
+            "content_hash": os.urandom(32).hex(),
+            "phash": os.urandom(8).hex(),
+            "size": 4_000_000,
+            "chunk_size": 1024 * 1024,
+        })
+        if len(batch) == 10_000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def unbounded_listing(db, event_id: str) -> list:
+    """The pre-pagination get_files_by_event: every full document of the event."""
+    return [
+        {"file_id": f["_id"], "filename": os.path.basename(f["path"])}
+        for f in db.files.find({"event_id": event_id})
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(args.mongo_uri)["bench_listing"]
+        db.files.drop()
+        for collection, keys, options in INDEXES:
+            if collection == "files":
+                db.files.create_index(keys, **options)
+    else:
+        import mongomock
+        db = mongomock.MongoClient()["bench_listing"]
+
+    event_id = "bench"
+    seed(db.files, args.files, event_id)
+    print(f"files={args.files} page={args.limit}")
+
+    with patch.object(file_service, "db", db):
+        seconds, files = timed(lambda: unbounded_listing(db, event_id))
+        print(f"{'unbounded':>16} {seconds * 1000:>10.1f} ms {len(dumps(files)) / 1024:>10.0f} KB")
+
+        seconds, page = timed(lambda: file_service.get_files_by_event(event_id, args.limit))
+        print(f"{'first page':>16} {seconds * 1000:>10.1f} ms {len(json.dumps(page)) / 1024:>10.0f} KB")
+
+        deep_cursor = file_service.id_cursor(args.files - 2 * args.limit)
+        seconds, page = timed(lambda: file_service.get_files_by_event(event_id, args.limit, deep_cursor))
+        print(f"{'deep page':>16} {seconds * 1000:>10.1f} ms {len(json.dumps(page)) / 1024:>10.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
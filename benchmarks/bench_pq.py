@@ -0,0 +1,85 @@
+# benchmarks/bench_pq.py
+#
+# Product-quantised event indexes versus float32 rows. For each PQ_SUBVECTORS value
+# reports index memory per million faces, recall@k of the ADC ranking against exact
+# cosine, recall of the files above the match threshold, and query latency.
+# Data is synthetic identities (several noisy faces each) at the embedder's 512 dims.
+#
+#   python benchmarks/bench_pq.py --faces 50000 --train 20000 --subvectors 16 32 64 128
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import index_service, pq_codec
+from app.services.index_service import normalize_vectors
+
+
+def build(vectors: np.ndarray, quantizer=None) -> index_service.EventFaceIndex:
+    index = index_service.EventFaceIndex("bench", quantizer=quantizer)
+    for file_id, vector in enumerate(vectors):
+        index.add(file_id, vector)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faces", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--faces-per-identity", type=int, default=20)
+    parser.add_argument("--noise", type=float, default=1.2)
+    parser.add_argument("--train", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--subvectors", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    identities = rng.normal(size=(args.faces // args.faces_per_identity + 1, args.dim)).astype(np.float32)
+    faces = normalize_vectors(identities[rng.integers(len(identities), size=args.faces)]
+                              + args.noise * rng.normal(size=(args.faces, args.dim)).astype(np.float32))
+    queries = normalize_vectors(identities[rng.choice(len(identities), args.queries, replace=False)]
+                                + args.noise * rng.normal(size=(args.queries, args.dim)).astype(np.float32))
+    train = faces[rng.choice(args.faces, min(args.train, args.faces), replace=False)]
+
+    exact_index = build(faces)
+    exact_top, exact_above = [], []
+    start = time.perf_counter()
+    for query in queries:
+        exact_top.append({file_id for file_id, _ in exact_index.search(query, -1.0, args.k)})
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+    for query in queries:
+        exact_above.append({file_id for file_id, _ in exact_index.search(query, args.threshold)})
+
+    per_million = 1_000_000 / args.faces
+    print(f"faces={args.faces} dim={args.dim} k={args.k} threshold={args.threshold} queries={args.queries}")
+    print(f"{'codec':>10} {'MB/1M faces':>12} {'recall@k':>9} {'thr recall':>11} {'ms/query':>9} {'train s':>8}")
+    print(f"{'float32':>10} {exact_index.nbytes * per_million / 2**20:>12.0f} {1.0:>9.3f} {1.0:>11.3f} "
+          f"{exact_ms:>9.2f} {'-':>8}")
+
+    for m in args.subvectors:
+        start = time.perf_counter()
+        quantizer = pq_codec.ProductQuantizer.train(train, m)
+        train_s = time.perf_counter() - start
+        index = build(faces, quantizer)
+
+        hits = found_above = 0
+        start = time.perf_counter()
+        for query, truth in zip(queries, exact_top):
+            hits += len(truth & {file_id for file_id, _ in index.search(query, -1.0, args.k)})
+        pq_ms = (time.perf_counter() - start) * 1000 / args.queries
+        for query, truth in zip(queries, exact_above):
+            found_above += len(truth & {file_id for file_id, _ in index.search(query, args.threshold)})
+        above = sum(len(truth) for truth in exact_above)
+
+        megabytes = (index.nbytes * per_million + quantizer.codebooks.nbytes) / 2**20
+        print(f"{'pq' + str(m):>10} {megabytes:>12.0f} {hits / (args.k * args.queries):>9.3f} "
+              f"{found_above / above if above else 1.0:>11.3f} {pq_ms:>9.2f} {train_s:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# benchmarks/bench_renditions.py
+#
+# Gallery bytes per tile and generation time: original JPEG versus the thumb and
+# preview renditions from rendition_service.
+#
+#   python benchmarks/bench_renditions.py --megapixels 3 12 24
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import rendition_service
+
+
+def synthetic_photo(width: int, height: int) -> Image.Image:
+    """Smooth gradients plus mild noise, closer to a photo than pure noise."""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(0)
+    channels = [
+        128 + 100 * np.sin(x / (width / 6)),
+        128 + 100 * np.cos(y / (height / 4)),
+        128 + 60 * np.sin((x + y) / (width / 3)),
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 6, size=(height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megapixels", type=int, nargs="+", default=[3, 12, 24])
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'original KB':>12} " + " ".join(f"{name + ' KB':>10} {name + ' ms':>10}" for name in rendition_service.RENDITIONS))
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.megapixels:
+            width = int((mp * 1e6 * 4 / 3) ** 0.5)
+            height = int(width * 3 / 4)
+            original = os.path.join(tmp, f"{mp}mp.jpg")
+            synthetic_photo(width, height).save(original, "JPEG", quality=90)
+            row = f"{mp:>4} {os.path.getsize(original) / 1024:>12.0f} "
+            for name, edge in rendition_service.RENDITIONS.items():
+                target = os.path.join(tmp, f"{mp}_{name}.out")
+                start = time.perf_counter()
+                size = rendition_service.render(original, target, edge)
+                row += f"{size / 1024:>10.1f} {(time.perf_counter() - start) * 1000:>10.0f} "
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_shards.py
+#
+# Memory of N worker processes each holding one large event index: private copies
+# (what every uvicorn worker built before) versus read-only memory-mapped shards.
+# Every worker runs a few searches so all pages are touched, then reports RSS and
+# PSS (shared pages split across the processes mapping them; Linux only).
+#
+#   python benchmarks/bench_shards.py --faces 200000 --workers 4
+
+import os
+import sys
+import argparse
+import tempfile
+import multiprocessing as mp
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def worker(mode: str, shard_path: str, searches: int, ready, go, results):
+    from app.config import Config
+    Config.SHARD_PATH = shard_path
+    from app.services import index_service, shard_service
+    from app.utils import get_pss_mb, get_rss_mb
+
+    before = get_rss_mb()
+    rows, owners, file_ids = shard_service.load_shard("bench", 1, "float32")
+    if mode == "private":
+        rows, owners = np.array(rows), np.array(owners)
+    index = index_service.EventFaceIndex.from_shard("bench", 1, None, rows, owners, file_ids)
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(searches):
+        index.search(rng.normal(size=rows.shape[1]), threshold=0.6)
+    ready.put(None)
+    go.wait()  # measure while every worker is alive, so shared pages are split between them
+    results.put((get_rss_mb() - before, get_rss_mb(), get_pss_mb()))
+    go.wait()
+
+
+def run(mode: str, workers: int, shard_path: str, searches: int):
+    ctx = mp.get_context("spawn")
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Barrier(workers + 1)
+    processes = [ctx.Process(target=worker, args=(mode, shard_path, searches, ready, go, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    go.wait()
+    measured = [results.get() for _ in processes]
+    go.wait()
+    for process in processes:
+        process.join()
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faces", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--searches", type=int, default=3)
+    args = parser.parse_args()
+
+    from app.services import shard_service
+    from app.services.index_service import normalize_vectors
+
+    with tempfile.TemporaryDirectory() as shard_path:
+        shard_service.Config.SHARD_PATH = shard_path
+        rows = normalize_vectors(np.random.default_rng(0).normal(size=(args.faces, args.dim)))
+        file_ids = list(range(args.faces))
+        shard_service.write_shard("bench", 1, "float32", rows, np.arange(args.faces), file_ids)
+        size_mb = rows.nbytes / 2**20
+        del rows
+
+        print(f"faces={args.faces} dim={args.dim} index={size_mb:.0f} MB workers={args.workers}")
+        print(f"{'mode':>8} {'RSS growth/worker':>18} {'RSS/worker':>11} {'PSS/worker':>11} {'PSS total':>10}")
+        for mode in ("private", "mmap"):
+            measured = run(mode, args.workers, shard_path, args.searches)
+            growth = np.mean([m[0] for m in measured])
+            rss = np.mean([m[1] for m in measured])
+            pss = [m[2] for m in measured]
+            pss_text = (f"{np.mean(pss):>11.0f} {sum(pss):>10.0f}") if None not in pss else f"{'n/a':>11} {'n/a':>10}"
+            print(f"{mode:>8} {growth:>18.0f} {rss:>11.0f} {pss_text}")
+
+
+if __name__ == "__main__":
+    main()
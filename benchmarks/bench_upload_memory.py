@@ -0,0 +1,98 @@
+# benchmarks/bench_upload_memory.py
+#
+# Peak Python heap per upload (tracemalloc): the old buffered ingest (read whole body,
+# hash, write, slice into chunks) versus file_service.spool_upload followed by
+# store_chunks.
+# The upload body is spooled on disk like Starlette's UploadFile, and the chunk store
+# discards writes so only the ingest path itself is measured.
+#
+#   python benchmarks/bench_upload_memory.py --size-mb 10 50 200
+
+import os
+import sys
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.config import Config
+from app.services import chunk_service, file_service
+
+
+class SpooledUpload:
+    def __init__(self, path):
+        self._f = open(path, "rb")
+
+    async def read(self, size=-1):
+        return self._f.read(size)
+
+    def close(self):
+        self._f.close()
+
+
+class NullCollection:
+    def insert_many(self, docs, ordered=True):
+        pass
+
+    def delete_many(self, query):
+        pass
+
+
+class NullDatabase:
+    chunks = NullCollection()
+
+
+async def buffered_ingest(upload, file_id, path):
+    """The pre-streaming implementation from handle_file_upload."""
+    file_bytes = await upload.read()
+    file_hash = hashlib.sha256(file_bytes).hexdigest()
+    with open(path, "wb") as f:
+        f.write(file_bytes)
+    chunk_service.save_chunks(file_id, chunk_service.chunk_image_bytes(file_bytes, Config.CHUNK_SIZE))
+    return file_hash, len(file_bytes)
+
+
+async def streaming_ingest(upload, file_id, path):
+    """Spool and hash, then chunk from the spool file (skipped for duplicates)."""
+    file_hash, size = await file_service.spool_upload(upload, path)
+    file_service.store_chunks(file_id, path)
+    return file_hash, size
+
+
+def peak_mb(ingest, source, target):
+    upload = SpooledUpload(source)
+    tracemalloc.start()
+    try:
+        asyncio.run(ingest(upload, 1, target))
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+        upload.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    print(f"chunk={Config.CHUNK_SIZE // 1024} KB write budget={Config.CHUNK_WRITE_BUDGET // 1024 // 1024} MB")
+    print(f"{'file MB':>8} {'buffered peak MB':>17} {'streaming peak MB':>18}")
+    with tempfile.TemporaryDirectory() as tmp, \
+            patch.object(chunk_service, "db", NullDatabase()), \
+            patch.object(file_service, "db", NullDatabase()):
+        for size_mb in args.size_mb:
+            source = os.path.join(tmp, "upload.bin")
+            with open(source, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(1024 * 1024))
+            target = os.path.join(tmp, "stored.bin")
+            buffered = peak_mb(buffered_ingest, source, target)
+            streaming = peak_mb(streaming_ingest, source, target)
+            print(f"{size_mb:>8} {buffered:>17.1f} {streaming:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_vector_codec.py
+#
+# Embedding cache payloads: JSON lists (the old cache_service format) versus the
+# binary vector_codec (float32 / float16). Reports bytes per vector and encode/decode
+# time, and with --redis-host also the round trip for an event's worth of vectors:
+# one GET per key versus one pipelined SETEX batch and one MGET.
+#
+#   python benchmarks/bench_vector_codec.py --vectors 5000 --redis-host localhost
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services import vector_codec
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--redis-host", default=None)
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.vectors, 1, args.dim)).astype(np.float32)
+    lists = [v.tolist() for v in vectors]
+
+    formats = {
+        "json": (lambda: [json.dumps(v) for v in lists], json.loads),
+        "float32": (lambda: [vector_codec.encode(v) for v in vectors], vector_codec.decode),
+        "float16": (lambda: [vector_codec.encode(v, "float16") for v in vectors], vector_codec.decode),
+    }
+    print(f"vectors={args.vectors} dim={args.dim}")
+    print(f"{'format':>8} {'bytes/vec':>10} {'encode ms':>10} {'decode ms':>10}")
+    payloads = {}
+    for name, (encode_all, decode) in formats.items():
+        encoded = encode_all()
+        payloads[name] = encoded
+        encode_s = timed(encode_all)
+        decode_s = timed(lambda: [decode(p) for p in encoded])
+        print(f"{name:>8} {np.mean([len(p) for p in encoded]):>10.0f} {encode_s * 1000:>10.1f} {decode_s * 1000:>10.1f}")
+
+    if not args.redis_host:
+        return
+    import redis
+    client = redis.StrictRedis(host=args.redis_host, port=args.redis_port)
+    keys = [f"bench:embedding:{i}" for i in range(args.vectors)]
+
+    def set_each():
+        for key, payload in zip(keys, payloads["json"]):
+            client.setex(key, 60, payload)
+
+    def set_pipelined():
+        pipe = client.pipeline(transaction=False)
+        for key, payload in zip(keys, payloads["float32"]):
+            pipe.setex(key, 60, payload)
+        pipe.execute()
+
+    print(f"{'json GET per key':>24} set {timed(set_each, 1) * 1000:>8.0f} ms  "
+          f"get {timed(lambda: [json.loads(client.get(k)) for k in keys], 1) * 1000:>8.0f} ms")
+    print(f"{'float32 pipeline + MGET':>24} set {timed(set_pipelined, 1) * 1000:>8.0f} ms  "
+          f"get {timed(lambda: [vector_codec.decode(v) for v in client.mget(keys)], 1) * 1000:>8.0f} ms")
+    client.delete(*keys)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import pytest
+import numpy as np
+from bson import ObjectId
+from datetime import datetime, timedelta
+from unittest.mock import patch, MagicMock
+
+from app.services import ann_service, search_service
+
+
+@pytest.fixture
+def clustered():
+    """200 vectors around 8 well separated centres."""
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(8, 64)).astype(np.float32)
+    labels = np.repeat(np.arange(8), 25)
+    return centres[labels] + 0.05 * rng.normal(size=(200, 64)).astype(np.float32)
+
+
+@pytest.fixture
+def index(clustered):
+    ivf = ann_service.IVFIndex(ann_service.train_kmeans(clustered, 8), nprobe=2)
+    for row, vector in enumerate(clustered):
+        ivf.add(row, f"event{row % 3}", vector)
+    return ivf
+
+
+@pytest.fixture(autouse=True)
+def reset_global_index():
+    ann_service._index = None
+    ann_service._loaded_mtime = None
+    yield
+    ann_service._index = None
+    ann_service._loaded_mtime = None
+
+
+def test_kmeans_returns_unit_centroids(clustered):
+    centroids = ann_service.train_kmeans(clustered, 8)
+
+    assert centroids.shape == (8, 64)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+
+
+def test_search_matches_exact_top_k(index, clustered):
+    results = index.search(clustered[5], k=5)
+
+    normalised = clustered / np.linalg.norm(clustered, axis=1, keepdims=True)
+    exact = np.argsort(-(normalised @ normalised[5]))[:5]
+    assert [file_id for file_id, _, _ in results] == exact.tolist()
+    assert results[0][2] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_search_filters_events(index, clustered):
+    results = index.search(clustered[5], k=10, event_ids=["event1"])
+
+    assert results
+    assert all(event_id == "event1" for _, event_id, _ in results)
+
+
+def test_remove_and_readd_file(index, clustered):
+    rows = len(index)
+
+    assert index.remove(5) == 1
+    assert len(index) == rows - 1
+    assert 5 not in [file_id for file_id, _, _ in index.search(clustered[5], k=5)]
+
+    index.add(5, "event2", clustered[5])
+    index.add(5, "event2", clustered[5])
+    assert len(index) == rows
+    assert index.search(clustered[5], k=1)[0][:2] == (5, "event2")
+
+
+def test_multi_face_file_keeps_best_score(index, clustered):
+    index.add("group", "event0", np.stack([clustered[0], clustered[199]]))
+
+    results = index.search(clustered[199], k=3)
+
+    assert "group" in [file_id for file_id, _, _ in results]
+    assert len({file_id for file_id, _, _ in results}) == len(results)
+
+
+def test_save_and_load_round_trip(tmp_path, index, clustered):
+    legacy_id = ObjectId()
+    index.add(legacy_id, "event0", clustered[7])
+    index.remove(3)
+    index.watermark = 42
+    path = str(tmp_path / "ann" / "faces.npz")
+
+    index.save(path)
+    loaded = ann_service.IVFIndex.load(path)
+
+    assert len(loaded) == len(index)
+    assert loaded.watermark == index.watermark
+    assert loaded.search(clustered[7], k=2) == index.search(clustered[7], k=2)
+    assert legacy_id in [file_id for file_id, _, _ in loaded.search(clustered[7], k=2)]
+    assert list((tmp_path / "ann").iterdir()) == [tmp_path / "ann" / "faces.npz"]
+
+
+@patch("app.services.ann_service.db")
+def test_search_drops_deleted_files(mock_db, index, clustered):
+    ann_service._index = index
+    mock_db.files.find.return_value = [{"_id": 6}]
+
+    with patch.object(ann_service.Config, "ANN_INDEX_PATH", "/nonexistent/faces.npz"):
+        results = ann_service.search(clustered[5], k=50)
+
+    assert [file_id for file_id, _, _ in results] == [6]
+    assert 5 not in index._slots
+
+
+@patch("app.services.ann_service.build_index")
+@patch("app.services.ann_service.index_service.search_event")
+def test_search_without_snapshot_scans_events_exactly(mock_search_event, mock_build):
+    mock_search_event.side_effect = lambda event_id, query, threshold, k: {"event1": [(1, 0.7)], "event2": [(2, 0.9), (3, 0.65)]}[event_id]
+
+    with patch.object(ann_service.Config, "ANN_INDEX_PATH", "/nonexistent/faces.npz"):
+        results = ann_service.search(np.ones(64), k=2, threshold=0.6, event_ids=["event1", "event2"])
+        assert ann_service.search(np.ones(64), k=2) == []
+
+    assert results == [(2, "event2", 0.9), (1, "event1", 0.7)]
+    mock_build.assert_not_called()
+    assert ann_service._index is None
+
+
+@patch("app.services.ann_service.catch_up")
+def test_every_lookup_catches_up(mock_catch_up, index):
+    ann_service._index = index
+
+    with patch.object(ann_service.Config, "ANN_INDEX_PATH", "/nonexistent/faces.npz"):
+        ann_service.get_index()
+        ann_service.get_index()
+
+    assert mock_catch_up.call_count == 2
+
+
+class FeedCollection:
+    """ann_feed stand-in: find({"_id": {"$gt": n}}).sort("_id", 1) over the inserted entries."""
+
+    def __init__(self):
+        self.entries = []
+
+    def insert(self, sequence, file_id, age_seconds=0):
+        created_at = datetime.utcnow() - timedelta(seconds=age_seconds)
+        self.entries.append({"_id": sequence, "file_id": file_id, "event_id": "event0", "created_at": created_at})
+
+    def find(self, query):
+        after = query["_id"]["$gt"]
+        cursor = MagicMock()
+        cursor.sort.return_value = sorted((e for e in self.entries if e["_id"] > after), key=lambda e: e["_id"])
+        return cursor
+
+
+@pytest.fixture
+def feed(clustered):
+    vectors = {file_id: clustered[file_id] for file_id in range(200)}
+    collection = FeedCollection()
+    with patch("app.services.ann_service.db") as mock_db, \
+            patch("app.services.ann_service.iter_file_vectors") as mock_vectors:
+        mock_db.ann_feed = collection
+        mock_vectors.side_effect = lambda query: [
+            (file_id, "event0", vectors[file_id]) for file_id in query["_id"]["$in"]
+        ]
+        yield collection
+
+
+def test_catch_up_waits_at_a_hole_for_a_commit_in_flight(feed, clustered):
+    index = ann_service.IVFIndex(ann_service.train_kmeans(clustered, 8), nprobe=8)
+    index.watermark = 4
+    # Sequence 5 was reserved first but its writer commits after 6 and 7
+    feed.insert(6, 106)
+    feed.insert(7, 107)
+
+    assert ann_service.catch_up(index) == 2
+    assert index.watermark == 4
+
+    feed.insert(5, 105)
+    assert ann_service.catch_up(index) == 3
+    assert index.watermark == 7
+    assert {105, 106, 107} <= set(index._slots)
+    assert ann_service.catch_up(index) == 0
+
+
+def test_catch_up_skips_a_hole_left_by_a_dead_writer(feed, clustered):
+    index = ann_service.IVFIndex(ann_service.train_kmeans(clustered, 8), nprobe=8)
+    index.watermark = 4
+    feed.insert(6, 106, age_seconds=ann_service.Config.ANN_FEED_GRACE_SECONDS + 5)
+
+    ann_service.catch_up(index)
+
+    assert index.watermark == 6
+    assert 106 in index._slots
+
+
+@patch("app.services.ann_service.get_allocator")
+@patch("app.services.ann_service.db")
+def test_add_file_records_every_published_file(mock_db, mock_get_allocator):
+    mock_get_allocator.return_value.reserve.return_value = range(9, 10)
+
+    # A deduplicated reference shares the original's embeddings but gets its own entry
+    ann_service.add_file("event1", 12, np.ones((1, 64)))
+    ann_service.add_file("event1", 13, [])
+
+    mock_get_allocator.return_value.reserve.assert_called_once_with(ann_service.FEED_COUNTER, 1)
+    entry = mock_db.ann_feed.insert_one.call_args.args[0]
+    assert (entry["_id"], entry["file_id"], entry["event_id"]) == (9, 12, "event1")
+
+
+@patch("app.services.search_service.ann_service.search")
+@patch("app.services.search_service.embedding_store.get_embedding")
+@patch("app.services.search_service.db")
+def test_search_across_attended_events(mock_db, mock_get_embedding, mock_search):
+    owner = ObjectId()
+    mock_db.faces.find_one.return_value = {"_id": 1, "owner_id": owner, "embeddings_id": "emb"}
+    mock_db.faces.distinct.return_value = ["event1", "event2"]
+    mock_get_embedding.return_value = np.ones((1, 512), dtype=np.float32)
+    mock_search.return_value = [(10, "event2", 0.9)]
+
+    result = search_service.search_files_across_events("1")
+
+    mock_db.faces.distinct.assert_called_once_with("event_id", {"owner_id": owner})
+    assert mock_search.call_args.args[4] == ["event1", "event2"]
+    assert result["matches"][0]["file_id"] == "10"
+    assert result["matches"][0]["event_id"] == "event2"
+
+
+@patch("app.services.search_service.db")
+def test_search_across_events_unknown_face(mock_db):
+    mock_db.faces.find_one.return_value = None
+
+    with pytest.raises(Exception) as exc:
+        search_service.search_files_across_events("1")
+
+    assert exc.value.status_code == 404
+
+
+@patch("app.services.search_service.get_face_embedding_by_id", return_value=None)
+@patch("app.services.search_service.db")
+def test_search_files_by_face_accepts_sequence_ids(mock_db, mock_get_embedding):
+    mock_db.faces.find_one.return_value = {"_id": 7, "event_id": "event1"}
+
+    assert search_service.search_files_by_face("7") == []
+
+    mock_db.faces.find_one.assert_called_once_with({"_id": 7})
@@ -0,0 +1,205 @@
+import time
+import threading
+import pytest
+import numpy as np
+from unittest.mock import patch
+
+from app.services import cache_service, vector_codec
+
+
+class FakeRedis:
+    """Just enough of the redis-py client for the cache, with real SET NX semantics."""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        with self.lock:
+            self.data[key] = str(int(self.data.get(key, 0)) + 1)
+            return int(self.data[key])
+
+    def hincrby(self, key, field, amount):
+        with self.lock:
+            fields = self.hashes.setdefault(key, {})
+            fields[field] = fields.get(field, 0) + amount
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+
+@pytest.fixture
+def fake_redis():
+    client = FakeRedis()
+    with patch.object(cache_service, "redis_client", client), \
+            patch.object(cache_service, "_unavailable_until", 0.0), \
+            patch.dict(cache_service._stats, {"hits": 0, "misses": 0, "waits": 0}):
+        yield client
+
+
+def test_event_generation_bump_changes_key(fake_redis):
+    assert cache_service.event_generation("e1") == 0
+    before = cache_service.match_cache_key("5", "e1", 0.6, cache_service.event_generation("e1"))
+
+    assert cache_service.bump_event_generation("e1") == 1
+    after = cache_service.match_cache_key("5", "e1", 0.6, cache_service.event_generation("e1"))
+
+    assert before != after
+
+
+def test_advance_generation_follows_only_our_own_bump():
+    class Holder:
+        generation = 3
+
+    holder = Holder()
+    cache_service.advance_generation(holder, 4)
+    assert holder.generation == 4
+
+    cache_service.advance_generation(holder, 6)
+    assert holder.generation is None
+
+    cache_service.advance_generation(holder, 7)
+    assert holder.generation is None
+
+
+def test_get_or_compute_caches_result(fake_redis):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [["1", 0.9]]
+
+    assert cache_service.get_or_compute_match_result("match:k", compute) == [["1", 0.9]]
+    assert cache_service.get_or_compute_match_result("match:k", compute) == [["1", 0.9]]
+
+    assert len(calls) == 1
+    stats = cache_service.get_match_cache_stats()
+    assert stats["process"]["hits"] == 1
+    assert stats["total"] == {"misses": 1, "hits": 1}
+    assert "lock:match:k" not in fake_redis.data
+
+
+def test_concurrent_identical_requests_compute_once(fake_redis):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return [["1", 0.9]]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache_service.get_or_compute_match_result("match:k", compute)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [[["1", 0.9]]] * 8
+
+
+def test_flight_lock_is_kept_until_the_last_waiter_leaves():
+    inside, release = threading.Event(), threading.Event()
+    entered = []
+
+    def holder():
+        with cache_service._flight_lock("match:k"):
+            inside.set()
+            release.wait(5)
+
+    def waiter():
+        with cache_service._flight_lock("match:k"):
+            entered.append(threading.get_ident())
+
+    first = threading.Thread(target=holder)
+    first.start()
+    assert inside.wait(5)
+    second = threading.Thread(target=waiter)
+    second.start()
+    time.sleep(0.05)
+    lock, callers = cache_service._flight_locks["match:k"]
+    assert callers == 2
+
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    # The waiter got the same lock the holder released, then the entry went away
+    assert entered and not lock.locked()
+    assert "match:k" not in cache_service._flight_locks
+
+
+def test_waits_for_result_computed_by_another_process(fake_redis):
+    fake_redis.set("lock:match:k", "other-process")
+
+    def other_process_finishes():
+        time.sleep(0.1)
+        fake_redis.setex("match:k", 300, '[["2", 0.8]]')
+        fake_redis.delete("lock:match:k")
+
+    threading.Thread(target=other_process_finishes).start()
+
+    result = cache_service.get_or_compute_match_result("match:k", lambda: pytest.fail("computed twice"))
+
+    assert result == [["2", 0.8]]
+    assert cache_service.get_match_cache_stats()["process"]["waits"] == 1
+
+
+def test_redis_errors_bypass_cache(fake_redis):
+    with patch.object(fake_redis, "get", side_effect=cache_service.redis.ConnectionError("down")):
+        assert cache_service.event_generation("e1") is None
+        assert cache_service.get_or_compute_match_result("match:k", lambda: [["1", 0.9]]) == [["1", 0.9]]
+
+
+@pytest.fixture
+def binary_client():
+    with patch.object(cache_service, "binary_client") as client, \
+            patch.object(cache_service, "_unavailable_until", 0.0):
+        yield client
+
+
+def test_cache_embeddings_uses_one_pipeline(binary_client):
+    vectors = np.random.rand(2, 512)
+
+    cache_service.cache_embeddings({"e1": vectors, "e2": vectors[:1]})
+
+    pipe = binary_client.pipeline.return_value
+    assert pipe.setex.call_count == 2
+    key, ttl, data = pipe.setex.call_args_list[0][0]
+    assert key == "embedding:e1"
+    assert np.allclose(vector_codec.decode(data), vectors)
+    pipe.execute.assert_called_once()
+
+
+def test_get_cached_embeddings_uses_one_mget(binary_client):
+    vectors = np.random.rand(2, 512).astype(np.float32)
+    binary_client.mget.return_value = [vector_codec.encode(vectors), None, b"garbage"]
+
+    found = cache_service.get_cached_embeddings(["e1", "e2", "e3"])
+
+    binary_client.mget.assert_called_once_with(["embedding:e1", "embedding:e2", "embedding:e3"])
+    assert list(found) == ["e1"]
+    assert np.array_equal(found["e1"], vectors)
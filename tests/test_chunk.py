@@ -0,0 +1,71 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+from app.services import chunk_service
+
+
+@pytest.fixture
+def chunks():
+    return [bytes([i]) * 100 for i in range(7)]
+
+
+@patch("app.services.chunk_service.db")
+def test_save_chunks_bulk_writes_by_byte_budget(mock_db, chunks):
+    chunk_ids = chunk_service.save_chunks(42, chunks, byte_budget=300)
+
+    batches = [call.args[0] for call in mock_db.chunks.insert_many.call_args_list]
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert all(call.kwargs["ordered"] for call in mock_db.chunks.insert_many.call_args_list)
+    docs = [doc for batch in batches for doc in batch]
+    assert [doc["chunk_index"] for doc in docs] == list(range(7))
+    assert all(doc["file_id"] == 42 for doc in docs)
+    assert [doc["_id"] for doc in docs] == chunk_ids
+    mock_db.chunks.insert_one.assert_not_called()
+
+
+@patch("app.services.chunk_service.db")
+def test_save_chunks_accepts_generator(mock_db, chunks):
+    chunk_ids = chunk_service.save_chunks(42, (c for c in chunks), byte_budget=10 ** 6)
+
+    assert len(chunk_ids) == 7
+    mock_db.chunks.insert_many.assert_called_once()
+
+
+@patch("app.services.chunk_service.db")
+def test_chunk_writer_raises_write_errors(mock_db, chunks):
+    mock_db.chunks.insert_many.side_effect = RuntimeError("write failed")
+    writer = chunk_service.ChunkWriter(42, byte_budget=10 ** 6)
+    writer.write(chunks[0])
+
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def stored_chunks(mock_db, chunks):
+    def find(query, projection=None):
+        start = query["chunk_index"]["$gte"]
+        cursor = MagicMock()
+        cursor.sort.return_value.batch_size.return_value = iter({"chunk_data": c} for c in chunks[start:])
+        return cursor
+    mock_db.chunks.find.side_effect = find
+
+
+@patch("app.services.chunk_service.db")
+def test_iter_byte_range_starts_at_containing_chunk(mock_db):
+    content = bytes(range(250))
+    chunks = chunk_service.chunk_image_bytes(content, 100)
+    stored_chunks(mock_db, chunks)
+
+    data = b"".join(chunk_service.iter_byte_range(1, 150, 219, 100))
+
+    assert data == content[150:220]
+    assert mock_db.chunks.find.call_args[0][0] == {"file_id": 1, "chunk_index": {"$gte": 1}}
+
+
+@patch("app.services.chunk_service.db")
+def test_iter_byte_range_whole_file(mock_db):
+    content = bytes(range(250))
+    stored_chunks(mock_db, chunk_service.chunk_image_bytes(content, 100))
+
+    assert b"".join(chunk_service.iter_byte_range(1, 0, 249, 100)) == content
+    assert chunk_service.chunked_file_size(1) == 250
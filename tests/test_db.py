@@ -0,0 +1,57 @@
+from unittest.mock import MagicMock
+from pymongo.errors import OperationFailure
+
+from app import db as db_module
+
+
+def fake_database(stats_by_collection: dict, collections: list):
+    database = MagicMock()
+    handles = {}
+
+    def collection(name):
+        if name not in handles:
+            handles[name] = MagicMock()
+            handles[name].aggregate.return_value = stats_by_collection.get(name, [])
+        return handles[name]
+
+    database.__getitem__.side_effect = collection
+    database.list_collection_names.return_value = collections
+    return database, handles
+
+
+def test_ensure_indexes_creates_every_declared_index():
+    database, handles = fake_database({}, [])
+
+    report = db_module.ensure_indexes(database)
+
+    assert len(report["ensured"]) == len(db_module.INDEXES)
+    assert report["failed"] == []
+    handles["users"].create_index.assert_called_once_with([("email", 1)], name="email", unique=True)
+    assert handles["chunks"].create_index.call_args.args[0] == [("file_id", 1), ("chunk_index", 1)]
+
+
+def test_ensure_indexes_skips_indexes_that_fail():
+    database, handles = fake_database({}, [])
+    database["users"].create_index.side_effect = OperationFailure("E11000 duplicate key")
+
+    report = db_module.ensure_indexes(database)
+
+    assert report["failed"] == ["users.email"]
+    assert "user_auth.user_id" in report["ensured"]
+
+
+def test_index_report_lists_missing_undeclared_and_unused():
+    stats = {
+        "users": [
+            {"name": "_id_", "accesses": {"ops": 10}},
+            {"name": "email", "accesses": {"ops": 0}},
+            {"name": "legacy_name", "accesses": {"ops": 3}},
+        ]
+    }
+    database, _ = fake_database(stats, ["users", "devices"])
+
+    report = db_module.index_report(database)
+
+    assert report["users"] == {"missing": [], "undeclared": ["legacy_name"], "unused": ["email"]}
+    assert report["user_auth"]["missing"] == ["user_id"]
+    assert report["devices"] == {"missing": [], "undeclared": [], "unused": []}
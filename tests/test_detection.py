@@ -0,0 +1,43 @@
+import numpy as np
+from PIL import Image
+from unittest.mock import patch
+
+from app.services import embedding_service
+
+
+def test_proxy_caps_the_longest_side():
+    image = Image.new("RGB", (6000, 4000))
+
+    proxy, scale = embedding_service.detection_proxy(image, max_side=1500)
+
+    assert proxy.size == (1500, 1000)
+    assert scale == 0.25
+
+
+def test_no_proxy_for_small_images_or_when_disabled():
+    image = Image.new("RGB", (800, 600))
+
+    assert embedding_service.detection_proxy(image, max_side=1500) == (image, 1.0)
+    assert embedding_service.detection_proxy(Image.new("RGB", (6000, 4000)), max_side=0)[1] == 1.0
+
+
+@patch("app.services.embedding_service.model_registry.get_detector")
+def test_boxes_are_mapped_back_and_cropped_from_the_original(mock_get_detector):
+    image = Image.new("RGB", (4000, 2000))
+    mock_get_detector.return_value.detect.return_value = (np.array([[100, 50, 150, 110]], dtype=object), [0.99])
+
+    with patch.object(embedding_service.Config, "DETECTION_MAX_SIDE", 1000):
+        crops, boxes = embedding_service.detect_faces_with_boxes(image)
+
+    assert mock_get_detector.return_value.detect.call_args[0][0].size == (1000, 500)
+    assert np.allclose(boxes, [[400, 200, 600, 440]])
+    assert crops[0].size == (200, 240)
+
+
+@patch("app.services.embedding_service.model_registry.get_detector")
+def test_no_faces(mock_get_detector):
+    mock_get_detector.return_value.detect.return_value = (None, None)
+
+    crops, boxes = embedding_service.detect_faces_with_boxes(Image.new("RGB", (64, 64)))
+
+    assert crops == [] and boxes.shape == (0, 4)
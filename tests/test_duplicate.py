@@ -3,7 +3,7 @@ import numpy as np
 from unittest.mock import patch, MagicMock
 from bson import ObjectId
 
-from app.services import duplicate
+from app.services import duplicate_service as duplicate, embedding_store
 
 
 def mock_file_doc(_id, embeddings_id, path="/mock/path/file.jpg", owner_id=None, event_id=None):
@@ -17,55 +17,102 @@ def mock_file_doc(_id, embeddings_id, path="/mock/path/file.jpg", owner_id=None,
 
 
 def mock_embedding_doc(_id, vector):
-    return {
-        "_id": _id,
-        "embeddings_vector": vector.tolist()
-    }
+    return {"_id": _id, **embedding_store.pack(vector)}
 
 
-@patch("app.services.duplicate.db")
-@patch("app.services.duplicate.np")
-def test_get_all_file_embeddings(mock_np, mock_db):
+@patch("app.services.embedding_store.db")
+@patch("app.services.duplicate_service.db")
+def test_get_all_file_embeddings(mock_db, mock_store_db):
     fake_embedding = np.ones(512)
-    mock_np.array.return_value = fake_embedding
+    embeddings_id = ObjectId("507f1f77bcf86cd799439012")
 
-    mock_db["file"].find.return_value = [
-        mock_file_doc(ObjectId("507f1f77bcf86cd799439011"), ObjectId("507f1f77bcf86cd799439012"))
+    mock_db.files.find.return_value = [
+        mock_file_doc(ObjectId("507f1f77bcf86cd799439011"), embeddings_id)
     ]
-    mock_db["embeddings"].find_one.return_value = mock_embedding_doc(ObjectId("507f1f77bcf86cd799439012"), fake_embedding)
+    mock_store_db.embeddings.find.return_value = [mock_embedding_doc(embeddings_id, np.array([fake_embedding]))]
 
     results = duplicate.get_all_file_embeddings("507f1f77bcf86cd799439010", "event123")
     assert len(results) == 1
     assert "file_id" in results[0]
     assert "vector" in results[0]
     assert isinstance(results[0]["vector"], np.ndarray)
-
-
-@patch("app.services.duplicate.cosine_similarity")
-@patch("app.services.duplicate.get_all_file_embeddings")
-def test_find_duplicate_files(mock_get_embeddings, mock_cosine_sim):
-    emb1 = {"file_id": "1", "vector": np.ones(512), "path": "path1"}
-    emb2 = {"file_id": "2", "vector": np.ones(512), "path": "path2"}
-    mock_get_embeddings.return_value = [emb1, emb2]
-    mock_cosine_sim.return_value = 0.97  # Above threshold
+    assert np.isclose(np.linalg.norm(results[0]["vector"]), 1.0)
+
+
+@patch("app.services.duplicate_service.get_all_file_hashes", return_value=[])
+@patch("app.services.duplicate_service.get_all_file_embeddings")
+def test_find_duplicate_files(mock_get_embeddings, mock_get_hashes):
+    rng = np.random.default_rng(0)
+    base, other = rng.normal(size=(2, 512))
+    mock_get_embeddings.return_value = [
+        {"file_id": "1", "vector": base, "path": "path1"},
+        {"file_id": "2", "vector": base + rng.normal(scale=0.01, size=512), "path": "path2"},
+        {"file_id": "3", "vector": other, "path": "path3"},
+        {"file_id": "4", "vector": base + rng.normal(scale=0.01, size=512), "path": "path4"},
+    ]
 
     duplicates = duplicate.find_duplicate_files("user123", "event123")
     assert len(duplicates) == 1
-    assert "file_ids" in duplicates[0]
-    assert "similarity" in duplicates[0]
-    assert duplicates[0]["similarity"] == 0.97
+    assert duplicates[0]["file_ids"] == ["1", "2", "4"]
+    assert duplicates[0]["paths"] == ["path1", "path2", "path4"]
+    assert duplicates[0]["similarity"] > 0.95
+
+
+@patch("app.services.duplicate_service.get_all_file_hashes")
+@patch("app.services.duplicate_service.get_all_file_embeddings")
+def test_find_duplicate_files_merges_perceptual_hashes(mock_get_embeddings, mock_get_hashes):
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=512)
+    mock_get_embeddings.return_value = [
+        {"file_id": "1", "vector": base, "path": "path1"},
+        {"file_id": "2", "vector": base, "path": "path2"},
+    ]
+    mock_get_hashes.return_value = [
+        {"file_id": "2", "phash": "ff00ff00ff00ff00", "path": "path2"},
+        {"file_id": "5", "phash": "ff00ff00ff00ff01", "path": "path5"},  # no faces, 1 bit away
+        {"file_id": "6", "phash": "00ff00ff00ff00ff", "path": "path6"},
+    ]
 
+    duplicates = duplicate.find_duplicate_files(event_id="event123")
+    assert len(duplicates) == 1
+    assert sorted(duplicates[0]["file_ids"]) == ["1", "2", "5"]
+
+
+def test_group_duplicates_matches_across_blocks():
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(10, 64)).astype(np.float32)
+    matrix[7] = matrix[1]
+    matrix[9] = matrix[7]
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    groups = duplicate.group_duplicates(matrix, threshold=0.95, block_size=3)
+    assert [indices for indices, _ in groups] == [[1, 7, 9]]
+    assert groups[0][1] == pytest.approx(1.0, abs=1e-5)
 
-@patch("app.services.duplicate.db")
-def test_delete_files(mock_db):
+
+@patch("app.services.duplicate_service.file_service")
+@patch("app.services.duplicate_service.db")
+def test_delete_files(mock_db, mock_file_service):
     fid = ObjectId("507f1f77bcf86cd799439011")
     embeddings_id = ObjectId("507f1f77bcf86cd799439012")
+    storage = {"file_id": fid, "path": "/mock/path/file.jpg"}
 
-    mock_db["file"].find_one.return_value = mock_file_doc(fid, embeddings_id)
+    mock_db.files.find_one.return_value = mock_file_doc(fid, embeddings_id)
+    mock_file_service.release_file_storage.return_value = storage
     deleted = duplicate.delete_files([str(fid)])
 
-    mock_db["file"].delete_one.assert_called_with({"_id": fid})
-    mock_db["embeddings"].delete_one.assert_called_with({"_id": embeddings_id})
-    mock_db["chunk"].delete_many.assert_called_with({"file_id": fid})
-    mock_db["file_metadata"].delete_one.assert_called_with({"file_id": fid})
+    mock_db.files.delete_one.assert_called_with({"_id": fid})
+    mock_file_service.purge_file_storage.assert_called_once_with(storage)
+    mock_db.file_metadata.delete_one.assert_called_with({"file_id": fid})
     assert deleted == [str(fid)]
+
+
+@patch("app.services.duplicate_service.file_service")
+@patch("app.services.duplicate_service.db")
+def test_delete_files_keeps_shared_storage(mock_db, mock_file_service):
+    mock_db.files.find_one.return_value = mock_file_doc(7, ObjectId())
+    mock_file_service.release_file_storage.return_value = None
+
+    assert duplicate.delete_files(["7"]) == ["7"]
+    mock_db.files.delete_one.assert_called_with({"_id": 7})
+    mock_file_service.purge_file_storage.assert_not_called()
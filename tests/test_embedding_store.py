@@ -0,0 +1,99 @@
+import pytest
+import numpy as np
+from bson import Binary
+from unittest.mock import patch
+
+from app.services import embedding_store
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(3, 512)).astype(np.float32)
+
+
+def test_float32_packs_to_binary_and_decodes_without_copy(vectors):
+    doc = embedding_store.pack(vectors, "float32")
+
+    assert isinstance(doc["embeddings_vector"], Binary)
+    assert len(doc["embeddings_vector"]) == 3 * 512 * 4
+    assert (doc["dim"], doc["count"], doc["dtype"]) == (512, 3, "float32")
+    matrix = embedding_store.unpack(doc)
+    assert np.array_equal(matrix, vectors)
+    assert not matrix.flags.owndata
+
+
+@pytest.mark.parametrize("dtype, itemsize, tolerance", [("float16", 2, 1e-2), ("int8", 1, 3e-2)])
+def test_compact_dtypes_round_trip(vectors, dtype, itemsize, tolerance):
+    doc = embedding_store.pack(vectors, dtype)
+
+    assert len(doc["embeddings_vector"]) == 3 * 512 * itemsize
+    matrix = embedding_store.unpack(doc)
+    assert matrix.dtype == np.float32
+    assert np.abs(matrix - vectors).max() < tolerance * np.abs(vectors).max()
+
+
+def test_unpack_legacy_arrays(vectors):
+    assert np.allclose(embedding_store.unpack({"embeddings_vector": vectors.tolist()}), vectors)
+    assert embedding_store.unpack({"embeddings_vector": vectors[0].tolist()}).shape == (1, 512)
+    assert embedding_store.unpack({"embeddings_vector": []}).shape == (0, 0)
+
+
+@patch("app.services.embedding_store.db")
+def test_load_embeddings_skips_empty(mock_db, vectors):
+    mock_db.embeddings.find.return_value = [
+        {"_id": "e1", **embedding_store.pack(vectors)},
+        {"_id": "e2", **embedding_store.pack([])},
+    ]
+
+    found = embedding_store.load_embeddings(["e1", "e2"])
+
+    assert list(found) == ["e1"]
+    assert mock_db.embeddings.find.call_args[0][1] == embedding_store.PROJECTION
+
+
+@patch("app.commands.migrate_embeddings.db")
+def test_migration_packs_array_documents(mock_db, vectors):
+    from app.commands import migrate_embeddings
+    mock_db.embeddings.find.return_value.batch_size.return_value = [
+        {"_id": "e1", "embeddings_vector": vectors.tolist()}
+    ]
+    mock_db.embeddings.bulk_write.return_value.modified_count = 1
+
+    stats = migrate_embeddings.migrate("float32")
+
+    assert stats["migrated"] == 1
+    update = mock_db.embeddings.bulk_write.call_args[0][0][0]._doc["$set"]
+    assert np.array_equal(embedding_store.unpack(update), vectors)
+
+
+@patch("app.services.embedding_store.db")
+def test_load_document_vectors_mixes_inline_and_linked(mock_db, vectors):
+    mock_db.embeddings.find.return_value = [{"_id": "e1", **embedding_store.pack(vectors[:1])}]
+    docs = [
+        {"_id": 1, "embeddings_id": None, "face_vectors": embedding_store.pack_inline(vectors[1:])},
+        {"_id": 2, "embeddings_id": "e1"},
+        {"_id": 3, "embeddings_id": "e1"},
+        {"_id": 4, "embeddings_id": None},
+    ]
+
+    found = embedding_store.load_document_vectors(docs)
+
+    assert sorted(found) == [1, 2, 3]
+    assert np.array_equal(found[1], vectors[1:])
+    assert mock_db.embeddings.find.call_args[0][0] == {"_id": {"$in": ["e1"]}}
+
+
+@patch("app.commands.inline_embeddings.db")
+def test_inline_backfill_copies_packed_documents(mock_db, vectors):
+    from app.commands import inline_embeddings
+    mock_db["files"].find.return_value.batch_size.return_value = [{"_id": 7, "embeddings_id": "e1"}]
+    mock_db.embeddings.find.return_value = [{"_id": "e1", **embedding_store.pack(vectors, "float16")}]
+    mock_db["files"].bulk_write.return_value.modified_count = 1
+
+    stats = inline_embeddings.backfill("files")
+
+    assert stats == {"scanned": 1, "inlined": 1, "missing": 0}
+    operation = mock_db["files"].bulk_write.call_args[0][0][0]
+    inline = operation._doc["$set"]["face_vectors"]
+    assert inline["_id"] == "e1" and inline["dtype"] == "float16"
+    assert operation._filter == {"_id": 7, "face_vectors": {"$exists": False}}
@@ -1,5 +1,6 @@
 # test_face_service.py
 
+import base64
 import pytest
 from unittest.mock import patch, MagicMock, mock_open
 import numpy as np
@@ -84,3 +85,73 @@ def test_store_file_embedding(mock_db, mock_extract, dummy_embedding):
     face_service.store_file_embedding("/path/to/image.jpg", file_id)
 
     mock_db.embeddings.insert_one.assert_called_once()
+
+
+@patch("app.services.face_service.cache_service.event_generation", return_value=None)
+@patch("app.services.face_service.index_service.search_event")
+@patch("app.services.face_service.get_face_embedding_by_id")
+def test_match_face_with_files_pages_by_reference(mock_get_embed, mock_search, mock_generation, dummy_embedding):
+    mock_get_embed.return_value = dummy_embedding
+    mock_search.return_value = [(1, 0.9), (2, 0.8), (3, 0.8), (4, 0.7)]
+
+    first = face_service.match_face_with_files("5", "event123", limit=2)
+    second = face_service.match_face_with_files("5", "event123", limit=2, cursor=first["next_cursor"])
+
+    assert [m["file_id"] for m in first["matches"]] == ["1", "2"]
+    assert first["matches"][0]["thumb_url"] == "/api/files/1/renditions/thumb"
+    assert first["matches"][0]["download_url"] == "/api/reconstruct-file/1"
+    assert "image_base64" not in first["matches"][0]
+    assert [m["file_id"] for m in second["matches"]] == ["3", "4"]
+    assert second["next_cursor"] is None
+
+
+@patch("app.services.face_service.Config.MATCH_CACHE_ENABLED", False)
+@patch("app.services.face_service.Config.MATCH_INLINE_MAX_RESULTS", 1)
+@patch("app.services.face_service.rendition_service.get_rendition", return_value=None)
+@patch("app.services.face_service.index_service.search_event")
+@patch("app.services.face_service.get_face_embedding_by_id")
+@patch("app.services.face_service.db")
+def test_match_face_with_files_inline_is_bounded(mock_db, mock_get_embed, mock_search, mock_rendition, dummy_embedding, tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"image content")
+    mock_get_embed.return_value = dummy_embedding
+    mock_search.return_value = [(1, 0.9), (2, 0.8)]
+    mock_db.files.find.return_value = [{"_id": 1, "path": str(path)}]
+
+    response = face_service.match_face_with_files("5", "event123", inline=True)
+
+    assert len(response["matches"]) == 1
+    assert base64.b64decode(response["matches"][0]["image_base64"]) == b"image content"
+    assert response["next_cursor"] is not None
+
+
+@patch("app.services.face_service.cache_service.get_or_compute_match_result")
+@patch("app.services.face_service.cache_service.event_generation", return_value=4)
+@patch("app.services.face_service.index_service.search_event")
+def test_ranked_matches_uses_generation_keyed_cache(mock_search, mock_generation, mock_cached, dummy_embedding):
+    mock_cached.return_value = [["12", 0.9], ["5f43a2b4e1d3e3a1a8a8a8a8", 0.7]]
+
+    matches = face_service.ranked_matches("5", "event123", np.array(dummy_embedding), 0.6)
+
+    assert matches == [(12, 0.9), (ObjectId("5f43a2b4e1d3e3a1a8a8a8a8"), 0.7)]
+    key = mock_cached.call_args[0][0]
+    assert key == "match:event123:4:5:0.6:all"
+    mock_search.assert_not_called()
+
+
+@patch("app.services.face_service.inference_service.is_running", return_value=False)
+@patch("app.services.face_service.embedding_service.embed_faces")
+@patch("app.services.face_service.embedding_service.detect_faces_with_boxes")
+def test_extract_face_embeddings_in_process_uses_the_shared_pipeline(mock_detect, mock_embed, mock_running):
+    from PIL import Image
+    from app.services.image_service import DecodedImage
+    image = DecodedImage.__new__(DecodedImage)
+    crops = [Image.new("RGB", (40, 40)), Image.new("RGB", (50, 50))]
+    mock_detect.return_value = (crops, np.zeros((2, 4)))
+    mock_embed.return_value = np.ones((2, 512), dtype=np.float32)
+
+    vectors = face_service.extract_face_embeddings(image, return_all=True)
+
+    mock_detect.assert_called_once_with(image)
+    mock_embed.assert_called_once_with(crops)
+    assert len(vectors) == 2 and vectors[0].shape == (512,)
@@ -3,9 +3,10 @@
 import pytest
 from unittest.mock import patch, MagicMock, mock_open
 from bson import ObjectId
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException
 from io import BytesIO
-import numpy as np
+import hashlib
+import threading
 
 from app.services import file_service
 
@@ -14,9 +15,13 @@ class DummyUploadFile:
     def __init__(self, filename, content):
         self.filename = filename
         self._content = content
+        self._offset = 0
 
-    async def read(self):
-        return self._content
+    async def read(self, size=-1):
+        end = len(self._content) if size < 0 else self._offset + size
+        data = self._content[self._offset:end]
+        self._offset += len(data)
+        return data
 
 
 @pytest.fixture
@@ -24,72 +29,363 @@ def dummy_file():
     return DummyUploadFile("D:/photobooth/app/storage/faces/1.jpg", b"fake-image-bytes")
 
 
-@pytest.fixture
-def dummy_chunks():
-    return [b"chunk1", b"chunk2", b"chunk3"]
+@patch("app.services.file_service.rendition_service")
+@patch("app.services.file_service.store_chunks")
+@patch("app.services.file_service.spool_upload", return_value=("abc", 16))
+@patch("app.services.file_service.get_next_sequence", return_value=11)
+@patch("app.services.file_service.db")
+@pytest.mark.asyncio
+async def test_handle_file_upload_success(mock_db, mock_next_sequence, mock_spool, mock_store, mock_renditions, dummy_file):
+    mock_db.files.find_one.return_value = None
 
+    with patch.object(file_service.Config, "EMBEDDING_WORKERS", 2), \
+            patch("app.services.file_service.os.makedirs"), \
+            patch("app.services.file_service.os.replace") as mock_replace, \
+            patch("app.services.file_service.pipeline_service.has_capacity", return_value=True), \
+            patch("app.services.file_service.pipeline_service.enqueue_file", return_value=True) as mock_enqueue:
+        result = await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
+
+    part_path = mock_spool.call_args.args[1]
+    mock_store.assert_called_once_with(11, part_path)
+    mock_replace.assert_called_once_with(part_path, result["path"])
+    inserted = mock_db.files.insert_one.call_args[0][0]
+    assert inserted["_id"] == 11
+    assert inserted["content_hash"] == "abc" and inserted["size"] == 16
+    assert inserted["embedding_status"] == "pending"
+    mock_enqueue.assert_called_once_with(11, result["path"], "event123")
+    assert result["file_id"] == "11"
+    assert result["path"].endswith(dummy_file.filename)
+    assert result["is_duplicate"] is False
+
+
+@patch("app.services.file_service.rendition_service")
+@patch("app.services.file_service.store_chunks")
+@patch("app.services.file_service.spool_upload", return_value=("abc", 16))
+@patch("app.services.file_service.get_next_sequence", return_value=11)
+@patch("app.services.file_service.db")
+@pytest.mark.asyncio
+async def test_handle_file_upload_non_image(mock_db, mock_next_sequence, mock_spool, mock_store, mock_renditions, dummy_file):
+    mock_db.files.find_one.return_value = None
+
+    # Embedded inline: the stored bytes don't decode, so there are no faces and no hash
+    with patch.object(file_service.Config, "EMBEDDING_WORKERS", 0), \
+            patch.object(file_service.Config, "EMBEDDING_STORAGE_MODE", "collection"), \
+            patch("app.services.file_service.os.makedirs"), \
+            patch("app.services.file_service.os.replace"), \
+            patch("app.services.file_service.inference_service.is_running", return_value=False), \
+            patch("app.services.pipeline_service.open_image", return_value=None), \
+            patch("app.services.pipeline_service.embedding_store.insert_embedding", return_value=None), \
+            patch("app.services.file_service.pipeline_service.publish_file") as mock_publish:
+        result = await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
+
+    inserted = mock_db.files.insert_one.call_args[0][0]
+    assert inserted["embedding_status"] == "not created"
+    assert inserted["phash"] is None
+    mock_publish.assert_called_once_with("event123", 11, [], None)
+    assert result["file_id"] == "11"
+    assert result["embedding_status"] == "not created"
 
-@pytest.fixture
-def dummy_embeddings():
-    return np.random.rand(512)
+
+@patch("app.services.file_service.get_next_sequence", return_value=11)
+@patch("app.services.file_service.db")
+@pytest.mark.asyncio
+async def test_handle_file_upload_exact_duplicate_is_referenced(mock_db, mock_next_sequence, dummy_file):
+    original = {
+        "_id": 3,
+        "path": "/storage/event_event123/original.jpg",
+        "content_hash": "abc",
+        "embeddings_id": None,
+        "embedding_status": "pending",
+    }
+    mock_db.files.find_one.return_value = original
+
+    with patch("app.services.file_service.open", new_callable=mock_open), \
+            patch("app.services.chunk_service.db") as mock_chunk_db:
+        result = await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
+
+    # The duplicate is caught before anything is stored: no chunks and no new file id
+    mock_chunk_db.chunks.insert_many.assert_not_called()
+    mock_db.chunks.delete_many.assert_not_called()
+    inserted = mock_db.files.insert_one.call_args[0][0]
+    assert inserted["storage_ref"] == 3
+    assert inserted["path"] == original["path"]
+    assert mock_next_sequence.call_count == 1  # the reference's own id only
+    mock_db.file_refs.update_one.assert_called_once_with({"_id": 3}, {"$inc": {"count": 1}}, upsert=True)
+    assert result["dedup"] == "reference"
+    assert result["original_file_id"] == "3"
+
+
+@patch("app.services.file_service.spool_upload")
+@patch("app.services.file_service.pipeline_service.has_capacity", return_value=False)
+@pytest.mark.asyncio
+async def test_handle_file_upload_refuses_before_reading_when_queue_is_full(mock_capacity, mock_spool, dummy_file):
+    with patch.object(file_service.Config, "EMBEDDING_WORKERS", 2), \
+            patch("app.services.file_service.os.makedirs"):
+        with pytest.raises(HTTPException) as exc:
+            await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
+
+    assert exc.value.status_code == 503
+    mock_spool.assert_not_called()
 
 
-@patch("app.services.file_service.extract_embeddings")
-@patch("app.services.file_service.chunk_image")
+@patch("app.services.file_service.rendition_service")
+@patch("app.services.file_service.store_chunks")
+@patch("app.services.file_service.spool_upload", return_value=("abc", 16))
+@patch("app.services.file_service.get_next_sequence", return_value=11)
 @patch("app.services.file_service.db")
-@patch("app.services.file_service.open", new_callable=mock_open)
-@patch("app.services.file_service.Image.open")
 @pytest.mark.asyncio
-async def test_handle_file_upload_success(
-    mock_image_open,
-    mock_open_file,
-    mock_db,
-    mock_chunk_image,
-    mock_extract_embeddings,
-    dummy_file,
-    dummy_chunks,
-    dummy_embeddings
+async def test_handle_file_upload_inline_inference_busy_marks_failed(
+    mock_db, mock_next_sequence, mock_spool, mock_store, mock_renditions, dummy_file
 ):
-    # Mocks
-    mock_chunk_image.return_value = dummy_chunks
-    mock_extract_embeddings.return_value = dummy_embeddings
-    mock_image_open.return_value = MagicMock()
+    mock_db.files.find_one.return_value = None
+    busy = file_service.inference_service.InferenceBusy("Inference queue is full")
 
-    mock_db.files.insert_one.return_value.inserted_id = ObjectId()
-    mock_db.embeddings.insert_one.return_value.inserted_id = ObjectId()
+    with patch.object(file_service.Config, "EMBEDDING_WORKERS", 0), \
+            patch("app.services.file_service.os.makedirs"), \
+            patch("app.services.file_service.os.replace"), \
+            patch("app.services.file_service.inference_service.is_running", return_value=True), \
+            patch("app.services.file_service.inference_service.embed_async", side_effect=busy), \
+            patch("app.services.file_service.pipeline_service.publish_file") as mock_publish:
+        result = await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
 
-    mock_db.chunks.insert_one.side_effect = lambda doc: doc["_id"]
+    inserted = mock_db.files.insert_one.call_args[0][0]
+    assert inserted["embedding_status"] == "failed"
+    assert inserted["embedding_error"] == "Inference queue is full"
+    assert result["embedding_status"] == "failed"
+    mock_publish.assert_not_called()
 
-    result = await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
 
-    assert "file_id" in result
-    assert "path" in result
-    assert isinstance(result["file_id"], str)
-    assert result["path"].endswith(dummy_file.filename)
+@patch("app.services.file_service.discard_upload")
+@patch("app.services.file_service.store_chunks")
+@patch("app.services.file_service.spool_upload", return_value=("abc", 16))
+@patch("app.services.file_service.get_next_sequence", return_value=11)
+@patch("app.services.file_service.db")
+@pytest.mark.asyncio
+async def test_handle_file_upload_rolls_back_when_chunking_fails(mock_db, mock_next_sequence, mock_spool, mock_store, mock_discard, dummy_file):
+    mock_db.files.find_one.return_value = None
+    mock_store.side_effect = OSError("disk full")
 
+    with patch.object(file_service.Config, "EMBEDDING_WORKERS", 0), \
+            patch("app.services.file_service.os.makedirs"):
+        with pytest.raises(HTTPException) as exc:
+            await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
 
-@patch("app.services.file_service.extract_embeddings")
-@patch("app.services.file_service.chunk_image")
+    assert exc.value.status_code == 500
+    mock_discard.assert_called_once_with(11, mock_spool.call_args.args[1])
+    mock_db.files.insert_one.assert_not_called()
+
+
+@patch("app.services.file_service.rendition_service")
+@patch("app.services.file_service.discard_upload")
+@patch("app.services.file_service.store_chunks")
+@patch("app.services.file_service.spool_upload", return_value=("abc", 16))
+@patch("app.services.file_service.get_next_sequence", return_value=11)
 @patch("app.services.file_service.db")
-@patch("app.services.file_service.open", new_callable=mock_open)
-@patch("app.services.file_service.Image.open", side_effect=Exception("Not an image"))
 @pytest.mark.asyncio
-async def test_handle_file_upload_non_image(
-    mock_image_open,
-    mock_open_file,
-    mock_db,
-    mock_chunk_image,
-    mock_extract_embeddings,
-    dummy_file,
-    dummy_chunks
+async def test_handle_file_upload_rolls_back_when_the_insert_fails(
+    mock_db, mock_next_sequence, mock_spool, mock_store, mock_discard, mock_renditions, dummy_file
 ):
-    mock_chunk_image.return_value = dummy_chunks
-    mock_extract_embeddings.return_value = []
+    mock_db.files.find_one.return_value = None
+    mock_db.files.insert_one.side_effect = RuntimeError("not primary")
+
+    with patch.object(file_service.Config, "EMBEDDING_WORKERS", 2), \
+            patch("app.services.file_service.os.makedirs"), \
+            patch("app.services.file_service.os.replace") as mock_replace, \
+            patch("app.services.file_service.pipeline_service.has_capacity", return_value=True), \
+            patch("app.services.file_service.pipeline_service.enqueue_file") as mock_enqueue:
+        with pytest.raises(HTTPException):
+            await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
+
+    # The spooled file was already renamed into place, so that is what goes
+    mock_discard.assert_called_once_with(11, mock_replace.call_args.args[1])
+    mock_enqueue.assert_not_called()
+    mock_renditions.schedule_renditions.assert_not_called()
+
+
+@patch("app.services.file_service.db")
+def test_discard_upload_removes_file_chunks_and_embeddings(mock_db, tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"x")
+
+    file_service.discard_upload(11, str(path))
+
+    assert not path.exists()
+    mock_db.chunks.delete_many.assert_called_once_with({"file_id": 11})
+    mock_db.embeddings.delete_many.assert_called_once_with({"file_id": 11})
+
+
+@pytest.mark.asyncio
+async def test_spool_upload_hashes_and_writes_in_one_pass(tmp_path):
+    content = bytes(range(256)) * 40
+    upload = DummyUploadFile("big.jpg", content)
+    path = tmp_path / "big.jpg.part"
+
+    file_hash, size = await file_service.spool_upload(upload, str(path), block_size=1000)
+
+    assert file_hash == hashlib.sha256(content).hexdigest()
+    assert size == len(content)
+    assert path.read_bytes() == content
+
+
+@pytest.mark.asyncio
+async def test_spool_upload_writes_off_the_event_loop(tmp_path):
+    loop_thread = threading.get_ident()
+    threads = []
+
+    with patch.object(file_service, "spool_block", side_effect=lambda *args: threads.append(threading.get_ident())):
+        await file_service.spool_upload(DummyUploadFile("big.jpg", b"x" * 3000), str(tmp_path / "a.part"), block_size=1000)
+
+    assert len(threads) == 3
+    assert loop_thread not in threads
+
+
+@patch("app.services.file_service.db")
+@pytest.mark.asyncio
+async def test_spool_upload_failure_removes_partial_output(mock_db, tmp_path):
+    upload = DummyUploadFile("big.jpg", b"x" * 10)
+    upload.read = MagicMock(side_effect=OSError("client went away"))
+    path = tmp_path / "big.jpg.part"
+
+    with pytest.raises(OSError):
+        await file_service.spool_upload(upload, str(path))
+
+    assert not path.exists()
+    mock_db.chunks.delete_many.assert_not_called()
+
+
+@patch("app.services.chunk_service.db")
+def test_store_chunks_writes_the_spooled_file_in_order(mock_chunk_db, tmp_path):
+    content = bytes(range(256)) * 40
+    path = tmp_path / "big.jpg.part"
+    path.write_bytes(content)
+
+    file_service.store_chunks(5, str(path), chunk_size=1000)
+
+    docs = [doc for call in mock_chunk_db.chunks.insert_many.call_args_list for doc in call.args[0]]
+    assert [doc["chunk_index"] for doc in docs] == list(range(11))
+    assert all(doc["file_id"] == 5 for doc in docs)
+    assert b"".join(doc["chunk_data"] for doc in docs) == content
+
+
+@patch("app.services.file_service.db")
+def test_release_file_storage_reference_keeps_bytes(mock_db):
+    mock_db.file_refs.find_one_and_update.return_value = {"_id": 3, "count": 1}
+
+    assert file_service.release_file_storage({"_id": 11, "storage_ref": 3, "path": "/p.jpg"}) is None
+
+
+@patch("app.services.file_service.db")
+def test_release_file_storage_last_reference_after_original_deleted(mock_db):
+    mock_db.file_refs.find_one_and_update.return_value = {"_id": 3, "count": 0, "root_deleted": True, "path": "/p.jpg"}
+
+    storage = file_service.release_file_storage({"_id": 11, "storage_ref": 3, "path": "/p.jpg"})
+    assert storage == {"file_id": 3, "path": "/p.jpg"}
+
+
+@patch("app.services.file_service.db")
+def test_release_file_storage_original_with_references(mock_db):
+    mock_db.file_refs.find_one_and_update.return_value = {"_id": 3, "count": 2}
+
+    assert file_service.release_file_storage({"_id": 3, "path": "/p.jpg"}) is None
+    mock_db.file_refs.delete_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("app.services.file_service.phash_service.add_file")
+@patch("app.services.file_service.get_next_sequence", return_value=11)
+@patch("app.services.file_service.chunk_service.db")
+@patch("app.services.file_service.db")
+async def test_range_on_a_reference_uses_the_original_chunking(mock_db, mock_chunk_db, mock_next_sequence, mock_phash_add):
+    content = bytes(range(256)) * 40
+    chunk_size = 1000  # not chunk_service.CHUNK_SIZE, as with Config.CHUNK_SIZE uploads
+    chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+    original = {"_id": 3, "path": "/storage/a.jpg", "content_hash": "h", "embedding_status": "created",
+                "size": len(content), "chunk_size": chunk_size}
+
+    def find_chunks(query, projection):
+        cursor = MagicMock()
+        cursor.sort.return_value.batch_size.return_value = [
+            {"chunk_data": data} for index, data in enumerate(chunks)
+            if query["file_id"] == 3 and index >= query["chunk_index"]["$gte"]
+        ]
+        return cursor
+    mock_chunk_db.chunks.find.side_effect = find_chunks
+
+    file_service.create_file_reference(original, "b.jpg", str(ObjectId()), "e1")
+    mock_db.files.find_one.return_value = mock_db.files.insert_one.call_args[0][0]
+
+    response = file_service.stream_file_from_chunks("11", "bytes=2500-3499")
+    body = b"".join([part async for part in response.body_iterator])
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 2500-3499/{len(content)}"
+    assert response.media_type == "image/jpeg"
+    assert body == content[2500:3500]
+
+
+@patch("app.services.file_service.chunk_service.iter_byte_range", return_value=iter([b"abc"]))
+@patch("app.services.file_service.chunk_service.db")
+@patch("app.services.file_service.db")
+def test_range_on_a_legacy_reference_reads_the_stored_chunk_size(mock_db, mock_chunk_db, mock_iter_range):
+    mock_db.files.find_one.return_value = {"_id": 11, "filename": "a.jpg", "size": 5000, "storage_ref": 3}
+    mock_chunk_db.chunks.find_one.return_value = {"chunk_data": b"x" * 1000}
+
+    response = file_service.stream_file_from_chunks("11", "bytes=2500-2502")
+
+    assert response.status_code == 206
+    mock_chunk_db.chunks.find_one.assert_called_once_with({"file_id": 3, "chunk_index": 0}, {"chunk_data": 1})
+    mock_iter_range.assert_called_once_with(3, 2500, 2502, 1000)
+
+
+@patch("app.services.file_service.chunk_service.iter_byte_range", return_value=iter([]))
+@patch("app.services.file_service.db")
+def test_stream_file_from_chunks_rejects_unsatisfiable_range(mock_db, mock_iter_range):
+    mock_db.files.find_one.return_value = {"_id": 11, "filename": "a.jpg", "size": 1000, "chunk_size": 100}
+
+    with pytest.raises(HTTPException) as exc:
+        file_service.stream_file_from_chunks("11", "bytes=1000-")
+
+    assert exc.value.status_code == 416
+    assert exc.value.headers["Content-Range"] == "bytes */1000"
+
+
+@patch("app.services.file_service.db")
+def test_get_files_by_event_pages_with_projection(mock_db):
+    docs = [{"_id": i, "path": f"/storage/event_e1/{i}.jpg"} for i in (1, 2, 3)]
+    mock_db.files.find.return_value.sort.return_value.limit.return_value = docs
+
+    page = file_service.get_files_by_event("e1", limit=2)
+
+    query, projection = mock_db.files.find.call_args[0]
+    assert query == {"event_id": "e1"}
+    assert projection == {"path": 1}
+    mock_db.files.find.return_value.sort.return_value.limit.assert_called_once_with(3)
+    assert [f["file_id"] for f in page["files"]] == [1, 2]
+    assert page["files"][0]["thumb_url"] == "/api/files/1/renditions/thumb"
+
+    mock_db.files.find.return_value.sort.return_value.limit.return_value = docs[2:]
+    last = file_service.get_files_by_event("e1", limit=2, cursor=page["next_cursor"])
+
+    query = mock_db.files.find.call_args[0][0]
+    assert query["$or"][0] == {"_id": {"$gt": 2}}
+    assert [f["file_id"] for f in last["files"]] == [3]
+    assert last["next_cursor"] is None
+
+
+@patch("app.services.file_service.db")
+def test_get_files_by_user_resumes_after_object_id(mock_db):
+    last_id = ObjectId()
+    mock_db.files.find.return_value.sort.return_value.limit.return_value = []
+    user_id = str(ObjectId())
+
+    page = file_service.get_files_by_user(user_id, cursor=file_service.id_cursor(last_id))
 
-    mock_db.files.insert_one.return_value.inserted_id = ObjectId()
-    mock_db.embeddings.insert_one.return_value.inserted_id = ObjectId()
+    query = mock_db.files.find.call_args[0][0]
+    assert query == {"owner_id": ObjectId(user_id), "_id": {"$gt": last_id}}
+    assert page == {"files": [], "next_cursor": None}
 
-    result = await file_service.handle_file_upload(dummy_file, str(ObjectId()), "event123")
 
-    assert "file_id" in result
-    assert "path" in result
+def test_get_files_by_event_rejects_bad_cursor():
+    with pytest.raises(HTTPException) as exc:
+        file_service.get_files_by_event("e1", cursor="not-a-cursor")
+    assert exc.value.status_code == 400
@@ -0,0 +1,71 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+from app.services import id_service
+
+
+def fake_counters(start: int = 0):
+    """A counters collection whose $inc behaves like find_one_and_update(upsert, AFTER)."""
+    values = {}
+    lock = threading.Lock()
+
+    def find_one_and_update(query, update, **kwargs):
+        with lock:
+            name = query["_id"]
+            values[name] = values.get(name, start) + update["$inc"]["sequence_value"]
+            return {"_id": name, "sequence_value": values[name]}
+
+    collection = MagicMock()
+    collection.find_one_and_update.side_effect = find_one_and_update
+    return collection
+
+
+def test_one_round_trip_per_block():
+    allocator = id_service.SequenceAllocator(fake_counters(), block_size=10)
+
+    ids = [allocator.next("file_id") for _ in range(25)]
+
+    assert ids == list(range(1, 26))
+    assert allocator.stats == {"allocated": 25, "round_trips": 3}
+
+
+def test_continues_after_existing_sequence_ids():
+    allocator = id_service.SequenceAllocator(fake_counters(start=41), block_size=5)
+
+    assert allocator.next("file_id") == 42
+    assert allocator.next("face_id") == 42
+
+
+def test_processes_get_disjoint_blocks():
+    counters = fake_counters()
+    first, second = (id_service.SequenceAllocator(counters, block_size=4) for _ in range(2))
+
+    ids = [first.next("file_id"), second.next("file_id"), first.next("file_id"), second.next("file_id")]
+
+    assert ids == [1, 5, 2, 6]
+
+
+def test_concurrent_threads_never_share_an_id():
+    allocator = id_service.SequenceAllocator(fake_counters(), block_size=7)
+    results = []
+
+    def worker():
+        results.extend(allocator.next("file_id") for _ in range(200))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == list(range(1, 1601))
+
+
+def test_forked_process_starts_a_fresh_allocator():
+    with patch.object(id_service, "db") as mock_db, patch.object(id_service, "_allocator", None):
+        mock_db.counters = fake_counters()
+        parent = id_service.get_allocator()
+        with patch("app.services.id_service.os.getpid", return_value=parent.pid + 1):
+            child = id_service.get_allocator()
+
+    assert child is not parent
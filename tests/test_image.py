@@ -0,0 +1,51 @@
+import io
+from PIL import Image
+
+from app.services.image_service import DecodedImage
+
+
+def jpeg(width: int, height: int, orientation: int = None) -> bytes:
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    encoded = io.BytesIO()
+    Image.new("RGB", (width, height), (120, 80, 40)).save(encoded, "JPEG", exif=exif.tobytes())
+    return encoded.getvalue()
+
+
+def test_draft_proxy_is_scaled_in_the_decoder():
+    image = DecodedImage(jpeg(4000, 2000), max_side=1000)
+
+    assert image.size == (4000, 2000)
+    assert image.proxy.size == (1000, 500)
+    assert image.scale == 0.25
+    assert image._full is None
+
+
+def test_full_is_decoded_lazily_once():
+    image = DecodedImage(jpeg(2000, 1000), max_side=500)
+
+    full = image.full
+
+    assert full.size == (2000, 1000) and full.mode == "RGB"
+    assert image.full is full
+
+
+def test_without_a_cap_full_is_the_proxy():
+    image = DecodedImage(jpeg(800, 600), max_side=0)
+
+    assert image.full is image.proxy
+    assert image.scale == 1.0
+    assert image.megapixels == 0.48
+
+
+def test_exif_orientation_is_applied_to_size_proxy_and_full(tmp_path):
+    path = tmp_path / "rotated.jpg"
+    path.write_bytes(jpeg(4000, 2000, orientation=6))
+
+    image = DecodedImage(str(path), max_side=1000)
+
+    assert image.size == (2000, 4000)
+    assert image.proxy.size == (500, 1000)
+    assert image.full.size == (2000, 4000)
+    assert image.scale == 0.25
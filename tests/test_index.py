@@ -0,0 +1,170 @@
+import pytest
+import threading
+import numpy as np
+from unittest.mock import patch
+
+from app.services import embedding_store, index_service
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(4, 512)).astype(np.float32)
+
+
+@pytest.fixture(autouse=True)
+def clear_indexes():
+    index_service._indexes.clear()
+    with patch("app.services.index_service.cache_service.event_generation", return_value=None), \
+            patch("app.services.index_service.cache_service.bump_event_generation", return_value=None), \
+            patch("app.services.index_service.cache_service.get_cached_embeddings", return_value={}), \
+            patch("app.services.index_service.cache_service.cache_embeddings"):
+        yield
+    index_service._indexes.clear()
+
+
+def test_index_rows_are_normalised(vectors):
+    index = index_service.EventFaceIndex("event123")
+    index.add(1, vectors[:2])
+
+    assert len(index) == 2
+    assert index.vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(index.vectors, axis=1), 1.0, atol=1e-5)
+    assert [index.file_ids[slot] for slot in index.owners] == [1, 1]
+
+
+def test_search_returns_best_face_per_file(vectors):
+    index = index_service.EventFaceIndex("event123")
+    index.add(1, vectors[:2])
+    index.add(2, vectors[2:3])
+
+    results = index.search(vectors[1], threshold=0.99)
+
+    assert len(results) == 1
+    assert results[0][0] == 1
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_search_top_k_sorted(vectors):
+    index = index_service.EventFaceIndex("event123")
+    for file_id, vector in enumerate(vectors):
+        index.add(file_id, vector)
+
+    results = index.search(vectors[0], threshold=-1.0, top_k=2)
+
+    assert len(results) == 2
+    assert results[0][0] == 0
+    assert results[0][1] >= results[1][1]
+
+
+def test_remove_file(vectors):
+    index = index_service.EventFaceIndex("event123")
+    index.add(1, vectors[:2])
+    index.add(2, vectors[2:])
+
+    assert index.remove(1) == 2
+    assert len(index) == 2
+    assert index.search(vectors[0], threshold=0.99) == []
+    assert index.search(vectors[3], threshold=0.99)[0][0] == 2
+
+
+@patch("app.services.embedding_store.db")
+@patch("app.services.index_service.db")
+def test_get_event_index_builds_once(mock_db, mock_store_db, vectors):
+    mock_db.files.find.return_value = [
+        {"_id": 1, "embeddings_id": "e1"},
+        {"_id": 2, "embeddings_id": "e2"},
+        {"_id": 3, "embeddings_id": "e2"},
+        {"_id": 4, "embeddings_id": None},
+    ]
+    mock_store_db.embeddings.find.return_value = [
+        {"_id": "e1", **embedding_store.pack(vectors[:2])},
+        {"_id": "e2", "embeddings_vector": vectors[2:3].tolist()},  # legacy array document
+    ]
+
+    first = index_service.get_event_index("event123")
+    second = index_service.get_event_index("event123")
+
+    assert first is second
+    assert len(first) == 4
+    assert sorted(file_id for file_id, _ in first.search(vectors[2], threshold=0.99)) == [2, 3]
+    mock_db.files.find.assert_called_once()
+    mock_store_db.embeddings.find.assert_called_once()
+
+
+@patch("app.services.index_service.db")
+def test_add_and_remove_file_keep_built_index_in_sync(mock_db, vectors):
+    mock_db.files.find.return_value = []
+
+    index_service.add_file("event123", 7, vectors[:1])
+    assert "event123" not in index_service._indexes
+
+    index = index_service.get_event_index("event123")
+    index_service.add_file("event123", 7, vectors[:1])
+    assert len(index) == 1
+
+    index_service.remove_file("event123", 7)
+    assert len(index) == 0
+
+
+@patch("app.services.index_service.db")
+def test_index_rebuilds_when_another_process_changed_the_event(mock_db, vectors):
+    mock_db.files.find.return_value = []
+    generations = iter([3, 3, 3, 5, 5])  # build_event_index reads it too
+    with patch("app.services.index_service.cache_service.event_generation", side_effect=lambda event_id: next(generations)):
+        first = index_service.get_event_index("event123")
+        assert index_service.get_event_index("event123") is first
+        assert index_service.get_event_index("event123") is not first
+
+
+def test_a_slow_build_does_not_block_other_events():
+    started, release = threading.Event(), threading.Event()
+
+    def build(event_id):
+        if event_id == "slow":
+            started.set()
+            release.wait(5)
+        return index_service.EventFaceIndex(event_id)
+
+    with patch("app.services.index_service.build_event_index", side_effect=build), \
+            patch("app.services.index_service.cache_service.event_generation", return_value=None):
+        slow = threading.Thread(target=index_service.get_event_index, args=("slow",))
+        slow.start()
+        assert started.wait(5)
+        assert index_service.get_event_index("fast").event_id == "fast"
+        assert slow.is_alive()
+        release.set()
+        slow.join(5)
+
+    assert index_service._indexes["slow"].event_id == "slow"
+
+
+@patch("app.services.index_service.db")
+def test_local_changes_advance_the_index_generation(mock_db, vectors):
+    mock_db.files.find.return_value = []
+    index = index_service.get_event_index("event123", generation=3)
+    index.generation = 3
+
+    with patch("app.services.index_service.cache_service.bump_event_generation", return_value=4):
+        index_service.add_file("event123", 7, vectors[:1])
+    assert index.generation == 4
+    assert index_service.get_event_index("event123", generation=4) is index
+
+    with patch("app.services.index_service.cache_service.bump_event_generation", return_value=6):
+        index_service.remove_file("event123", 7)
+    assert index.generation is None
+
+
+@patch("app.services.embedding_store.db")
+@patch("app.services.index_service.db")
+def test_build_event_index_reads_cached_vectors_first(mock_db, mock_store_db, vectors):
+    mock_db.files.find.return_value = [{"_id": 1, "embeddings_id": "e1"}, {"_id": 2, "embeddings_id": "e2"}]
+    mock_store_db.embeddings.find.return_value = [{"_id": "e2", **embedding_store.pack(vectors[2:3])}]
+
+    with patch("app.services.index_service.cache_service.get_cached_embeddings", return_value={"e1": vectors[:2]}), \
+            patch("app.services.index_service.cache_service.cache_embeddings") as mock_cache:
+        index = index_service.build_event_index("event123")
+
+    assert len(index) == 3
+    assert mock_store_db.embeddings.find.call_args[0][0] == {"_id": {"$in": ["e2"]}}
+    assert list(mock_cache.call_args[0][0]) == ["e2"]
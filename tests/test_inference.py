@@ -0,0 +1,132 @@
+import time
+import asyncio
+import pytest
+import numpy as np
+from unittest.mock import patch
+
+from app.services import inference_service, pipeline_service
+
+
+def fake_embed(faces):
+    return np.arange(len(faces) * 512, dtype=np.float32).reshape(len(faces), 512)
+
+
+@patch("app.services.embedding_service.embed_faces", side_effect=fake_embed)
+def test_run_batch_embeds_all_requests_together(mock_embed):
+    crops = [np.zeros((20, 20, 3), dtype=np.uint8)] * 3
+
+    results = inference_service.run_batch([(1, "crops", crops[:2]), (2, "bytes", b"not an image"), (3, "crops", crops[2:])])
+
+    mock_embed.assert_called_once()
+    assert len(mock_embed.call_args.args[0]) == 3
+    (id1, rows1, err1), (id2, rows2, err2), (id3, rows3, err3) = results
+    assert (id1, rows1.shape, err1) == (1, (2, 512), None)
+    assert id2 == 2 and rows2 is None and "UnidentifiedImageError" in err2
+    assert rows3.shape == (1, 512) and rows3[0, 0] == 2 * 512
+
+
+@patch("app.services.inference_service.run_batch", return_value=[(0, np.ones((1, 512), dtype=np.float32), None)])
+def test_embed_runs_locally_without_pool(mock_run):
+    assert inference_service._pool is None
+
+    vectors = inference_service.embed(path="/tmp/a.jpg")
+
+    assert vectors.shape == (1, 512)
+    assert mock_run.call_args.args[0] == [(0, "path", "/tmp/a.jpg")]
+
+
+@pytest.fixture
+def pool():
+    pool = inference_service.InferencePool(size=0, queue_depth=2, max_batch=4, batch_wait=0, threads=1)
+    pool._collector.start()
+    inference_service._pool = pool
+    yield pool
+    inference_service._pool = None
+    pool.stop(timeout=0.1)
+
+
+def test_submit_applies_queue_depth(pool):
+    pool.submit("path", "a.jpg", block=False)
+    pool.submit("path", "b.jpg", block=False)
+
+    with pytest.raises(inference_service.InferenceBusy):
+        pool.submit("path", "c.jpg", block=False)
+    assert pool.pending() == 2
+
+
+def test_collector_resolves_futures(pool):
+    ok = pool.submit("path", "a.jpg")
+    failed = pool.submit("path", "b.jpg")
+    rows = np.ones((2, 512), dtype=np.float32)
+
+    pool._results.put((2, [(0, rows, None), (1, None, "ValueError: broken")]))
+
+    assert ok.result(5).shape == (2, 512)
+    with pytest.raises(inference_service.InferenceError):
+        failed.result(5)
+    assert pool.stats["batches"] == 1 and pool.stats["batched_requests"] == 2
+
+
+def test_async_client_awaits_worker_result(pool):
+    async def call():
+        task = asyncio.ensure_future(inference_service.embed_async(data=b"jpeg"))
+        await asyncio.sleep(0.05)
+        request_id, kind, payload = pool._tasks.get(timeout=5)
+        pool._results.put((1, [(request_id, np.zeros((1, 512), dtype=np.float32), None)]))
+        return kind, payload, await task
+
+    kind, payload, vectors = asyncio.run(call())
+
+    assert (kind, payload) == ("bytes", b"jpeg")
+    assert vectors.shape == (1, 512)
+
+
+def test_async_client_times_out(pool):
+    with pytest.raises(inference_service.InferenceTimeout):
+        asyncio.run(inference_service.embed_async(path="a.jpg", timeout=0.05))
+
+
+@patch("app.services.pipeline_service.inference_service.embed", return_value=np.ones((2, 512), dtype=np.float32))
+@patch("app.services.pipeline_service.inference_service.is_running", return_value=True)
+def test_pipeline_uses_the_pool(mock_running, mock_embed):
+    embeddings = pipeline_service.compute_file_embeddings(object(), "/tmp/a.jpg")
+
+    mock_embed.assert_called_once_with(path="/tmp/a.jpg")
+    assert len(embeddings) == 2 and len(embeddings[0]) == 512
+
+
+def test_timed_out_request_is_forgotten(pool):
+    with pytest.raises(inference_service.InferenceTimeout):
+        inference_service.embed(path="a.jpg", timeout=0.05)
+
+    assert pool.pending() == 0
+
+
+class FakeProcess:
+    def __init__(self, pid, alive):
+        self.pid = pid
+        self.exitcode = None if alive else -9
+        self._alive = alive
+
+    def is_alive(self):
+        return self._alive
+
+
+def test_dead_worker_fails_the_requests_it_claimed(pool):
+    lost = pool.submit("path", "a.jpg")
+    queued = pool.submit("path", "b.jpg")
+    pool._results.put(("claim", 123, [lost.request_id]))
+    for _ in range(100):
+        if pool._claimed:
+            break
+        time.sleep(0.01)
+
+    # The collector notices the dead worker on its next pass
+    with patch.object(pool, "_spawn", return_value=FakeProcess(124, True)):
+        pool._processes = [FakeProcess(123, False)]
+        with pytest.raises(inference_service.InferenceError, match="exited"):
+            lost.result(5)
+        pool._processes = []
+
+    assert not queued.done() and pool.pending() == 1
+    assert pool.stats["restarts"] == 1
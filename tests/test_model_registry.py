@@ -0,0 +1,37 @@
+import pytest
+from unittest.mock import patch
+
+from app.services import model_registry
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    model_registry._embedder = None
+    model_registry._detector = None
+    yield
+    model_registry._embedder = None
+    model_registry._detector = None
+
+
+@patch("app.services.model_registry.torch.load")
+@patch("app.services.model_registry.InceptionResnetV1")
+def test_embedder_loaded_once(mock_resnet, mock_load):
+    first = model_registry.get_embedder()
+    second = model_registry.get_embedder()
+
+    assert first is second
+    mock_resnet.assert_called_once()
+    mock_load.assert_called_once()
+
+
+@patch("app.services.model_registry.MTCNN")
+@patch("app.services.model_registry.torch.load")
+@patch("app.services.model_registry.InceptionResnetV1")
+def test_warm_up_reports_stats(mock_resnet, mock_load, mock_mtcnn):
+    stats = model_registry.warm_up()
+
+    assert stats["embedder_loaded"] is True
+    assert stats["detector_loaded"] is True
+    assert stats["embedder_load_seconds"] is not None
+    assert "rss_mb" in stats
+    mock_mtcnn.assert_called_once()
@@ -0,0 +1,101 @@
+import pytest
+import numpy as np
+from unittest.mock import patch
+from PIL import Image
+
+from app.services import phash_service
+
+
+@pytest.fixture
+def burst():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+    shifted = np.clip(frame.astype(np.int16) + 6, 0, 255).astype(np.uint8)
+    other = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+    return Image.fromarray(frame), Image.fromarray(shifted), Image.fromarray(other)
+
+
+def test_dhash_close_for_burst_frames(burst):
+    frame, shifted, other = burst
+    a, b, c = (phash_service.dhash(image) for image in burst)
+
+    assert 0 <= a < 2 ** 64
+    assert phash_service.hamming(a, b) <= 6
+    assert phash_service.hamming(a, c) > 6
+
+
+def test_hex_round_trip():
+    value = 2 ** 64 - 1
+    assert phash_service.to_hex(value) == "ffffffffffffffff"
+    assert phash_service.from_hex(phash_service.to_hex(12345)) == 12345
+
+
+def test_bk_tree_matches_brute_force():
+    rng = np.random.default_rng(1)
+    values = [int(v) for v in rng.integers(0, 2 ** 63, 500, dtype=np.int64)]
+    values += [v ^ (1 << int(bit)) for v, bit in zip(values[:50], rng.integers(0, 63, 50))]
+    tree = phash_service.BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+
+    query = values[3]
+    expected = sorted(
+        (i, phash_service.hamming(query, v)) for i, v in enumerate(values)
+        if phash_service.hamming(query, v) <= 4
+    )
+    assert sorted(tree.search(query, 4)) == expected
+    assert len(tree) == len(values)
+
+
+def test_bk_tree_remove():
+    tree = phash_service.BKTree()
+    tree.add(0b1010, "a")
+    tree.add(0b1011, "b")
+
+    assert tree.remove(0b1010, "a") is True
+    assert tree.remove(0b1010, "a") is False
+    assert tree.search(0b1010, 1) == [("b", 1)]
+
+
+@patch("app.services.phash_service.db")
+def test_find_near_duplicates_builds_event_tree(mock_db):
+    phash_service._trees.clear()
+    mock_db.files.find.return_value = [
+        {"_id": 1, "phash": "00000000000000ff"},
+        {"_id": 2, "phash": "00000000000000fe"},
+        {"_id": 3, "phash": "ffffffffffffffff"},
+    ]
+
+    matches = phash_service.find_near_duplicates("event123", "00000000000000ff", max_distance=2)
+    assert matches == [(1, 0), (2, 1)]
+    phash_service._trees.clear()
+
+
+@patch("app.services.phash_service.db")
+def test_event_tree_rebuilds_when_another_process_changed_the_event(mock_db):
+    phash_service._trees.clear()
+    mock_db.files.find.return_value = [{"_id": 1, "phash": "00000000000000ff"}]
+    generations = iter([3, 3, 3, 5, 5])  # build_event_tree reads it too
+    with patch("app.services.phash_service.cache_service.event_generation", side_effect=lambda event_id: next(generations)):
+        first = phash_service.get_event_tree("event123")
+        assert phash_service.get_event_tree("event123") is first
+        assert phash_service.get_event_tree("event123") is not first
+    assert mock_db.files.find.call_count == 2
+    phash_service._trees.clear()
+
+
+@patch("app.services.phash_service.db")
+def test_local_changes_advance_the_tree_generation(mock_db):
+    phash_service._trees.clear()
+    mock_db.files.find.return_value = []
+    with patch("app.services.phash_service.cache_service.event_generation", return_value=3):
+        tree = phash_service.get_event_tree("event123")
+
+    phash_service.add_file("event123", 7, "00000000000000ff", generation=4)
+    assert tree.generation == 4 and len(tree) == 1
+    with patch("app.services.phash_service.cache_service.event_generation", return_value=4):
+        assert phash_service.get_event_tree("event123") is tree
+
+    phash_service.remove_file("event123", 7, "00000000000000ff", generation=6)
+    assert tree.generation is None and len(tree) == 0
+    phash_service._trees.clear()
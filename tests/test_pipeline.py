@@ -0,0 +1,147 @@
+import json
+import pytest
+import numpy as np
+from unittest.mock import patch, MagicMock
+from bson import ObjectId
+from datetime import datetime
+
+from app.services import embedding_store, pipeline_service
+
+
+@pytest.fixture
+def job():
+    return {"file_id": 42, "path": "/fake/path.jpg", "event_id": "event123"}
+
+
+def test_memory_queue_is_bounded(job):
+    q = pipeline_service.MemoryJobQueue(maxsize=1)
+
+    assert q.put(job) is True
+    assert q.put(job) is False
+    assert q.qsize() == 1
+    assert q.get(timeout=0.01) == job
+    assert q.get(timeout=0.01) is None
+
+
+def test_redis_queue_refuses_when_full(job):
+    client = MagicMock()
+    client.register_script.return_value.return_value = 0
+    q = pipeline_service.RedisJobQueue(client, "embedding_jobs", maxsize=5)
+
+    assert q.put(job) is False
+    client.lpush.assert_not_called()
+
+
+def test_redis_queue_checks_length_and_pushes_in_one_script(job):
+    client = MagicMock()
+    client.register_script.return_value.return_value = 1
+    q = pipeline_service.RedisJobQueue(client, "embedding_jobs", maxsize=5)
+
+    assert q.put(job) is True
+    client.register_script.return_value.assert_called_once_with(
+        keys=["embedding_jobs"], args=[json.dumps(job), 5]
+    )
+    client.llen.assert_not_called()
+    client.lpush.assert_not_called()
+
+
+@patch("app.services.pipeline_service.ann_service")
+@patch("app.services.pipeline_service.index_service")
+@patch("app.services.pipeline_service.embedding_store.insert_embedding")
+@patch("app.services.pipeline_service.compute_file_faces")
+@patch("app.services.pipeline_service.db")
+def test_process_job_attaches_embeddings(mock_db, mock_compute, mock_insert, mock_index, mock_ann, job):
+    # /fake/path.jpg does not open, so no perceptual hash is computed
+    embeddings = np.random.rand(2, 512).tolist()
+    embedding_id = ObjectId()
+    mock_db.files.find_one_and_update.return_value = {"_id": 42}
+    mock_insert.return_value = embedding_id
+    mock_compute.return_value = (embeddings, None)
+
+    status = pipeline_service.process_job(job)
+
+    assert status == pipeline_service.STATUS_CREATED
+    mock_db.files.update_one.assert_called_with(
+        {"_id": 42},
+        {"$set": {"embeddings_id": embedding_id, "embedding_status": pipeline_service.STATUS_CREATED, "phash": None}}
+    )
+    mock_index.add_file.assert_called_once_with("event123", 42, embeddings)
+    mock_insert.assert_called_once_with(embeddings, file_id=42)
+
+
+@patch("app.services.pipeline_service.ann_service")
+@patch("app.services.pipeline_service.index_service")
+@patch("app.services.pipeline_service.embedding_store.insert_embedding")
+@patch("app.services.pipeline_service.compute_file_faces")
+@patch("app.services.pipeline_service.db")
+def test_process_job_inline_writes_vectors_with_the_status(mock_db, mock_compute, mock_insert, mock_index, mock_ann, job):
+    embeddings = np.random.rand(2, 512).astype(np.float32)
+    boxes = np.array([[10, 20, 50, 60], [70, 20, 110, 60]], dtype=np.float32)
+    mock_db.files.find_one_and_update.return_value = {"_id": 42}
+    mock_compute.return_value = (embeddings.tolist(), boxes)
+
+    with patch.object(pipeline_service.Config, "EMBEDDING_STORAGE_MODE", "inline"):
+        status = pipeline_service.process_job(job)
+
+    assert status == pipeline_service.STATUS_CREATED
+    mock_insert.assert_not_called()
+    mock_db.files.update_one.assert_called_once()
+    update = mock_db.files.update_one.call_args[0][1]["$set"]
+    assert update["embeddings_id"] is None and update["embedding_status"] == pipeline_service.STATUS_CREATED
+    inline = update[embedding_store.INLINE_FIELD]
+    assert np.array_equal(embedding_store.unpack(inline), embeddings)
+    assert np.array_equal(embedding_store.unpack_boxes(inline), boxes)
+
+
+@patch("app.services.pipeline_service.compute_file_faces")
+@patch("app.services.pipeline_service.db")
+def test_process_job_skips_already_claimed_file(mock_db, mock_compute, job):
+    mock_db.files.find_one_and_update.return_value = None
+
+    assert pipeline_service.process_job(job) is None
+    mock_compute.assert_not_called()
+
+
+@patch("app.services.pipeline_service.compute_file_faces", side_effect=RuntimeError("boom"))
+@patch("app.services.pipeline_service.db")
+def test_process_job_marks_failure(mock_db, mock_compute, job):
+    mock_db.files.find_one_and_update.return_value = {"_id": 42}
+
+    assert pipeline_service.process_job(job) == pipeline_service.STATUS_FAILED
+    update = mock_db.files.update_one.call_args[0][1]["$set"]
+    assert update["embedding_status"] == pipeline_service.STATUS_FAILED
+
+
+@patch("app.services.pipeline_service.enqueue_file", return_value=True)
+@patch("app.services.pipeline_service.db")
+def test_requeue_releases_expired_processing_claims(mock_db, mock_enqueue):
+    mock_db.files.update_many.return_value.modified_count = 1
+    mock_db.files.find.return_value = [{"_id": 7, "path": "/fake/7.jpg", "event_id": "event123"}]
+
+    with patch.object(pipeline_service.Config, "EMBEDDING_LEASE_SECONDS", 60):
+        assert pipeline_service.requeue_pending_files() == 1
+
+    query, update = mock_db.files.update_many.call_args[0]
+    assert query["embedding_status"] == pipeline_service.STATUS_PROCESSING
+    expired = query["$or"][0]["embedding_claimed_at"]["$lt"]
+    assert 55 <= (datetime.utcnow() - expired).total_seconds() <= 65
+    assert update["$set"] == {"embedding_status": pipeline_service.STATUS_PENDING}
+    # Released files are picked up by the pending scan that follows
+    mock_db.files.find.assert_called_once_with({"embedding_status": pipeline_service.STATUS_PENDING}, {"path": 1, "event_id": 1})
+    mock_enqueue.assert_called_once_with(7, "/fake/7.jpg", "event123")
+
+
+@patch("app.services.pipeline_service.embedding_store.insert_embedding")
+@patch("app.services.pipeline_service.compute_file_faces", return_value=([], None))
+@patch("app.services.pipeline_service.open_image", return_value=None)
+@patch("app.services.pipeline_service.publish_file")
+@patch("app.services.pipeline_service.db")
+def test_process_job_timestamps_its_claim(mock_db, mock_publish, mock_open, mock_compute, mock_insert, job):
+    mock_db.files.find_one_and_update.return_value = {"_id": 42}
+    mock_db.files.find.return_value = []
+
+    pipeline_service.process_job(job)
+
+    claim = mock_db.files.find_one_and_update.call_args[0][1]["$set"]
+    assert claim["embedding_status"] == pipeline_service.STATUS_PROCESSING
+    assert isinstance(claim["embedding_claimed_at"], datetime)
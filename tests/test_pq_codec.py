@@ -0,0 +1,80 @@
+import pytest
+import numpy as np
+from unittest.mock import patch
+
+from app.services import index_service, pq_codec
+from app.services.index_service import normalize_vectors
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(20, 64)).astype(np.float32)
+    return normalize_vectors(centres[rng.integers(20, size=1000)] + 0.3 * rng.normal(size=(1000, 64)))
+
+
+@pytest.fixture(scope="module")
+def quantizer(vectors):
+    return pq_codec.ProductQuantizer.train(vectors, m=8, iterations=5)
+
+
+def test_codes_are_one_byte_per_subvector(quantizer, vectors):
+    codes = quantizer.encode(vectors[:10])
+
+    assert codes.shape == (10, 8)
+    assert codes.dtype == np.uint8
+    assert quantizer.codebooks.shape == (8, 256, 8)
+
+
+def test_adc_scores_match_decoded_dot_products(quantizer, vectors):
+    codes = quantizer.encode(vectors[:50])
+
+    scores = quantizer.scores(vectors[:2], codes)
+
+    assert scores.shape == (50, 2)
+    assert np.allclose(scores, quantizer.decode(codes) @ vectors[:2].T, atol=1e-4)
+    assert np.abs(scores - vectors[:50] @ vectors[:2].T).mean() < 0.1
+
+
+def test_train_rejects_indivisible_dimension(vectors):
+    with pytest.raises(ValueError):
+        pq_codec.ProductQuantizer.train(vectors, m=7)
+
+
+def test_save_and_load(tmp_path, quantizer):
+    path = str(tmp_path / "pq_codebook.npy")
+
+    quantizer.save(path)
+
+    assert np.array_equal(pq_codec.ProductQuantizer.load(path).codebooks, quantizer.codebooks)
+
+
+def test_get_quantizer_follows_config(tmp_path, quantizer):
+    path = str(tmp_path / "pq_codebook.npy")
+    quantizer.save(path)
+    pq_codec._quantizer = None
+    try:
+        with patch.object(pq_codec.Config, "PQ_CODEBOOK_PATH", path):
+            with patch.object(pq_codec.Config, "FACE_INDEX_CODEC", "float32"):
+                assert pq_codec.get_quantizer() is None
+            with patch.object(pq_codec.Config, "FACE_INDEX_CODEC", "pq"):
+                assert pq_codec.get_quantizer().m == 8
+    finally:
+        pq_codec._quantizer = None
+
+
+def test_quantised_event_index_ranks_like_exact(quantizer, vectors):
+    exact = index_service.EventFaceIndex("event123")
+    coded = index_service.EventFaceIndex("event123", quantizer=quantizer)
+    for file_id in range(200):
+        exact.add(file_id, vectors[file_id])
+        coded.add(file_id, vectors[file_id])
+    coded.remove(3)
+
+    assert coded.vectors.dtype == np.uint8
+    assert coded.nbytes < exact.nbytes / 10
+    assert 5 in {file_id for file_id, _ in coded.search(vectors[5], threshold=-1.0, top_k=3)}
+    exact_top = {file_id for file_id, _ in exact.search(vectors[7], threshold=-1.0, top_k=10)}
+    coded_top = {file_id for file_id, _ in coded.search(vectors[7], threshold=-1.0, top_k=10)}
+    assert len(exact_top & coded_top) >= 7
+    assert 3 not in {file_id for file_id, _ in coded.search(vectors[3], threshold=-1.0)}
@@ -0,0 +1,234 @@
+"""
+Query-plan check: every service query shape must be answered by an index from
+app.db.INDEXES. Without MongoDB only the static check runs: each shape's fields
+must start an index's key pattern (and meet its partial filter). The plan checks
+need a real MongoDB at MONGO_URI (skipped otherwise); the queries
+run against a throwaway database seeded with enough documents that the planner
+would otherwise choose a COLLSCAN.
+The listing and matching paths are driven through the services themselves and the
+filters and sorts they send are recorded, so an index that stops matching the real
+query (keyset cursors included) fails here. QUERY_SHAPES covers the paths that
+can't be driven without Redis or a worker.
+"""
+import os
+import pytest
+import numpy as np
+from datetime import datetime
+from bson import ObjectId
+from unittest.mock import patch
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from app.config import Config
+from app.db import INDEXES, ensure_indexes
+from app.services import chunk_service, embedding_store, face_service, file_service, index_service
+from app.utils import id_cursor
+
+SEED_DOCS = 500
+OWNER = ObjectId()
+VECTOR = np.ones((1, 8), dtype=np.float32)
+
+# (collection, filter, sort) of service queries not driven by service_queries below
+QUERY_SHAPES = [
+    ("files", {"owner_id": OWNER, "content_hash": "h1"}, None),                 # upload dedup
+    ("files", {"storage_ref": 7}, None),                                        # pipeline fan-out to references
+    ("files", {"embedding_status": "pending"}, None),                           # requeue_pending_files
+    ("files", {"embedding_status": "processing", "$or": [
+        {"embedding_claimed_at": {"$lt": datetime.utcnow()}}, {"embedding_claimed_at": {"$exists": False}}
+    ]}, None),                                                                  # expired claims
+    ("ann_feed", {"_id": {"$gt": 7}}, [("_id", 1)]),                            # ANN catch-up
+    ("files", {"_id": {"$in": [7, 8]}}, None),                                  # vectors of the fed files
+    ("files", {"event_id": "e1", "phash": {"$ne": None}}, None),                # burst index
+    ("embeddings", {"file_id": 7}, None),
+    ("embeddings", {"face_id": 7}, None),
+    ("faces", {"owner_id": OWNER}, None),                                       # attended events
+    ("file_metadata", {"file_id": 7}, None),
+    ("users", {"email": "guest1@example.com"}, None),
+    ("user_auth", {"user_id": "u1"}, None),
+]
+
+
+def _fields(query: dict) -> set:
+    fields = set()
+    for key, value in query.items():
+        if key in ("$or", "$and"):
+            for branch in value:
+                fields |= _fields(branch)
+        else:
+            fields.add(key)
+    return fields
+
+
+def _prefix_index(collection: str, query: dict):
+    """Name of the declared index whose leading key(s) the query filters on, or None."""
+    fields = _fields(query)
+    if "_id" in fields:
+        return "_id_"
+    for name, keys, options in INDEXES:
+        partial = options.get("partialFilterExpression", {})
+        if name != collection or any(query.get(key) != value for key, value in partial.items()):
+            continue
+        if keys[0][0] in fields:
+            return options["name"]
+    return None
+
+
+@pytest.mark.parametrize("collection, query, sort", QUERY_SHAPES, ids=[f"{c}:{sorted(q)}" for c, q, _ in QUERY_SHAPES])
+def test_query_shape_starts_a_declared_index(collection, query, sort):
+    assert _prefix_index(collection, query), f"no index in app.db.INDEXES starts with a field of {collection} {query}"
+
+
+def test_prefix_check_rejects_unindexed_and_outside_partial_filters():
+    assert _prefix_index("files", {"filename": "a.jpg"}) is None
+    assert _prefix_index("files", {"embedding_status": "created"}) is None
+    assert _prefix_index("files", {"embedding_status": "pending"}) == "embedding_status_pending"
+
+
+@pytest.fixture(scope="module")
+def database():
+    try:
+        client = MongoClient(Config.MONGO_URI, serverSelectionTimeoutMS=500)
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("query-plan checks need a running MongoDB")
+    name = f"{Config.MONGO_DB_NAME}_plans_{os.getpid()}"
+    database = client[name]
+    _seed(database)
+    assert not ensure_indexes(database)["failed"]
+    yield database
+    client.drop_database(name)
+
+
+def _seed(database):
+    n = SEED_DOCS
+    database.files.insert_many([{
+        "_id": i, "event_id": f"e{i % 10}", "owner_id": OWNER if i % 7 == 0 else ObjectId(), "path": f"/storage/{i}.jpg",
+        "content_hash": f"h{i}", "embedding_status": "pending" if i % 50 == 0 else "processing" if i % 50 == 25 else "created",
+        "embedding_claimed_at": datetime.utcnow(),
+        "embeddings_id": ObjectId(), "phash": f"{i:016x}", "face_vectors": embedding_store.pack_inline(VECTOR),
+        **({"storage_ref": i - 1} if i % 25 == 0 else {})
+    } for i in range(n)])
+    database.embeddings.insert_many([{"file_id": i} if i % 2 else {"face_id": i} for i in range(n)])
+    database.chunks.insert_many([{"file_id": i // 4, "chunk_index": i % 4, "chunk_data": b"abcd"} for i in range(n)])
+    database.faces.insert_many([{"_id": i, "owner_id": ObjectId(), "event_id": f"e{i % 10}",
+                                 "face_vectors": embedding_store.pack_inline(VECTOR)} for i in range(n)])
+    database.ann_feed.insert_many([{"_id": i, "file_id": i, "event_id": f"e{i % 10}", "created_at": datetime.utcnow()}
+                                   for i in range(n)])
+    database.file_metadata.insert_many([{"file_id": i} for i in range(n)])
+    database.users.insert_many([{"email": f"guest{i}@example.com"} for i in range(n)])
+    database.user_auth.insert_many([{"user_id": f"u{i}"} for i in range(n)])
+
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+@pytest.mark.parametrize("collection, query, sort", QUERY_SHAPES, ids=[f"{c}:{sorted(q)}" for c, q, _ in QUERY_SHAPES])
+def test_service_query_uses_an_index(database, collection, query, sort):
+    cursor = database[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    winning = cursor.explain()["queryPlanner"]["winningPlan"]
+
+    stages = set(_stages(winning))
+    assert "COLLSCAN" not in stages, f"{collection} {query} scans the collection: {winning}"
+
+
+class RecordingCursor:
+    def __init__(self, cursor, call: dict):
+        self._cursor = cursor
+        self._call = call
+
+    def sort(self, key, direction=1):
+        self._call["sort"] = [(key, direction)] if isinstance(key, str) else list(key)
+        self._cursor = self._cursor.sort(self._call["sort"])
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class RecordingCollection:
+    """Passes reads through to the real collection and records their filter and sort."""
+
+    def __init__(self, collection, calls: list):
+        self._collection = collection
+        self._calls = calls
+
+    def _record(self, query, sort=None) -> dict:
+        call = {"collection": self._collection.name, "filter": query or {}, "sort": sort}
+        self._calls.append(call)
+        return call
+
+    def find(self, query=None, *args, **kwargs):
+        call = self._record(query, kwargs.get("sort"))
+        return RecordingCursor(self._collection.find(query, *args, **kwargs), call)
+
+    def find_one(self, query=None, *args, **kwargs):
+        self._record(query, kwargs.get("sort"))
+        return self._collection.find_one(query, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class RecordingDatabase:
+    def __init__(self, database):
+        self._database = database
+        self.calls = []
+
+    def __getitem__(self, name):
+        return RecordingCollection(self._database[name], self.calls)
+
+    __getattr__ = __getitem__
+
+
+@pytest.fixture(scope="module")
+def service_queries(database):
+    """Runs the listing, keyset and matching paths and returns the queries they sent."""
+    recorder = RecordingDatabase(database)
+    with patch.object(file_service, "db", recorder), patch.object(face_service, "db", recorder), \
+            patch.object(index_service, "db", recorder), patch.object(embedding_store, "db", recorder), \
+            patch.object(chunk_service, "db", recorder), \
+            patch.object(index_service.cache_service, "event_generation", return_value=None), \
+            patch.object(index_service.cache_service, "get_cached_embeddings", return_value={}), \
+            patch.object(index_service.cache_service, "cache_embeddings"), \
+            patch.object(face_service.cache_service, "event_generation", return_value=None), \
+            patch.dict(index_service._indexes, clear=True):
+        page = file_service.get_files_by_event("e1", limit=5)
+        file_service.get_files_by_event("e1", limit=5, cursor=page["next_cursor"])
+        file_service.get_files_by_event("e1", limit=5, cursor=id_cursor(ObjectId()))
+        page = file_service.get_files_by_user(str(OWNER), limit=5)
+        file_service.get_files_by_user(str(OWNER), limit=5, cursor=page["next_cursor"])
+        face_service.match_face_with_files("1", "e1", limit=2)
+        list(chunk_service.iter_byte_range(7, 0, 10, 4))
+    return recorder.calls
+
+
+def test_service_queries_cover_the_keyset_paths(service_queries):
+    filters = [call["filter"] for call in service_queries if call["collection"] == "files"]
+    assert {"event_id": "e1"} in filters
+    assert any("$or" in query and query.get("event_id") == "e1" for query in filters)
+    assert any(isinstance(query.get("_id"), dict) and query.get("event_id") == "e1" for query in filters)
+    assert any("$or" in query and query.get("owner_id") == OWNER for query in filters)
+
+
+def test_recorded_service_queries_use_an_index(database, service_queries):
+    for call in service_queries:
+        cursor = database[call["collection"]].find(call["filter"])
+        if call["sort"]:
+            cursor = cursor.sort(call["sort"])
+        winning = cursor.explain()["queryPlanner"]["winningPlan"]
+
+        stages = set(_stages(winning))
+        assert "COLLSCAN" not in stages, f"{call['collection']} {call['filter']} scans the collection: {winning}"
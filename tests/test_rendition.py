@@ -0,0 +1,79 @@
+import os
+import pytest
+from PIL import Image
+from unittest.mock import patch
+
+from app.services import rendition_service
+
+
+@pytest.fixture
+def original(tmp_path):
+    event_folder = tmp_path / "event_e1"
+    event_folder.mkdir()
+    path = event_folder / "photo.jpg"
+    Image.new("RGB", (3000, 2000), (200, 100, 50)).save(path, "JPEG")
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def fresh_lru(tmp_path):
+    with patch.object(rendition_service, "_lru", rendition_service.DiskLRU(str(tmp_path), 10 ** 9)):
+        yield
+
+
+def test_get_rendition_generates_once(original):
+    path = rendition_service.get_rendition(7, original, "thumb")
+
+    assert path == os.path.join(os.path.dirname(original), "renditions", "7_thumb.webp")
+    with Image.open(path) as image:
+        assert max(image.size) == 256
+        assert image.size == (256, 171)
+    mtime = os.path.getmtime(path)
+    with patch.object(rendition_service, "render") as mock_render:
+        assert rendition_service.get_rendition(7, original, "thumb") == path
+        mock_render.assert_not_called()
+    assert os.path.getmtime(path) >= mtime
+
+
+def test_get_rendition_undecodable_original(tmp_path):
+    path = tmp_path / "event_e1" / "logo.svg"
+    path.parent.mkdir()
+    path.write_text("<svg/>")
+
+    assert rendition_service.get_rendition(8, str(path), "thumb") is None
+
+
+def test_unknown_rendition(original):
+    with pytest.raises(ValueError):
+        rendition_service.get_rendition(7, original, "poster")
+
+
+def test_disk_lru_evicts_least_recently_used(tmp_path):
+    folder = tmp_path / "event_e1" / "renditions"
+    folder.mkdir(parents=True)
+    lru = rendition_service.DiskLRU(str(tmp_path), budget_bytes=250)
+    paths = []
+    for i in range(3):
+        path = folder / f"{i}_thumb.webp"
+        path.write_bytes(b"x" * 100)
+        paths.append(str(path))
+        lru.add(str(path), 100)
+        if i == 1:
+            lru.touch(paths[0])
+
+    assert lru.total_bytes == 200
+    assert os.path.exists(paths[0])
+    assert not os.path.exists(paths[1])
+    assert os.path.exists(paths[2])
+
+
+def test_disk_lru_loads_existing_files(tmp_path):
+    folder = tmp_path / "event_e1" / "renditions"
+    folder.mkdir(parents=True)
+    (folder / "1_thumb.webp").write_bytes(b"x" * 100)
+    lru = rendition_service.DiskLRU(str(tmp_path), budget_bytes=150)
+
+    lru.add(str(folder / "2_thumb.webp"), 100)
+
+    assert lru.total_bytes == 100
+    assert not (folder / "1_thumb.webp").exists()
@@ -0,0 +1,120 @@
+import os
+import pytest
+import numpy as np
+from bson import ObjectId
+from unittest.mock import patch
+
+from app.services import cache_service, index_service, shard_service
+
+
+@pytest.fixture(autouse=True)
+def shard_root(tmp_path):
+    index_service._indexes.clear()
+    with patch.object(shard_service.Config, "SHARD_PATH", str(tmp_path)), \
+            patch.object(index_service.Config, "FACE_INDEX_SHARDS", True):
+        yield tmp_path
+    index_service._indexes.clear()
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(4, 512)).astype(np.float32)
+
+
+def test_write_and_map_shard(vectors):
+    legacy_id = ObjectId()
+    shard_service.write_shard("e1", 3, "float32", vectors, np.array([0, 0, 1, 2]), [7, legacy_id, None])
+
+    rows, owners, file_ids = shard_service.load_shard("e1", 3, "float32")
+
+    assert isinstance(rows, np.memmap)
+    assert not rows.flags.writeable
+    assert np.array_equal(rows, vectors)
+    assert owners.tolist() == [0, 0, 1, 2]
+    assert file_ids == [7, legacy_id, None]
+
+
+def test_stale_or_other_codec_shard_is_ignored(vectors):
+    shard_service.write_shard("e1", 3, "float32", vectors, np.zeros(4), [1])
+
+    assert shard_service.load_shard("e1", 4, "float32") is None
+    assert shard_service.load_shard("e1", 3, "pq64") is None
+    assert shard_service.load_shard("e2", 3, "float32") is None
+
+
+def test_rewrite_swaps_manifest_and_removes_older_versions(shard_root, vectors):
+    shard_service.write_shard("e1", 3, "float32", vectors[:2], np.zeros(2), [1])
+    shard_service.write_shard("e1", 4, "float32", vectors, np.zeros(4), [1])
+
+    assert shard_service.read_manifest("e1")["generation"] == 4
+    names = sorted(os.listdir(shard_service.shard_dir("e1")))
+    assert names == sorted(["manifest.json", *shard_service.read_manifest("e1")["files"].values()])
+
+
+def _files_and_embeddings(mock_db, mock_store_db, vectors):
+    mock_db.files.find.return_value = [{"_id": 1, "embeddings_id": "a"}, {"_id": 2, "embeddings_id": "b"}]
+    mock_store_db.embeddings.find.return_value = [
+        {"_id": "a", "embeddings_vector": vectors[:2].tolist()},
+        {"_id": "b", "embeddings_vector": vectors[2:3].tolist()},
+    ]
+
+
+@patch("app.services.index_service.cache_service")
+@patch("app.services.embedding_store.db")
+@patch("app.services.index_service.db")
+def test_second_worker_maps_the_shard(mock_db, mock_store_db, mock_cache, vectors):
+    mock_cache.event_generation.return_value = 5
+    mock_cache.get_cached_embeddings.return_value = {}
+    _files_and_embeddings(mock_db, mock_store_db, vectors)
+
+    built = index_service.build_event_index("e1")
+    mock_db.files.find.reset_mock()
+    mapped = index_service.build_event_index("e1")
+
+    assert built.shared and mapped.shared
+    mock_db.files.find.assert_not_called()
+    assert isinstance(mapped.vectors, np.memmap)
+    assert mapped.search(vectors[2], threshold=0.99) == built.search(vectors[2], threshold=0.99)
+    assert mapped.search(vectors[2], threshold=0.99)[0][0] == 2
+
+
+@patch("app.services.index_service.cache_service")
+@patch("app.services.embedding_store.db")
+@patch("app.services.index_service.db")
+def test_uploads_patch_the_mapped_index_and_rewrite_the_shard_later(mock_db, mock_store_db, mock_cache, vectors):
+    mock_cache.event_generation.return_value = 5
+    mock_cache.get_cached_embeddings.return_value = {}
+    _files_and_embeddings(mock_db, mock_store_db, vectors)
+    mock_cache.advance_generation.side_effect = cache_service.advance_generation
+    index = index_service.get_event_index("e1")
+
+    mock_cache.bump_event_generation.side_effect = [6, 7]
+    index_service.add_file("e1", 3, vectors[3:])
+    index_service.remove_file("e1", 1)
+
+    # Applied in place; the shard on disk still holds generation 5 until the delay passes
+    assert index_service._indexes["e1"] is index
+    assert sorted(file_id for file_id, _ in index.search(vectors[3], threshold=-1.0)) == [2, 3]
+    assert shard_service.read_manifest("e1")["generation"] == 5
+
+    mock_cache.event_generation.return_value = 7
+    with patch.object(index_service.Config, "SHARD_WRITE_DELAY", 0):
+        mapped = index_service.get_event_index("e1")
+
+    assert shard_service.read_manifest("e1")["generation"] == 7
+    assert index_service._indexes["e1"] is mapped
+    assert mapped.shared and mapped.generation == 7 and mapped.unsaved_since is None
+    mock_db.files.find.assert_called_once()  # no rebuild from Mongo
+    assert mapped.search(vectors[3], threshold=0.99)[0][0] == 3
+
+
+def test_mapped_index_copies_before_changing(vectors, shard_root):
+    shard_service.write_shard("e1", 1, "float32", index_service.normalize_vectors(vectors[:2]), np.array([0, 1]), [10, 11])
+    index = index_service.EventFaceIndex.from_shard("e1", 1, None, *shard_service.load_shard("e1", 1, "float32"))
+
+    index.remove(10)
+    index.add(12, vectors[2])
+
+    assert not index.shared
+    assert sorted(file_id for file_id, _ in index.search(vectors[2], threshold=-1.0)) == [11, 12]
+    assert len(shard_service.load_shard("e1", 1, "float32")[0]) == 2
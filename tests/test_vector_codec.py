@@ -0,0 +1,44 @@
+import pytest
+import numpy as np
+
+from app.services import vector_codec
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(3, 512)).astype(np.float32)
+
+
+def test_float32_round_trip_is_exact(vectors):
+    data = vector_codec.encode(vectors)
+
+    assert len(data) == vector_codec.HEADER.size + 3 * 512 * 4
+    decoded = vector_codec.decode(data)
+    assert decoded.dtype == np.float32
+    assert np.array_equal(decoded, vectors)
+
+
+def test_float16_halves_payload(vectors):
+    data = vector_codec.encode(vectors, "float16")
+
+    assert len(data) == vector_codec.HEADER.size + 3 * 512 * 2
+    decoded = vector_codec.decode(data)
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, vectors, atol=1e-2)
+    assert vector_codec.decode(data, as_float32=False).dtype == np.float16
+
+
+def test_single_vector_and_empty_list(vectors):
+    assert vector_codec.decode(vector_codec.encode(vectors[0].tolist())).shape == (1, 512)
+    assert vector_codec.decode(vector_codec.encode([])).shape == (0, 0)
+
+
+@pytest.mark.parametrize("data", [b"", b"VEC", b"JSON" + b"\x00" * 20])
+def test_rejects_malformed_payloads(data):
+    with pytest.raises(vector_codec.CodecError):
+        vector_codec.decode(data)
+
+
+def test_rejects_length_mismatch(vectors):
+    with pytest.raises(vector_codec.CodecError):
+        vector_codec.decode(vector_codec.encode(vectors)[:-4])